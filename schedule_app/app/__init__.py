@@ -118,6 +118,9 @@ def create_app(config=None):
         # outlook integration optional
         pass
 
+    # session listeners that queue local event edits for outbound calendar sync
+    from .integrations import outbound  # noqa: F401
+
     app.register_blueprint(auth_bp)
     app.register_blueprint(events_bp)
     app.register_blueprint(org_bp)
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from flask import Blueprint, jsonify, request, abort
+import os
+from flask import Blueprint, current_app, jsonify, request, abort
 from flask_login import login_required, current_user
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from ..auth.permissions import role_required
 from ..models import Event
 from .. import db
 from ..models import Reaction, Retro, Task
+from ..reminders import generate_reminders, parse_offsets
 from sqlalchemy import func
 
 api_bp = Blueprint("api_v1", __name__)
@@ -172,6 +175,11 @@ def create_event():
 
     if end_at <= start_at:
         abort(400, "終了時刻は開始時刻より後にしてください")
+    # 他の経路と同じく naive UTC で保存する（リマインダー生成も naive UTC で比較する）
+    if start_at.tzinfo is not None:
+        start_at = start_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_at.tzinfo is not None:
+        end_at = end_at.astimezone(timezone.utc).replace(tzinfo=None)
 
     # 型チェッカ（pylance）が SQLAlchemy モデルの __init__ シグネチャを
     # 正しく推論できないことがあるため、明示的に属性を代入する。
@@ -183,5 +191,56 @@ def create_event():
     event.end_at = end_at
     event.color = data.get("color", "#4287f5")
     db.session.add(event)
+    db.session.flush()
+    generate_reminders(event)
     db.session.commit()
     return jsonify({"id": event.id}), 201
+
+
+@api_bp.route("/me/reminder-offsets", methods=["GET"])
+@login_required
+def get_reminder_offsets():
+    """The current user's default reminder offsets (minutes), used when an event sets none."""
+    return jsonify({"offsets": parse_offsets(current_user.default_reminder_offsets)})
+
+
+@api_bp.route("/me/reminder-offsets", methods=["PUT"])
+@login_required
+def set_reminder_offsets():
+    """Set the current user's default offsets; an empty list falls back to the site default.
+
+    Applies to reminders generated from now on (new events, accepted invites, series horizon).
+    """
+    data = request.get_json() or {}
+    raw = data.get("offsets")
+    if isinstance(raw, list):
+        raw = ",".join(str(v) for v in raw)
+    if raw is None or not isinstance(raw, str):
+        abort(400, "offsets が必要です")
+    offsets = parse_offsets(raw)
+    if raw.strip() and not offsets:
+        abort(400, "offsets が不正です")
+    current_user.default_reminder_offsets = ",".join(str(m) for m in offsets) or None
+    db.session.commit()
+    return jsonify({"offsets": offsets})
+
+
+@api_bp.route("/jobs/stats", methods=["GET"])
+@role_required("admin")
+def job_stats():
+    """Per-job run counts and p50/p95 durations from job_runs (read-only, admins only)."""
+    from ..job_runs import job_run_stats
+
+    max_hours = 24 * int(current_app.config.get("JOB_RUNS_RETENTION_DAYS", 14))
+    hours = min(max(request.args.get("hours", 24, type=int) or 24, 1), max_hours)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return jsonify({"since": since.isoformat() + "Z", "hours": hours, "jobs": job_run_stats(since)})
+
+
+@api_bp.route("/http/stats", methods=["GET"])
+@role_required("admin")
+def http_stats():
+    """Per-host outbound HTTP counters for this process (see utils/http_client.py)."""
+    from ..utils.http_client import host_metrics
+
+    return jsonify({"pid": os.getpid(), "hosts": host_metrics()})
@@ -7,10 +7,12 @@ from ..forms import RegisterForm, LoginForm
 from ..forms import RegisterForm, LoginForm, ResetPasswordForm, ResendConfirmationForm
 from ..forms import ResetUsernameForm
 from typing import cast
-import smtplib
 from email.message import EmailMessage
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import requests
+from ..utils import http_client
+from ..utils.mail_transport import get_smtp_pool
+from ..outbox import enqueue_email
 from datetime import datetime, timedelta
 from ..forms import ResendConfirmationForm
 from flask import session
@@ -41,14 +43,16 @@ def forgot_password():
             text = f'以下のリンクからパスワードを再設定してください:\n\n{reset_url}\n\nこのリンクは1時間で無効になります。'
             html = render_template('emails/reset_password.html', reset_url=reset_url, user=user)
             try:
-                send_email(subject, str(user.email), text, html=html)
-                flash('パスワード再設定の案内を送信しました。受信トレイを確認してください。', 'success')
+                enqueue_email(subject, str(user.email), text, html=html, kind='password_reset')
+                db.session.commit()
+                flash('パスワード再設定の案内メールの送信を受け付けました。数分以内に届きます。受信トレイを確認してください。', 'success')
             except Exception:
-                current_app.logger.exception('Failed to send password reset email')
+                db.session.rollback()
+                current_app.logger.exception('Failed to queue password reset email')
                 flash('メール送信に失敗しました。管理者に連絡してください。', 'error')
         else:
             # Do not reveal whether email exists
-            flash('パスワード再設定の案内を送信しました。受信トレイを確認してください。', 'success')
+            flash('パスワード再設定の案内メールの送信を受け付けました。数分以内に届きます。受信トレイを確認してください。', 'success')
         return redirect(url_for('auth.login'))
     return render_template('auth/forgot_password.html', form=form)
 
@@ -95,7 +99,7 @@ def send_email(subject: str, recipient: str, body: str, html: str | None = None)
             }
             if html:
                 payload["html"] = html
-            resp = requests.post(
+            resp = http_client.post(
                 "https://api.resend.com/emails",
                 headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
                 json=payload,
@@ -118,17 +122,8 @@ def send_email(subject: str, recipient: str, body: str, html: str | None = None)
     if html:
         msg.add_alternative(html, subtype="html")
     try:
-        mail_server: str = str(current_app.config.get("MAIL_SERVER"))
-        mail_port: int = int(current_app.config.get("MAIL_PORT") or 0)
-        server = smtplib.SMTP(mail_server, mail_port)
-        if bool(current_app.config.get("MAIL_USE_TLS")):
-            server.starttls()
-        username = str(current_app.config.get("MAIL_USERNAME") or "")
-        password = str(current_app.config.get("MAIL_PASSWORD") or "")
-        if username and password:
-            server.login(username, password)
-        server.send_message(msg)
-        server.quit()
+        # Pooled per-process connection: avoids a TCP/TLS handshake and AUTH per message
+        get_smtp_pool(current_app.config).send_message(msg)
         return True
     except Exception as e:
         current_app.logger.exception("Failed to send email via SMTP fallback")
@@ -148,14 +143,17 @@ def register():
                 confirm_url = url_for("auth.confirm_email", token=token, _external=True)
                 subject = "[Schedule Manager] メールアドレス確認 (再送)"
                 body = f"以下のリンクをクリックして本登録を完了してください:\n\n{confirm_url}\n\nこのリンクは1時間で無効になります。"
-                if send_email(subject, str(existing.email), body):
-                    flash("確認メールを再送しました。受信トレイを確認してください。", "success")
-                else:
+                try:
+                    enqueue_email(subject, str(existing.email), body, kind='confirm_email')
+                    db.session.commit()
+                    flash("確認メールの再送を受け付けました。数分以内に届きます。受信トレイを確認してください。", "success")
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    current_app.logger.exception("Failed to queue confirmation email")
                     flash("確認メールの送信に失敗しました。管理者に連絡してください。", "error")
                 return render_template("auth/register.html", form=form)
             flash("ユーザー名またはメールアドレスは既に使用されています。", "warning")
             return render_template("auth/register.html", form=form)
-        # Create user object in memory but do NOT persist until email is sent successfully
         user = User()
         user.username = form.username.data
         user.email = form.email.data
@@ -168,22 +166,19 @@ def register():
         confirm_url = url_for("auth.confirm_email", token=token, _external=True)
         subject = "[Schedule Manager] メールアドレス確認"
         body = f"以下のリンクをクリックして本登録を完了してください:\n\n{confirm_url}\n\nこのリンクは1時間で無効になります。"
-        # Try sending email first. If it fails, do not persist the user.
-        if not send_email(subject, str(user.email), body):
-            flash("確認メールの送信に失敗しました。管理者に連絡してください。", "error")
-            return render_template("auth/register.html", form=form)
-
-        # Email sent successfully — now persist the user. Handle race conditions on unique constraints.
+        # Persist the user and queue the confirmation email in one transaction: the outbox
+        # worker sends it, and nothing is queued if the insert loses a unique-constraint race.
         try:
             db.session.add(user)
+            enqueue_email(subject, str(user.email), body, kind='confirm_email')
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
-            current_app.logger.exception("User commit failed after email sent — possible race on unique constraint")
+            current_app.logger.exception("User commit failed — possible race on unique constraint")
             flash("ユーザー名またはメールアドレスは既に使用されています。再度試してください。", "warning")
             return render_template("auth/register.html", form=form)
 
-        flash("確認メールを送信しました。受信トレイを確認してください。", "success")
+        flash("確認メールの送信を受け付けました。数分以内に届きます。受信トレイを確認してください。", "success")
         return redirect(url_for("auth.login"))
     return render_template("auth/register.html", form=form)
 
@@ -234,13 +229,16 @@ def resend_confirmation():
         confirm_url = url_for("auth.confirm_email", token=token, _external=True)
         subject = "[Schedule Manager] メールアドレス確認 (再送)"
         body = f"以下のリンクをクリックして本登録を完了してください:\n\n{confirm_url}\n\nこのリンクは1時間で無効になります。"
-        if send_email(subject, str(user.email), body):
+        try:
+            enqueue_email(subject, str(user.email), body, kind='confirm_email')
             user.last_confirmation_sent_at = db.func.now()
             db.session.add(user)
             db.session.commit()
-            flash("確認メールを再送しました。受信トレイを確認してください。", "success")
+            flash("確認メールの再送を受け付けました。数分以内に届きます。受信トレイを確認してください。", "success")
             return redirect(url_for("auth.login"))
-        else:
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.exception("Failed to queue confirmation email")
             flash("確認メールの送信に失敗しました。管理者に連絡してください。", "error")
     return render_template("auth/resend_confirmation.html", form=form)
 
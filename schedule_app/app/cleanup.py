@@ -0,0 +1,169 @@
+"""Batched, resumable purge of old events and everything that hangs off them.
+
+`purge_old_events` walks events that ended before the retention cutoff in
+primary-key order, CLEANUP_BATCH_SIZE at a time. Each batch is one short
+transaction that deletes the events' child rows explicitly (see CHILD_TABLES),
+then the events, and advances the `job_checkpoints` row for the purge. A run
+that is interrupted resumes after the last committed batch with the same
+cutoff. With CLEANUP_ARCHIVE_DIR set, every batch is written to a gzip JSONL
+file (one `{"table": ..., "row": ...}` object per line) before it is deleted.
+
+Recurring series are never purged by end date: their first occurrence's end
+says nothing about when the series stops. Attachment files on disk are left in
+place; the archived attachment rows keep their storage paths.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import delete, or_, select, update
+
+from . import db
+from .models import (
+    Attachment,
+    Event,
+    EventComment,
+    EventParticipant,
+    ExternalEventMapping,
+    JobCheckpoint,
+    Notification,
+    Reaction,
+    Retro,
+    Task,
+)
+from .utils.pg_lock import current_lease
+
+CHECKPOINT_NAME = "cleanup_old_events"
+
+# (model, action) for every table with a foreign key to events.id. Tasks belong to
+# their user and only reference an event optionally, so they are detached, not deleted.
+CHILD_TABLES = [
+    (EventComment, "delete"),
+    (Attachment, "delete"),
+    (Notification, "delete"),
+    (Reaction, "delete"),
+    (ExternalEventMapping, "delete"),
+    (EventParticipant, "delete"),
+    (Retro, "delete"),
+    (Task, "detach"),
+]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _archive_batch(archive_dir: str, cutoff: datetime, event_ids: list[int]) -> str:
+    """Write the batch's events and child rows to a gzip JSONL file and return its path.
+
+    The file name only depends on the run's cutoff and the batch's id range, so a
+    batch that is retried after a crash overwrites its own partial file.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    name = f"events-{cutoff:%Y%m%d}-{event_ids[0]}-{event_ids[-1]}.jsonl.gz"
+    path = os.path.join(archive_dir, name)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        for model, _ in [(Event, None)] + CHILD_TABLES:
+            table = model.__table__
+            key = table.c.id if model is Event else table.c.event_id
+            for row in db.session.execute(select(table).where(key.in_(event_ids))).mappings():
+                fh.write(json.dumps({"table": table.name, "row": dict(row)}, default=_json_default, ensure_ascii=False))
+                fh.write("\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def delete_events(event_ids: list[int]) -> None:
+    """Delete events and their child rows (see CHILD_TABLES) in the current transaction."""
+    for model, action in CHILD_TABLES:
+        col = model.__table__.c.event_id
+        if action == "detach":
+            db.session.execute(update(model.__table__).where(col.in_(event_ids)).values(event_id=None))
+            continue
+        if model is EventComment:
+            # replies first so the self-referencing parent_id never points at a deleted row
+            db.session.execute(
+                delete(model.__table__).where(col.in_(event_ids), model.__table__.c.parent_id.isnot(None))
+            )
+        db.session.execute(delete(model.__table__).where(col.in_(event_ids)))
+    db.session.execute(delete(Event.__table__).where(Event.__table__.c.id.in_(event_ids)))
+
+
+def _checkpoint(now: datetime) -> JobCheckpoint:
+    cp = db.session.get(JobCheckpoint, CHECKPOINT_NAME)
+    retention = int(current_app.config.get("EVENT_RETENTION_DAYS", 730))
+    if cp is None:
+        cp = JobCheckpoint(name=CHECKPOINT_NAME)
+        db.session.add(cp)
+    elif cp.finished_at is None and cp.cutoff is not None:
+        current_app.logger.info("cleanup_old_events: resuming after event id %s (cutoff %s)", cp.cursor, cp.cutoff)
+        return cp
+    cp.cursor = 0
+    cp.cutoff = now - timedelta(days=retention)
+    cp.rows_processed = 0
+    cp.started_at = now
+    cp.finished_at = None
+    db.session.commit()
+    return cp
+
+
+def purge_old_events(now: Optional[datetime] = None, max_batches: Optional[int] = None) -> int:
+    """Delete events that ended before the retention cutoff, in batches. Returns events deleted.
+
+    `max_batches` stops early (leaving the checkpoint open) so a run can be bounded.
+    """
+    now = now or datetime.utcnow()
+    batch_size = int(current_app.config.get("CLEANUP_BATCH_SIZE", 500))
+    throttle = float(current_app.config.get("CLEANUP_THROTTLE_SECONDS", 0.5))
+    archive_dir = current_app.config.get("CLEANUP_ARCHIVE_DIR") or ""
+    cp = _checkpoint(now)
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        event_ids = list(
+            db.session.execute(
+                select(Event.id)
+                .where(
+                    Event.id > cp.cursor,
+                    Event.end_at < cp.cutoff,
+                    or_(Event.rrule == None, Event.rrule == ""),  # noqa: E711
+                )
+                .order_by(Event.id)
+                .limit(batch_size)
+            ).scalars()
+        )
+        if not event_ids:
+            cp.finished_at = datetime.utcnow()
+            db.session.commit()
+            break
+        if archive_dir:
+            _archive_batch(archive_dir, cp.cutoff, event_ids)
+        delete_events(event_ids)
+        cp.cursor = event_ids[-1]
+        cp.rows_processed += len(event_ids)
+        lease = current_lease()
+        if lease is not None:
+            # a run whose job lease was taken over must not commit over the new holder
+            lease.assert_held()
+        # the deletes and the checkpoint move commit together
+        db.session.commit()
+        db.session.expire_all()
+        deleted += len(event_ids)
+        batches += 1
+        current_app.logger.info("cleanup_old_events: deleted %s event(s) up to id %s", len(event_ids), cp.cursor)
+        if len(event_ids) < batch_size:
+            continue
+        if throttle > 0:
+            time.sleep(throttle)
+    return deleted
@@ -14,7 +14,9 @@ def scheduler_cli():
 def run_scheduler():
     """Run the dedicated scheduler process. Use in production as separate container or systemd service."""
     # Import lazily to avoid importing APScheduler at Flask startup when not needed
-    from .scheduler import run
+    from .scheduler import run, set_app
 
     current_app.logger.info("Starting scheduler via CLI")
+    # jobs reuse the CLI's app instead of building a second one
+    set_app(current_app._get_current_object())  # type: ignore[attr-defined]
     run()
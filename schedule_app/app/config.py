@@ -29,6 +29,12 @@ class Config:
     MAIL_USERNAME: Final[str] = os.getenv("MAIL_USERNAME", "")
     MAIL_PASSWORD: Final[str] = os.getenv("MAIL_PASSWORD", "")
     MAIL_DEFAULT_SENDER: Final[str] = os.getenv("MAIL_DEFAULT_SENDER", "no-reply@aivis-chan-bot.com")
+    # SMTP connection pool (per process): open connections, messages sent before a connection is
+    # recycled, idle seconds after which a connection is NOOP-checked before reuse, socket timeout.
+    MAIL_POOL_SIZE: Final[int] = int(os.getenv("MAIL_POOL_SIZE", "4"))
+    MAIL_MAX_MESSAGES_PER_CONNECTION: Final[int] = int(os.getenv("MAIL_MAX_MESSAGES_PER_CONNECTION", "100"))
+    MAIL_POOL_HEALTH_CHECK_SECONDS: Final[int] = int(os.getenv("MAIL_POOL_HEALTH_CHECK_SECONDS", "30"))
+    MAIL_TIMEOUT: Final[int] = int(os.getenv("MAIL_TIMEOUT", "10"))
     # Which email provider to use. Set to 'resend' to use Resend API (preferred), or 'smtp' to use SMTP.
     EMAIL_PROVIDER: Final[str] = os.getenv("EMAIL_PROVIDER", "smtp")
     # API key for Resend (when EMAIL_PROVIDER=resend). Kept empty by default so deployments without the key
@@ -43,3 +49,104 @@ class Config:
     WTF_CSRF_TIME_LIMIT: Final[int] = int(os.getenv("WTF_CSRF_TIME_LIMIT", "86400"))
     # Optional separate secret for CSRF signing. If not provided, SECRET_KEY is used.
     WTF_CSRF_SECRET_KEY: Final[str] = os.getenv("WTF_CSRF_SECRET_KEY", SECRET_KEY)
+    # Notification queue: rows claimed per worker batch and how long a claim is held before
+    # another worker may reclaim it (e.g. after the claiming process crashed mid-batch).
+    NOTIFICATION_BATCH_SIZE: Final[int] = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+    NOTIFICATION_LEASE_SECONDS: Final[int] = int(os.getenv("NOTIFICATION_LEASE_SECONDS", "300"))
+    # Delivery stage: worker threads used to send reminders, per-provider concurrency caps
+    # ("provider=limit" pairs) and how many delivery outcomes are written per commit.
+    NOTIFICATION_DELIVERY_WORKERS: Final[int] = int(os.getenv("NOTIFICATION_DELIVERY_WORKERS", "8"))
+    NOTIFICATION_PROVIDER_CONCURRENCY: Final[str] = os.getenv("NOTIFICATION_PROVIDER_CONCURRENCY", "smtp=4,resend=8")
+    NOTIFICATION_COMMIT_BATCH: Final[int] = int(os.getenv("NOTIFICATION_COMMIT_BATCH", "50"))
+    # Email outbox worker: rows per drain, claim lease, attempts before dead-lettering and
+    # exponential backoff bounds (seconds) between attempts.
+    EMAIL_OUTBOX_BATCH_SIZE: Final[int] = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "100"))
+    EMAIL_OUTBOX_LEASE_SECONDS: Final[int] = int(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", "300"))
+    EMAIL_OUTBOX_MAX_ATTEMPTS: Final[int] = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+    EMAIL_OUTBOX_BACKOFF_BASE: Final[int] = int(os.getenv("EMAIL_OUTBOX_BACKOFF_BASE", "30"))
+    EMAIL_OUTBOX_BACKOFF_MAX: Final[int] = int(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))
+    # Reminders: default offsets (minutes before start, CSV) when neither the event nor the user
+    # sets any, and how far ahead notification rows are generated for recurring series.
+    DEFAULT_REMINDER_OFFSETS: Final[str] = os.getenv("DEFAULT_REMINDER_OFFSETS", "10")
+    REMINDER_HORIZON_DAYS: Final[int] = int(os.getenv("REMINDER_HORIZON_DAYS", "14"))
+    # Reminder digests: when > 0, a user with a due reminder receives one email covering all
+    # of their reminders due within the next N minutes. 0 sends each reminder separately.
+    REMINDER_DIGEST_WINDOW_MINUTES: Final[int] = int(os.getenv("REMINDER_DIGEST_WINDOW_MINUTES", "0"))
+    # Reminder retries: attempts before a notification is marked 'failed' and the exponential
+    # backoff bounds (seconds) between attempts.
+    NOTIFICATION_MAX_ATTEMPTS: Final[int] = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+    NOTIFICATION_BACKOFF_BASE: Final[int] = int(os.getenv("NOTIFICATION_BACKOFF_BASE", "60"))
+    NOTIFICATION_BACKOFF_MAX: Final[int] = int(os.getenv("NOTIFICATION_BACKOFF_MAX", "21600"))
+    # Timing-wheel dispatcher in the scheduler process: how many minutes of pending reminders are
+    # held in memory (refilled from the DB as the horizon approaches) and the wheel's tick length.
+    REMINDER_DISPATCHER_ENABLED: Final[bool] = os.getenv("REMINDER_DISPATCHER_ENABLED", "True") == "True"
+    REMINDER_WHEEL_HORIZON_MINUTES: Final[int] = int(os.getenv("REMINDER_WHEEL_HORIZON_MINUTES", "10"))
+    REMINDER_WHEEL_TICK_SECONDS: Final[float] = float(os.getenv("REMINDER_WHEEL_TICK_SECONDS", "1"))
+    # Overdue reminders (e.g. after an outage) are put on the wheel this many at a time, oldest first.
+    REMINDER_WHEEL_OVERDUE_BATCH: Final[int] = int(os.getenv("REMINDER_WHEEL_OVERDUE_BATCH", "500"))
+    # Job run telemetry (job_runs table): buffered rows are written once FLUSH_SIZE runs are
+    # queued or the oldest is FLUSH_SECONDS old; raw rows older than RETENTION_DAYS are folded
+    # into daily rollups, which are kept for ROLLUP_RETENTION_DAYS.
+    JOB_RUNS_ENABLED: Final[bool] = os.getenv("JOB_RUNS_ENABLED", "True") == "True"
+    JOB_RUNS_FLUSH_SIZE: Final[int] = int(os.getenv("JOB_RUNS_FLUSH_SIZE", "20"))
+    JOB_RUNS_FLUSH_SECONDS: Final[int] = int(os.getenv("JOB_RUNS_FLUSH_SECONDS", "60"))
+    JOB_RUNS_RETENTION_DAYS: Final[int] = int(os.getenv("JOB_RUNS_RETENTION_DAYS", "14"))
+    JOB_RUNS_ROLLUP_RETENTION_DAYS: Final[int] = int(os.getenv("JOB_RUNS_ROLLUP_RETENTION_DAYS", "365"))
+    # Old event purge: events that ended more than EVENT_RETENTION_DAYS ago are deleted with their
+    # child rows in primary-key batches, sleeping THROTTLE seconds between batches. When
+    # CLEANUP_ARCHIVE_DIR is set, each batch is first written there as gzip-compressed JSONL.
+    EVENT_RETENTION_DAYS: Final[int] = int(os.getenv("EVENT_RETENTION_DAYS", "730"))
+    CLEANUP_BATCH_SIZE: Final[int] = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+    CLEANUP_THROTTLE_SECONDS: Final[float] = float(os.getenv("CLEANUP_THROTTLE_SECONDS", "0.5"))
+    CLEANUP_ARCHIVE_DIR: Final[str] = os.getenv("CLEANUP_ARCHIVE_DIR", "")
+    # Scheduler leader election: every scheduler replica competes for one lease row; the holder
+    # renews it every HEARTBEAT seconds and a standby takes over once it is TTL seconds stale.
+    SCHEDULER_LEASE_NAME: Final[str] = os.getenv("SCHEDULER_LEASE_NAME", "scheduler-leader")
+    SCHEDULER_LEASE_TTL_SECONDS: Final[int] = int(os.getenv("SCHEDULER_LEASE_TTL_SECONDS", "15"))
+    SCHEDULER_HEARTBEAT_SECONDS: Final[int] = int(os.getenv("SCHEDULER_HEARTBEAT_SECONDS", "5"))
+    # Whole-job locks (pg_lock.job_lock / single_instance): 'advisory' (default) uses Postgres advisory
+    # locks; 'lease' uses a leases row with a TTL, heartbeat renewal and fencing tokens (works on SQLite too).
+    JOB_LOCK_BACKEND: Final[str] = os.getenv("JOB_LOCK_BACKEND", "advisory")
+    JOB_LOCK_TTL_SECONDS: Final[int] = int(os.getenv("JOB_LOCK_TTL_SECONDS", "60"))
+    # External token refresh: tokens expiring within LEEWAY seconds are refreshed. Accounts are
+    # split into SHARD_COUNT slices (id mod N) so N workers can each refresh one; SHARD_INDEX
+    # defaults to the ordinal suffix of HOSTNAME (e.g. "refresher-2").
+    REFRESH_LEEWAY_SECONDS: Final[int] = int(os.getenv("REFRESH_LEEWAY_SECONDS", "300"))
+    REFRESH_BATCH_SIZE: Final[int] = int(os.getenv("REFRESH_BATCH_SIZE", "200"))
+    REFRESH_SHARD_COUNT: Final[int] = int(os.getenv("REFRESH_SHARD_COUNT", "1"))
+    REFRESH_SHARD_INDEX: Final[str] = os.getenv("REFRESH_SHARD_INDEX", "")
+    # Seconds a decrypted access token is cached in-process (integrations/tokens.py); 0 disables
+    TOKEN_CACHE_SECONDS: Final[int] = int(os.getenv("TOKEN_CACHE_SECONDS", "60"))
+    # Calendar imports: events requested per provider page, and events applied per commit
+    INTEGRATIONS_PAGE_SIZE: Final[int] = int(os.getenv("INTEGRATIONS_PAGE_SIZE", "250"))
+    INTEGRATIONS_SYNC_CHUNK_SIZE: Final[int] = int(os.getenv("INTEGRATIONS_SYNC_CHUNK_SIZE", "200"))
+    # Outlook: re-baseline the calendarView delta round once its window ends within this many days
+    OUTLOOK_DELTA_RENEW_DAYS: Final[int] = int(os.getenv("OUTLOOK_DELTA_RENEW_DAYS", "30"))
+    # Shared outbound HTTP client (utils/http_client.py): default timeouts, retries with
+    # exponential backoff for idempotent calls, and keep-alive pool sizes
+    HTTP_CONNECT_TIMEOUT: Final[float] = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT: Final[float] = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+    HTTP_MAX_RETRIES: Final[int] = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    HTTP_RETRY_BACKOFF: Final[float] = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+    HTTP_POOL_HOSTS: Final[int] = int(os.getenv("HTTP_POOL_HOSTS", "10"))
+    HTTP_POOL_MAXSIZE: Final[int] = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+    # Provider API base URLs (override to point imports at a proxy or a local fake)
+    GOOGLE_CALENDAR_API_URL: Final[str] = os.getenv("GOOGLE_CALENDAR_API_URL", "https://www.googleapis.com/calendar/v3")
+    MS_GRAPH_API_URL: Final[str] = os.getenv("MS_GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
+    GOOGLE_BATCH_URL: Final[str] = os.getenv("GOOGLE_BATCH_URL", "https://www.googleapis.com/batch/calendar/v3")
+    # Sync worker (sync_external_accounts): concurrent syncs per provider, retries of a
+    # rate-limited account, and the backoff used when Retry-After is missing / its cap
+    SYNC_WORKER_CONCURRENCY: Final[int] = int(os.getenv("SYNC_WORKER_CONCURRENCY", "4"))
+    SYNC_WORKER_MAX_RETRIES: Final[int] = int(os.getenv("SYNC_WORKER_MAX_RETRIES", "3"))
+    SYNC_WORKER_DEFAULT_RETRY_AFTER: Final[int] = int(os.getenv("SYNC_WORKER_DEFAULT_RETRY_AFTER", "30"))
+    SYNC_WORKER_MAX_RETRY_AFTER: Final[int] = int(os.getenv("SYNC_WORKER_MAX_RETRY_AFTER", "300"))
+    # Outbound sync (push_external_changes): queue local event edits and push them to the
+    # owner's connected calendars; operations per provider batch call (Graph allows 20)
+    OUTBOUND_SYNC_ENABLED: Final[bool] = os.getenv("OUTBOUND_SYNC_ENABLED", "1").lower() in ("1", "true", "yes")
+    OUTBOUND_BATCH_SIZE: Final[int] = int(os.getenv("OUTBOUND_BATCH_SIZE", "200"))
+    OUTBOUND_LEASE_SECONDS: Final[int] = int(os.getenv("OUTBOUND_LEASE_SECONDS", "300"))
+    OUTBOUND_MAX_ATTEMPTS: Final[int] = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "8"))
+    OUTBOUND_BACKOFF_BASE: Final[int] = int(os.getenv("OUTBOUND_BACKOFF_BASE", "60"))
+    OUTBOUND_BACKOFF_MAX: Final[int] = int(os.getenv("OUTBOUND_BACKOFF_MAX", "3600"))
+    GOOGLE_PUSH_BATCH_SIZE: Final[int] = int(os.getenv("GOOGLE_PUSH_BATCH_SIZE", "50"))
+    OUTLOOK_PUSH_BATCH_SIZE: Final[int] = int(os.getenv("OUTLOOK_PUSH_BATCH_SIZE", "20"))
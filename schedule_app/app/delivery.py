@@ -0,0 +1,190 @@
+"""Concurrent delivery stage for outgoing notification messages.
+
+Messages are rendered by the caller (in the thread that owns the DB session) and
+handed to a `DeliveryPool`, which sends them from a bounded thread pool. Each
+provider (e.g. 'smtp', 'resend') has its own concurrency limit so a slow or
+rate-limited provider can't monopolise the workers: its excess messages wait
+in a per-provider queue rather than in a worker thread. Worker threads never touch
+the database; they only call the send function and report results back.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from flask import Flask, current_app
+
+
+@dataclass
+class OutgoingMessage:
+    recipient: str
+    subject: str
+    body: str
+    html: Optional[str] = None
+    provider: str = "smtp"
+    # Queue rows (notifications, outbox entries) this message covers; written back by the caller
+    row_ids: list[int] = field(default_factory=list)
+
+
+@dataclass
+class DeliveryResult:
+    message: OutgoingMessage
+    ok: bool
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+class DeliveryStats:
+    """Thread-safe counters describing delivery throughput for this process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.per_provider: dict[str, dict[str, int]] = {}
+
+    def record_batch(self, results: list[DeliveryResult], wall_seconds: float) -> None:
+        with self._lock:
+            self.batches += 1
+            self.busy_seconds += wall_seconds
+            for r in results:
+                counters = self.per_provider.setdefault(r.message.provider, {"sent": 0, "failed": 0})
+                if r.ok:
+                    self.sent += 1
+                    counters["sent"] += 1
+                else:
+                    self.failed += 1
+                    counters["failed"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.sent + self.failed
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "batches": self.batches,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "messages_per_second": round(total / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+                "per_provider": {k: dict(v) for k, v in self.per_provider.items()},
+            }
+
+
+def parse_provider_limits(raw: str | dict | None) -> dict[str, int]:
+    """Parse 'smtp=4,resend=8' (or an already-built dict) into provider -> limit."""
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return {str(k): int(v) for k, v in raw.items()}
+    limits: dict[str, int] = {}
+    for part in str(raw).split(","):
+        if "=" not in part:
+            continue
+        name, value = part.split("=", 1)
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            continue
+    return limits
+
+
+class DeliveryPool:
+    """Bounded thread pool that sends `OutgoingMessage`s with per-provider limits.
+
+    Limits are applied at submit time: each provider has its own queue and only
+    as many of its messages as its limit allows are handed to the executor, the
+    next one being submitted when one finishes. A saturated provider therefore
+    waits in its queue instead of parking pool workers, and the other providers
+    keep getting threads.
+    """
+
+    def __init__(self, max_workers: int = 8, provider_limits: Optional[dict[str, int]] = None) -> None:
+        self.max_workers = max(1, int(max_workers))
+        self.provider_limits = provider_limits or {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="delivery")
+        # provider -> waiting (app, send, msg, future) and number of its messages in the executor
+        self._queues: dict[str, deque] = {}
+        self._active: dict[str, int] = {}
+        self._queue_lock = threading.Lock()
+        self.stats = DeliveryStats()
+
+    def _limit(self, provider: str) -> int:
+        return max(1, min(self.provider_limits.get(provider, self.max_workers), self.max_workers))
+
+    def _pump(self, provider: str) -> None:
+        """Submit queued messages of `provider` while it has free permits."""
+        with self._queue_lock:
+            queue = self._queues.get(provider)
+            while queue and self._active.get(provider, 0) < self._limit(provider):
+                item = queue.popleft()
+                try:
+                    self._executor.submit(self._run, provider, *item)
+                except RuntimeError:  # executor shut down
+                    item[3].set_result(DeliveryResult(item[2], False, "delivery pool shut down"))
+                    continue
+                self._active[provider] = self._active.get(provider, 0) + 1
+
+    def _run(self, provider: str, app: Flask, send: Callable[[OutgoingMessage], bool], msg: OutgoingMessage, future: Future) -> None:
+        try:
+            future.set_result(self._send_one(app, send, msg))
+        finally:
+            with self._queue_lock:
+                self._active[provider] -= 1
+            self._pump(provider)
+
+    def _send_one(self, app: Flask, send: Callable[[OutgoingMessage], bool], msg: OutgoingMessage) -> DeliveryResult:
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                ok = bool(send(msg))
+            return DeliveryResult(msg, ok, None if ok else "send returned False", time.monotonic() - started)
+        except Exception as e:
+            return DeliveryResult(msg, False, f"{type(e).__name__}: {e}", time.monotonic() - started)
+
+    def deliver(self, messages: list[OutgoingMessage], send: Callable[[OutgoingMessage], bool]) -> list[DeliveryResult]:
+        """Send all messages concurrently and return results in input order."""
+        if not messages:
+            return []
+        app = current_app._get_current_object()  # type: ignore[attr-defined]
+        started = time.monotonic()
+        futures: list[Future] = []
+        with self._queue_lock:
+            for m in messages:
+                future: Future = Future()
+                self._queues.setdefault(m.provider, deque()).append((app, send, m, future))
+                futures.append(future)
+        for provider in {m.provider for m in messages}:
+            self._pump(provider)
+        results = [f.result() for f in futures]
+        self.stats.record_batch(results, time.monotonic() - started)
+        return results
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_pool_lock = threading.Lock()
+
+
+def get_delivery_pool(app: Optional[Flask] = None) -> DeliveryPool:
+    """Return the per-app delivery pool, creating it from config on first use."""
+    app = app or current_app._get_current_object()  # type: ignore[attr-defined]
+    with _pool_lock:
+        pool = app.extensions.get("delivery_pool")
+        if pool is None:
+            pool = DeliveryPool(
+                max_workers=int(app.config.get("NOTIFICATION_DELIVERY_WORKERS", 8)),
+                provider_limits=parse_provider_limits(app.config.get("NOTIFICATION_PROVIDER_CONCURRENCY", "smtp=4,resend=8")),
+            )
+            app.extensions["delivery_pool"] = pool
+    return pool
+
+
+def backoff_seconds(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff for the `attempts`-th failure: base, 2*base, 4*base, ... capped."""
+    return float(min(cap, base * (2 ** max(0, attempts - 1))))
@@ -45,7 +45,8 @@ import os
 from ..models import EventParticipant, EventComment, Attachment
 from itsdangerous import URLSafeTimedSerializer
 from flask import session
-from ..auth.routes import send_email
+from ..outbox import enqueue_email
+from ..reminders import generate_reminders, replace_event_reminders, sync_participant_reminders
 
 
 def user_is_org_admin(user: User, org: Organization) -> bool:
@@ -304,9 +305,12 @@ def create_event():
             timezone=form.timezone.data,
             color=form.color.data,
             organization_id=org_id,
+            reminder_offsets=(form.reminders.data or "").strip() or None,
         )
         try:
             db.session.add(event)
+            db.session.flush()
+            generate_reminders(event)
             db.session.commit()
             flash("イベントを作成しました。", "success")
             return redirect(url_for("events.list_events") + (f"?org_id={org_id}" if org_id else ""))
@@ -338,32 +342,27 @@ def invite_participant(event_id: int):
 
     # create participant record
     p = EventParticipant(event_id=event.id, email=email, role=role, status="pending")
-    db.session.add(p)
-    db.session.commit()
-
-    # generate token for invitation acceptance
-    serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
-    token = serializer.dumps({"participant_id": p.id, "event_id": event.id}, salt=current_app.config.get("SECURITY_PASSWORD_SALT"))
-    accept_url = url_for("events.accept_invite", token=token, _external=True)
-    subject = f"[{current_app.config.get('APP_NAME','Schedule Manager')}] イベント招待: {event.title}"
-    # Render templates
-    text_body = render_template("emails/invite.txt", inviter_name=current_user_obj.username, recipient_name=None, event=event, accept_url=accept_url)
-    html_body = render_template("emails/invite.html", inviter_name=current_user_obj.username, recipient_name=None, event=event, accept_url=accept_url)
-    # send email (best-effort)
     try:
-        sent = send_email(subject, str(email), text_body, html=html_body)
-        if sent:
-            flash(f"招待メールを {email} に送信しました。", "success")
-            return jsonify({"id": p.id, "email": p.email, "status": p.status}), 201
-        else:
-            current_app.logger.error("Failed to send invite email to %s", email)
-            flash("招待メールの送信に失敗しました。後で再試行してください。", "error")
-            return jsonify({"id": p.id, "email": p.email, "status": p.status, "warning": "mail_failed"}), 202
-    except Exception:
-        current_app.logger.exception("Error while sending invite email to %s", email)
-        flash("招待メールの送信に失敗しました。管理者に連絡してください。", "error")
-        return jsonify({"id": p.id, "email": p.email, "status": p.status, "error": "mail_exception"}), 500
-
+        db.session.add(p)
+        db.session.flush()
+
+        # generate token for invitation acceptance
+        serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
+        token = serializer.dumps({"participant_id": p.id, "event_id": event.id}, salt=current_app.config.get("SECURITY_PASSWORD_SALT"))
+        accept_url = url_for("events.accept_invite", token=token, _external=True)
+        subject = f"[{current_app.config.get('APP_NAME','Schedule Manager')}] イベント招待: {event.title}"
+        # Render templates
+        text_body = render_template("emails/invite.txt", inviter_name=current_user_obj.username, recipient_name=None, event=event, accept_url=accept_url)
+        html_body = render_template("emails/invite.html", inviter_name=current_user_obj.username, recipient_name=None, event=event, accept_url=accept_url)
+        # queued in the same transaction as the participant; the outbox worker sends it
+        enqueue_email(subject, str(email), text_body, html=html_body, kind=f"event_invite:{event.id}")
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception("Failed to create invitation for %s", email)
+        return jsonify({"error": "invite_failed"}), 500
+    flash(f"{email} への招待メールの送信を受け付けました。", "success")
+    return jsonify({"id": p.id, "email": p.email, "status": p.status}), 201
 
 
 @events_bp.route("/events/invite/accept/<token>")
@@ -398,6 +397,7 @@ def accept_invite(token: str):
     p.status = "accepted"
     p.user_id = current_user_obj.id
     db.session.add(p)
+    sync_participant_reminders(p.event, p.user_id)
     db.session.commit()
     flash("イベントへの参加を承認しました。", "success")
     return redirect(url_for("events.list_events") + (f"?org_id={p.event.organization_id}" if p.event.organization_id else ""))
@@ -424,6 +424,7 @@ def respond_participation(event_id: int, participant_id: int):
     if not p.user_id:
         p.user_id = current_user_obj.id
     db.session.add(p)
+    sync_participant_reminders(p.event, p.user_id)
     db.session.commit()
     return jsonify({"id": p.id, "status": p.status})
 
@@ -556,6 +557,7 @@ def edit_event(event_id: int):
         form.start_at.data = start_local
         form.end_at.data = end_local
         form.timezone.data = event.timezone or 'Asia/Tokyo'
+        form.reminders.data = event.reminder_offsets or ''
 
     if form.validate_on_submit():
         org_id_raw = form.organization_id.data
@@ -589,6 +591,13 @@ def edit_event(event_id: int):
             start_utc = event.start_at
             end_utc = event.end_at
         
+        reminder_offsets = (form.reminders.data or "").strip() or None
+        reminders_changed = (
+            start_utc != event.start_at
+            or (form.rrule.data or None) != (event.rrule or None)
+            or form.timezone.data != event.timezone
+            or reminder_offsets != event.reminder_offsets
+        )
         event.title = form.title.data
         event.description = form.description.data
         event.location = form.location.data
@@ -600,8 +609,11 @@ def edit_event(event_id: int):
         event.timezone = form.timezone.data
         event.color = form.color.data
         event.organization_id = org_id
+        event.reminder_offsets = reminder_offsets
         try:
             db.session.add(event)
+            if reminders_changed:
+                replace_event_reminders(event)
             db.session.commit()
             flash("イベントを更新しました。", "success")
             return redirect(url_for("events.list_events") + (f"?org_id={org_id}" if org_id else ""))
@@ -55,6 +55,15 @@ class EventForm(FlaskForm):
     participants = StringField("participants", validators=[Optional(), Length(max=2000)])
     category = StringField("category", validators=[Optional(), Length(max=64)])
     rrule = StringField("rrule", validators=[Optional(), Length(max=512)])
+    # minutes before start, comma separated (e.g. "10,60"); empty uses the user's default
+    reminders = StringField(
+        "reminders",
+        validators=[
+            Optional(),
+            Length(max=255),
+            Regexp(r"^\s*\d+(\s*,\s*\d+)*\s*$", message="リマインダーは分数をカンマ区切りで入力してください。"),
+        ],
+    )
     timezone = SelectField("timezone", choices=COMMON_TIMEZONES, validators=[DataRequired()], default='Asia/Tokyo')
     color = StringField("color", validators=[DataRequired(), Length(min=4, max=7)])
     organization_id = SelectField("organization_id", choices=[], coerce=int, validators=[Optional()])
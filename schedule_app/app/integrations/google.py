@@ -1,11 +1,20 @@
 from __future__ import annotations
 from flask import Blueprint, current_app, redirect, request, url_for, session
 import requests
-from urllib.parse import urlencode
-from ..models import ExternalAccount, ExternalEventMapping, Event
+import email
+import json
+import re
+import uuid
+from urllib.parse import quote, urlencode, urlsplit
+from ..models import ExternalAccount
 from .. import db
 from ..utils.crypto import encrypt_value, decrypt_value
-from datetime import datetime, timedelta
+from ..utils import http_client
+from . import tokens
+from .outbound import PushOp, PushResult, send_batches
+from .paging import PagedItems, SyncStateExpired, google_pages, is_rate_limited, parse_retry_after, raise_for_rate_limit
+from .pipeline import ImportedEvent, remove_unseen, upsert_chunk
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 google_bp = Blueprint("integrations_google", __name__, url_prefix="/integrations/google")
@@ -54,7 +63,7 @@ def oauth_callback():
         "redirect_uri": redirect_uri,
         "grant_type": "authorization_code",
     }
-    resp = requests.post(token_url, data=data, timeout=10)
+    resp = http_client.post(token_url, data=data, timeout=10)
     if resp.status_code != 200:
         current_app.logger.error("Google token exchange failed: %s %s", resp.status_code, resp.text)
         return "OAuth failed", 400
@@ -97,7 +106,7 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
         "refresh_token": refresh_token,
         "grant_type": "refresh_token",
     }
-    resp = requests.post(token_url, data=data, timeout=10)
+    resp = http_client.post(token_url, data=data, timeout=10)
     if resp.status_code != 200:
         current_app.logger.error("Failed to refresh google token: %s %s", resp.status_code, resp.text)
         return False
@@ -106,6 +115,8 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
     expires_in = token_data.get("expires_in")
     if access_token:
         external_account.access_token = encrypt_value(access_token)
+    if token_data.get("refresh_token"):
+        external_account.refresh_token = encrypt_value(token_data["refresh_token"])
     if expires_in:
         external_account.expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
     db.session.add(external_account)
@@ -113,33 +124,213 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
     return True
 
 
-def import_events_for_account(external_account: ExternalAccount, since: Optional[datetime] = None):
-    """Fetch primary calendar events and create/update local Event objects.
+API_URL = "https://www.googleapis.com/calendar/v3"
+# partial response: only what _to_record reads, plus the paging/sync tokens
+LIST_FIELDS = "items(id,etag,status,summary,description,location,start,end),nextPageToken,nextSyncToken"
 
-    This is a minimal example: mapping is naive and should be extended for full coverage.
+
+def _events_url() -> str:
+    # GOOGLE_CALENDAR_API_URL can point imports at another server (a local fake in tests)
+    return current_app.config.get("GOOGLE_CALENDAR_API_URL", API_URL).rstrip("/") + "/calendars/primary/events"
+
+
+def _parse_time(value: dict) -> Optional[datetime]:
+    """Parse a Google start/end object (dateTime or all-day date) to naive UTC."""
+    raw = value.get("dateTime") or value.get("date")
+    if not raw:
+        return None
+    parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _to_record(item: dict) -> Optional[ImportedEvent]:
+    """Normalise a listed Google event; None for items that can't be imported."""
+    if not item.get("id"):
+        return None
+    if item.get("status") == "cancelled":
+        return ImportedEvent(item["id"])
+    start = _parse_time(item.get("start", {}))
+    end = _parse_time(item.get("end", {}))
+    if start is None or end is None:
+        return None
+    return ImportedEvent(
+        item["id"],
+        dict(
+            title=(item.get("summary") or "(no title)")[:200],
+            description=item.get("description"),
+            location=item.get("location"),
+            start_at=start,
+            end_at=end,
+        ),
+        etag=item.get("etag"),
+    )
+
+
+def import_events_for_account(external_account: ExternalAccount, since: Optional[datetime] = None) -> int:
+    """Sync the primary calendar into local Events. Returns the number of events changed.
+
+    The first sync (or one after Google expired the token with 410 Gone) lists
+    events from `since` (30 days ago by default) and stores the listing's
+    `nextSyncToken` on the account. Later syncs send that token and only receive
+    what changed since: new and edited events are created or updated, cancelled
+    ones are deleted. A full resync also removes mapped events in the window that
+    no longer exist upstream.
+
+    Pages (INTEGRATIONS_PAGE_SIZE events, trimmed with `fields`) are streamed and
+    applied in chunks of INTEGRATIONS_SYNC_CHUNK_SIZE by `pipeline.upsert_chunk`,
+    each in its own commit.
+    The new token is stored only once the last page has been applied, so an
+    interrupted sync starts again from the old token; re-applying is harmless.
     """
-    headers = {"Authorization": f"Bearer {external_account.access_token}"}
+    access_token = tokens.access_token(external_account)
+    if not access_token:
+        return 0
+    headers = {"Authorization": f"Bearer {access_token}"}
+    page_size = int(current_app.config.get("INTEGRATIONS_PAGE_SIZE", 250))
+    chunk_size = int(current_app.config.get("INTEGRATIONS_SYNC_CHUNK_SIZE", 200))
     now = datetime.utcnow()
-    time_min = (since or (now - timedelta(days=30))).isoformat() + "Z"
-    params = {"timeMin": time_min, "singleEvents": "true", "orderBy": "startTime"}
-    resp = requests.get("https://www.googleapis.com/calendar/v3/calendars/primary/events", headers=headers, params=params, timeout=10)
-    if resp.status_code != 200:
-        current_app.logger.error("Google calendar list failed: %s %s", resp.status_code, resp.text)
-        return []
-    items = resp.json().get("items", [])
-    created = 0
-    for it in items:
-        provider_event_id = it.get("id")
-        mapping = ExternalEventMapping.query.filter_by(provider="google", provider_event_id=provider_event_id, external_account_id=external_account.id).first()
-        start = it.get("start", {}).get("dateTime") or it.get("start", {}).get("date")
-        end = it.get("end", {}).get("dateTime") or it.get("end", {}).get("date")
-        # naive mapping: create event if not mapped
-        if not mapping:
-            ev = Event(user_id=external_account.user_id, title=it.get("summary") or "(no title)", description=it.get("description"), start_at=datetime.fromisoformat(start.replace("Z", "+00:00")), end_at=datetime.fromisoformat(end.replace("Z", "+00:00")))
-            db.session.add(ev)
-            db.session.commit()
-            mapping = ExternalEventMapping(provider="google", provider_event_id=provider_event_id, external_account_id=external_account.id, event_id=ev.id, last_synced_at=datetime.utcnow())
-            db.session.add(mapping)
-            db.session.commit()
-            created += 1
-    return created
+    time_min = since or (now - timedelta(days=30))
+
+    def sync(full: bool) -> tuple[int, PagedItems, set[str]]:
+        params = {"singleEvents": "true", "maxResults": page_size, "fields": LIST_FIELDS}
+        if full:
+            params["timeMin"] = time_min.isoformat() + "Z"
+        else:
+            params["syncToken"] = external_account.sync_token
+        listing = PagedItems(google_pages(_events_url(), headers, params), "items")
+        changed, seen = 0, set()
+        for chunk in listing.chunks(chunk_size):
+            records = [rec for rec in map(_to_record, chunk) if rec is not None]
+            if full:
+                seen.update(rec.provider_event_id for rec in records if not rec.deleted)
+            changed += upsert_chunk(external_account, "google", records, now).changed
+        return changed, listing, seen
+
+    full = not external_account.sync_token
+    try:
+        try:
+            changed, listing, seen = sync(full)
+        except SyncStateExpired:
+            if full:
+                raise
+            current_app.logger.info("Google sync token expired for account %s; running a full sync", external_account.id)
+            full = True
+            changed, listing, seen = sync(full)
+    except (requests.RequestException, SyncStateExpired) as e:
+        db.session.rollback()
+        current_app.logger.error("Google calendar sync failed for account %s: %s", external_account.id, e)
+        return 0
+    if full:
+        changed += remove_unseen(external_account, "google", seen, time_min)
+    external_account.sync_token = listing.last_page.get("nextSyncToken")
+    db.session.add(external_account)
+    db.session.commit()
+    return changed
+
+
+BATCH_URL = "https://www.googleapis.com/batch/calendar/v3"
+# Google accepts up to 1000 calls per batch request
+MAX_BATCH_SIZE = 1000
+
+
+def _batch_url() -> str:
+    return current_app.config.get("GOOGLE_BATCH_URL", BATCH_URL)
+
+
+def _format_time(value: datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + "Z"
+
+
+def _to_resource(fields: dict) -> dict:
+    return {
+        "summary": fields["title"],
+        "description": fields["description"],
+        "location": fields["location"],
+        "start": {"dateTime": _format_time(fields["start_at"])},
+        "end": {"dateTime": _format_time(fields["end_at"])},
+    }
+
+
+def _encode_batch(ops: list[PushOp], boundary: str) -> bytes:
+    """One application/http part per op; Content-ID is the op's index."""
+    path = urlsplit(current_app.config.get("GOOGLE_CALENDAR_API_URL", API_URL)).path.rstrip("/") + "/calendars/primary/events"
+    out = []
+    for i, op in enumerate(ops):
+        if op.kind == "insert":
+            line, body = f"POST {path}", json.dumps(_to_resource(op.fields))
+        elif op.kind == "update":
+            line, body = f"PATCH {path}/{quote(op.provider_event_id, safe='')}", json.dumps(_to_resource(op.fields))
+        else:
+            line, body = f"DELETE {path}/{quote(op.provider_event_id, safe='')}", None
+        out.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <op{i}>\r\n\r\n{line} HTTP/1.1\r\n")
+        if body is not None:
+            out.append(f"Content-Type: application/json; charset=UTF-8\r\n\r\n{body}\r\n")
+        else:
+            out.append("\r\n")
+    out.append(f"--{boundary}--\r\n")
+    return "".join(out).encode()
+
+
+def _decode_part(payload: str) -> PushResult:
+    """Parse one embedded HTTP response ("HTTP/1.1 200 OK", headers, JSON body)."""
+    parts = re.split(r"\r?\n\r?\n", payload.lstrip(), maxsplit=1)
+    lines = parts[0].splitlines()
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    text = parts[1].strip() if len(parts) > 1 else ""
+    try:
+        data = json.loads(text) if text else {}
+    except ValueError:
+        data = {}
+    retry_after = parse_retry_after(headers.get("retry-after"))
+    if is_rate_limited(status, retry_after, text):
+        status = 429
+    error = (data.get("error") or {}).get("message") if not 200 <= status < 300 else None
+    return PushResult(status, data.get("id"), data.get("etag") or headers.get("etag"), error, retry_after)
+
+
+def _decode_batch(resp, count: int) -> list[PushResult]:
+    results = [PushResult(0, error="missing from batch response") for _ in range(count)]
+    message = email.message_from_bytes(b"Content-Type: " + resp.headers.get("Content-Type", "").encode() + b"\r\n\r\n" + resp.content)
+    for part in message.get_payload() if message.is_multipart() else []:
+        # responses answer "<opN>" with "<response-opN>"
+        match = re.search(r"op(\d+)>?$", part.get("Content-ID", ""))
+        if match and int(match.group(1)) < count:
+            results[int(match.group(1))] = _decode_part(part.get_payload())
+    return results
+
+
+def _send_batch(ops: list[PushOp], headers: dict) -> list[PushResult]:
+    boundary = f"batch_{uuid.uuid4().hex}"
+    url = _batch_url()
+    resp = http_client.post(
+        url,
+        data=_encode_batch(ops, boundary),
+        headers=dict(headers, **{"Content-Type": f"multipart/mixed; boundary={boundary}"}),
+        timeout=30,
+    )
+    raise_for_rate_limit(resp, url)
+    resp.raise_for_status()
+    return _decode_batch(resp, len(ops))
+
+
+def push_changes(external_account: ExternalAccount, ops: list[PushOp]) -> list[PushResult]:
+    """Apply queued local changes to the primary calendar through the batch endpoint.
+
+    Up to GOOGLE_PUSH_BATCH_SIZE inserts/patches/deletes travel in one
+    multipart/mixed request; each part gets its own status, so one bad event
+    does not fail the others. Returns one result per op, in order.
+    """
+    access_token = tokens.access_token(external_account)
+    if not access_token:
+        return [PushResult(0, error="no access token") for _ in ops]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    size = min(MAX_BATCH_SIZE, int(current_app.config.get("GOOGLE_PUSH_BATCH_SIZE", 50)))
+    return send_batches(ops, size, lambda batch: _send_batch(batch, headers))
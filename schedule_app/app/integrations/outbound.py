@@ -0,0 +1,414 @@
+"""Outbound sync: push local event changes to the owner's Google / Outlook calendars.
+
+Queueing. Session listeners turn every ORM insert, update (of a synced field)
+and delete of an `Event` whose owner has a connected account into an
+`ExternalChange` row, written in the same flush, so a change is queued exactly
+when its transaction commits. While an event's row is still pending, later
+edits update that row instead of adding one (a delete replaces an upsert), so
+a burst of edits is pushed once. Imports write events with bulk statements,
+which bypass the listeners, so imported changes are never echoed back.
+
+Pushing. `push_changes` (the `push_external_changes` job) claims due rows,
+keeps the latest per event and plans operations per account:
+
+- upsert: update the remote copy in every account that has a mapping for the
+  event and insert one in every other connected account; a copy whose mapping
+  already carries the event's content hash is left alone. An update whose
+  remote copy is gone (404/410) drops the mapping and inserts a new copy in the
+  same run,
+- delete: delete the remote copies recorded when the event was deleted. A copy
+  created for an event that was deleted while its insert was in flight is
+  queued for deletion as well, so it is not orphaned on the provider.
+
+Each provider sends an account's operations through its batch API (Google's
+multipart batch endpoint, Graph JSON batching), GOOGLE_PUSH_BATCH_SIZE /
+OUTLOOK_PUSH_BATCH_SIZE operations per HTTP call. Results are written back to
+ExternalEventMapping: the remote id for inserts, and the etag and content hash
+for every pushed copy, so the next import skips the item. Pushed rows are
+deleted; rate limits, 5xx and network errors retry the row with backoff, other
+errors fail it after OUTBOUND_MAX_ATTEMPTS.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import requests
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, delete, event as sa_event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..delivery import backoff_seconds
+from ..models import Event, ExternalAccount, ExternalChange, ExternalEventMapping, User
+from ..utils.pg_lock import claim_rows
+from .paging import RateLimited, chunked
+from .pipeline import content_hash
+
+# Event columns mirrored to external calendars (the same fields imports write)
+SYNCED_FIELDS = ("title", "description", "location", "start_at", "end_at")
+
+_TARGETS_KEY = "outbound_delete_targets"
+
+
+@dataclass
+class PushOp:
+    change_id: int
+    event_id: int
+    kind: str  # insert, update, delete
+    provider_event_id: Optional[str] = None
+    fields: Optional[dict] = None
+    content_hash: Optional[str] = None
+    mapping_id: Optional[int] = None
+
+
+@dataclass
+class PushResult:
+    # HTTP status of the operation; 0 when it got no answer (network error, missing from the batch)
+    status: int
+    provider_event_id: Optional[str] = None
+    etag: Optional[str] = None
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    @property
+    def gone(self) -> bool:
+        return self.status in (404, 410)
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 0 or self.status == 429 or self.status >= 500
+
+
+def event_fields(event: Event) -> dict:
+    return {name: getattr(event, name) for name in SYNCED_FIELDS}
+
+
+def _enabled() -> bool:
+    return has_app_context() and bool(current_app.config.get("OUTBOUND_SYNC_ENABLED", True))
+
+
+@sa_event.listens_for(Session, "before_flush")
+def _forget_deleted_copies(session, flush_context, instances) -> None:
+    """Drop the mappings of deleted events, remembering their remote copies for the push."""
+    deleted = [obj for obj in session.deleted if isinstance(obj, Event) and obj.id is not None]
+    if not deleted:
+        return
+    targets = session.info.setdefault(_TARGETS_KEY, {})
+    for ev in deleted:
+        copies = targets.setdefault(ev.id, [])
+        for mapping in list(ev.external_mappings):
+            copies.append(
+                {
+                    "account_id": mapping.external_account_id,
+                    "provider": mapping.provider,
+                    "provider_event_id": mapping.provider_event_id,
+                }
+            )
+            session.delete(mapping)
+
+
+def _synced_fields_changed(ev: Event) -> bool:
+    state = inspect(ev)
+    return any(state.attrs[name].history.has_changes() for name in SYNCED_FIELDS)
+
+
+@sa_event.listens_for(Session, "after_flush")
+def _queue_event_changes(session, flush_context) -> None:
+    targets = session.info.pop(_TARGETS_KEY, {})
+    if not _enabled():
+        return
+    changes: dict[int, tuple[int, str, Optional[list]]] = {}
+    for obj in session.new:
+        if isinstance(obj, Event):
+            changes[obj.id] = (obj.user_id, "upsert", None)
+    for obj in session.dirty:
+        if isinstance(obj, Event) and obj not in session.deleted and _synced_fields_changed(obj):
+            changes[obj.id] = (obj.user_id, "upsert", None)
+    removed_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    for obj in session.deleted:
+        # events deleted with their owner take the owner's accounts with them: nothing to push to
+        if isinstance(obj, Event) and obj.user_id not in removed_users:
+            changes[obj.id] = (obj.user_id, "delete", targets.get(obj.id, []))
+    if not changes:
+        return
+
+    conn = session.connection()
+    user_ids = {user_id for user_id, _, _ in changes.values()}
+    connected = set(conn.scalars(select(ExternalAccount.user_id).where(ExternalAccount.user_id.in_(user_ids)).distinct()))
+    changes = {event_id: change for event_id, change in changes.items() if change[0] in connected}
+    if not changes:
+        return
+    table = ExternalChange.__table__
+    pending = dict(
+        conn.execute(
+            select(table.c.event_id, table.c.id).where(table.c.event_id.in_(list(changes)), table.c.status == "pending")
+        ).all()
+    )
+    now = datetime.utcnow()
+    updates, inserts = [], []
+    for event_id, (user_id, operation, copies) in changes.items():
+        encoded = json.dumps(copies) if copies is not None else None
+        if event_id in pending:
+            updates.append({"change_id": pending[event_id], "new_operation": operation, "new_targets": encoded, "new_updated_at": now})
+        elif operation == "upsert" or copies:
+            inserts.append(
+                dict(
+                    event_id=event_id,
+                    user_id=user_id,
+                    operation=operation,
+                    targets=encoded,
+                    status="pending",
+                    attempts=0,
+                    next_attempt_at=now,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+    if updates:
+        conn.execute(
+            table.update()
+            .where(table.c.id == bindparam("change_id"))
+            .values(operation=bindparam("new_operation"), targets=bindparam("new_targets"), updated_at=bindparam("new_updated_at")),
+            updates,
+        )
+    if inserts:
+        conn.execute(table.insert(), inserts)
+
+
+def send_batches(ops: list[PushOp], size: int, send: Callable[[list[PushOp]], list[PushResult]]) -> list[PushResult]:
+    """Send `ops` in batches of `size` with `send`; returns one result per op, in order.
+
+    A rate-limited batch ends the run: it and every later op get a 429 result
+    carrying the Retry-After, so they are retried once the provider allows.
+    """
+    results: list[PushResult] = []
+    for batch in chunked(ops, size):
+        try:
+            results.extend(send(batch))
+        except RateLimited as e:
+            results.extend(PushResult(429, error=str(e), retry_after=e.retry_after) for _ in range(len(ops) - len(results)))
+            break
+        except requests.RequestException as e:
+            results.extend(PushResult(getattr(e.response, "status_code", 0) or 0, error=str(e)) for _ in batch)
+    return results
+
+
+def _plan(rows: list[ExternalChange], accounts: dict[int, list[ExternalAccount]]) -> dict[int, list[PushOp]]:
+    """Turn claimed changes into per-account operations."""
+    ops: dict[int, list[PushOp]] = {}
+    upserts = [row for row in rows if row.operation == "upsert"]
+    event_ids = [row.event_id for row in upserts]
+    events = {ev.id: ev for ev in Event.query.filter(Event.id.in_(event_ids))} if event_ids else {}
+    mappings: dict[int, dict[int, ExternalEventMapping]] = {}
+    if event_ids:
+        for mapping in ExternalEventMapping.query.filter(ExternalEventMapping.event_id.in_(event_ids)):
+            mappings.setdefault(mapping.event_id, {})[mapping.external_account_id] = mapping
+    for row in upserts:
+        ev = events.get(row.event_id)
+        if ev is None:
+            # deleted since it was queued; its delete change pushes the removal
+            continue
+        fields = event_fields(ev)
+        digest = content_hash(fields)
+        mapped = mappings.get(ev.id, {})
+        for account in accounts.get(row.user_id, []):
+            mapping = mapped.get(account.id)
+            if mapping is None:
+                op = PushOp(row.id, ev.id, "insert", fields=fields, content_hash=digest)
+            elif mapping.content_hash != digest:
+                op = PushOp(row.id, ev.id, "update", mapping.provider_event_id, fields, digest, mapping.id)
+            else:
+                continue
+            ops.setdefault(account.id, []).append(op)
+    known = {account.id for user_accounts in accounts.values() for account in user_accounts}
+    for row in rows:
+        if row.operation != "delete":
+            continue
+        for target in json.loads(row.targets or "[]"):
+            if target.get("account_id") in known:
+                ops.setdefault(target["account_id"], []).append(
+                    PushOp(row.id, row.event_id, "delete", target.get("provider_event_id"))
+                )
+    return ops
+
+
+def _push_account(account: ExternalAccount, ops: list[PushOp]) -> list[PushResult]:
+    from .registry import get_provider
+    from .tokens import ensure_fresh
+
+    provider = get_provider(account.provider)
+    if not ensure_fresh(account):
+        return [PushResult(0, error="token refresh failed") for _ in ops]
+    try:
+        return provider.push_changes(account, ops)
+    except Exception as e:
+        current_app.logger.exception("push to %s account %s failed", account.provider, account.id)
+        return [PushResult(0, error=f"{type(e).__name__}: {e}") for _ in ops]
+
+
+def _apply_results(
+    account: ExternalAccount, ops: list[PushOp], results: list[PushResult], now: datetime, failures: dict[int, PushResult]
+) -> list[PushOp]:
+    """Write pushed copies back to ExternalEventMapping; failed ops land in `failures` (caller commits).
+
+    Returns insert ops for updated copies that no longer exist upstream, to be pushed again.
+    """
+    created, refreshed, dropped, recreate = [], [], [], []
+    for op, res in zip(ops, results):
+        if res.ok and op.kind == "insert":
+            created.append((op, res))
+        elif res.ok and op.kind == "update":
+            refreshed.append(dict(id=op.mapping_id, etag=res.etag, content_hash=op.content_hash, last_synced_at=now))
+        elif res.gone and op.kind == "update":
+            current_app.logger.warning(
+                "%s copy %s of event %s is gone upstream; creating it again", account.provider, op.provider_event_id, op.event_id
+            )
+            dropped.append(op.mapping_id)
+            recreate.append(PushOp(op.change_id, op.event_id, "insert", fields=op.fields, content_hash=op.content_hash))
+        elif not (res.ok or (res.gone and op.kind == "delete")):
+            failures.setdefault(op.change_id, res)
+    if created:
+        alive = set(db.session.scalars(select(Event.id).where(Event.id.in_([op.event_id for op, _ in created]))))
+        orphans = [(op, res) for op, res in created if op.event_id not in alive and res.provider_event_id]
+        if orphans:
+            _queue_orphan_deletes(account, orphans, now)
+        rows = [
+            dict(
+                provider=account.provider,
+                provider_event_id=res.provider_event_id,
+                external_account_id=account.id,
+                event_id=op.event_id,
+                last_synced_at=now,
+                etag=res.etag,
+                content_hash=op.content_hash,
+            )
+            for op, res in created
+            if op.event_id in alive and res.provider_event_id
+        ]
+        if rows:
+            db.session.execute(insert(ExternalEventMapping), rows)
+    if refreshed:
+        db.session.execute(update(ExternalEventMapping), refreshed)
+    if dropped:
+        db.session.execute(delete(ExternalEventMapping).where(ExternalEventMapping.id.in_(dropped)))
+    return recreate
+
+
+def _queue_orphan_deletes(account: ExternalAccount, orphans: list[tuple[PushOp, PushResult]], now: datetime) -> None:
+    """Queue deletes for copies created after their event was deleted locally (caller commits)."""
+    pending = {
+        row.event_id: row
+        for row in ExternalChange.query.filter(
+            ExternalChange.event_id.in_([op.event_id for op, _ in orphans]), ExternalChange.status == "pending"
+        )
+    }
+    for op, res in orphans:
+        current_app.logger.info(
+            "event %s was deleted while its %s copy %s was created; queueing its removal", op.event_id, account.provider, res.provider_event_id
+        )
+        target = {"account_id": account.id, "provider": account.provider, "provider_event_id": res.provider_event_id}
+        row = pending.get(op.event_id)
+        if row is None:
+            row = pending[op.event_id] = ExternalChange(
+                event_id=op.event_id, user_id=account.user_id, operation="delete", targets="[]",
+                status="pending", attempts=0, next_attempt_at=now, created_at=now,
+            )
+            db.session.add(row)
+        row.operation = "delete"
+        row.targets = json.dumps(json.loads(row.targets or "[]") + [target])
+        row.updated_at = now
+
+
+def _settle(rows: list[ExternalChange], done: list[int], failures: dict[int, PushResult], now: datetime) -> None:
+    """Delete pushed rows and schedule a retry (or fail) the rest (caller commits)."""
+    cfg = current_app.config
+    max_attempts = int(cfg.get("OUTBOUND_MAX_ATTEMPTS", 8))
+    base = float(cfg.get("OUTBOUND_BACKOFF_BASE", 60))
+    cap = float(cfg.get("OUTBOUND_BACKOFF_MAX", 3600))
+    done = done + [row.id for row in rows if row.id not in failures]
+    if done:
+        db.session.execute(delete(ExternalChange).where(ExternalChange.id.in_(done)).execution_options(synchronize_session=False))
+    for row in rows:
+        res = failures.get(row.id)
+        if res is None:
+            continue
+        row.attempts = (row.attempts or 0) + 1
+        row.last_error = f"{res.status}: {res.error or ''}"[:2000]
+        row.claimed_by = None
+        row.lease_expires_at = None
+        if res.retryable and row.attempts < max_attempts:
+            row.status = "pending"
+            delay = max(res.retry_after or 0.0, backoff_seconds(row.attempts, base, cap))
+            row.next_attempt_at = now + timedelta(seconds=delay)
+        else:
+            row.status = "failed"
+            current_app.logger.error("outbound change %s for event %s failed after %s attempt(s): %s", row.id, row.event_id, row.attempts, row.last_error)
+
+
+def push_changes(limit: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    """Push one batch of queued changes. Returns the number of queue rows processed."""
+    cfg = current_app.config
+    now = now or datetime.utcnow()
+    limit = limit or int(cfg.get("OUTBOUND_BATCH_SIZE", 200))
+    try:
+        rows = claim_rows(
+            ExternalChange,
+            ExternalChange.next_attempt_at <= now,
+            ExternalChange.next_attempt_at,
+            limit,
+            int(cfg.get("OUTBOUND_LEASE_SECONDS", 300)),
+            now=now,
+        )
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("push_changes: failed to claim rows")
+        return 0
+    if not rows:
+        return 0
+
+    # several claimed rows for one event (edits racing a claim): only the newest is pushed
+    latest: dict[int, ExternalChange] = {}
+    superseded = []
+    for row in sorted(rows, key=lambda r: r.id):
+        if row.event_id in latest:
+            superseded.append(latest[row.event_id].id)
+        latest[row.event_id] = row
+    current = list(latest.values())
+
+    from .registry import get_provider
+
+    accounts: dict[int, list[ExternalAccount]] = {}
+    for account in ExternalAccount.query.filter(ExternalAccount.user_id.in_({row.user_id for row in current})).order_by(ExternalAccount.id):
+        provider = get_provider(account.provider)
+        if provider is not None and provider.push_changes is not None:
+            accounts.setdefault(account.user_id, []).append(account)
+    by_id = {account.id: account for user_accounts in accounts.values() for account in user_accounts}
+
+    failures: dict[int, PushResult] = {}
+    for account_id, ops in _plan(current, accounts).items():
+        # one commit per account: a crash later in the run re-pushes only what was not recorded
+        try:
+            results = _push_account(by_id[account_id], ops)
+            recreate = _apply_results(by_id[account_id], ops, results, now, failures)
+            if recreate:
+                _apply_results(by_id[account_id], recreate, _push_account(by_id[account_id], recreate), now, failures)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception("push_changes: failed to record results for account %s", account_id)
+            for op in ops:
+                failures.setdefault(op.change_id, PushResult(0, error=f"{type(e).__name__}: {e}"))
+    try:
+        _settle(current, superseded, failures, now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("push_changes: failed to settle changes %s", [row.id for row in rows])
+    return len(rows)
@@ -1,12 +1,17 @@
 from __future__ import annotations
 from flask import Blueprint, current_app, redirect, request, url_for
 import requests
-from urllib.parse import urlencode
-from ..models import ExternalAccount, ExternalEventMapping, Event
+from urllib.parse import quote, urlencode
+from ..models import ExternalAccount
 from .. import db
 from datetime import datetime, timedelta
 from typing import Optional
 from ..utils.crypto import encrypt_value, decrypt_value
+from ..utils import http_client
+from . import tokens
+from .outbound import PushOp, PushResult, send_batches
+from .paging import PagedItems, SyncStateExpired, graph_pages, is_rate_limited, parse_retry_after, raise_for_rate_limit
+from .pipeline import ImportedEvent, remove_unseen, upsert_chunk
 
 outlook_bp = Blueprint("integrations_outlook", __name__, url_prefix="/integrations/outlook")
 
@@ -48,7 +53,7 @@ def oauth_callback():
         "grant_type": "authorization_code",
         "redirect_uri": redirect_uri,
     }
-    resp = requests.post(token_url, data=data, timeout=10)
+    resp = http_client.post(token_url, data=data, timeout=10)
     if resp.status_code != 200:
         current_app.logger.error("Outlook token exchange failed: %s %s", resp.status_code, resp.text)
         return "OAuth failed", 400
@@ -86,7 +91,7 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
         "refresh_token": refresh_token,
         "grant_type": "refresh_token",
     }
-    resp = requests.post(token_url, data=data, timeout=10)
+    resp = http_client.post(token_url, data=data, timeout=10)
     if resp.status_code != 200:
         current_app.logger.error("Failed to refresh outlook token: %s %s", resp.status_code, resp.text)
         return False
@@ -95,6 +100,9 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
     expires_in = td.get("expires_in")
     if access_token:
         external_account.access_token = encrypt_value(access_token)
+    if td.get("refresh_token"):
+        # Microsoft rotates refresh tokens; keep the newest one
+        external_account.refresh_token = encrypt_value(td["refresh_token"])
     if expires_in:
         external_account.expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
     db.session.add(external_account)
@@ -102,36 +110,195 @@ def refresh_access_token(external_account: ExternalAccount) -> bool:
     return True
 
 
-def import_events_for_account(external_account: ExternalAccount, since: Optional[datetime] = None):
-    """Import events from Microsoft Graph /me/events into local Events (naive mapping)."""
-    access_token_enc = external_account.access_token
-    if not access_token_enc:
-        return 0
-    access_token = decrypt_value(access_token_enc)
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+# window of the initial delta round; the deltaLink keeps tracking that window
+SYNC_LOOKAHEAD_DAYS = 365
+# start a new round (and window) once the tracked window ends within this many days
+DELTA_RENEW_DAYS = 30
+
+
+def _graph_url() -> str:
+    # MS_GRAPH_API_URL can point syncs at another server (a local fake in tests)
+    return current_app.config.get("MS_GRAPH_API_URL", GRAPH_URL).rstrip("/")
+
+
+def _delta_url() -> str:
+    return _graph_url() + "/me/calendarView/delta"
+
+
+def _parse_time(value: dict) -> Optional[datetime]:
+    raw = (value or {}).get("dateTime")
+    if not raw:
+        return None
+    return datetime.fromisoformat(raw.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _to_record(item: dict) -> Optional[ImportedEvent]:
+    """Normalise a delta entry; None for entries that can't be imported."""
+    if not item.get("id"):
+        return None
+    if "@removed" in item or item.get("isCancelled"):
+        return ImportedEvent(item["id"])
+    start = _parse_time(item.get("start"))
+    end = _parse_time(item.get("end"))
+    if start is None or end is None:
+        return None
+    return ImportedEvent(
+        item["id"],
+        dict(
+            title=(item.get("subject") or "(no title)")[:200],
+            description=item.get("bodyPreview"),
+            location=((item.get("location") or {}).get("displayName") or None),
+            start_at=start,
+            end_at=end,
+        ),
+        etag=item.get("@odata.etag") or item.get("changeKey"),
+    )
+
+
+def import_events_for_account(external_account: ExternalAccount, since: Optional[datetime] = None) -> int:
+    """Sync the Outlook calendar view into local Events with a Graph delta query.
+
+    Returns the number of events changed. The first round (or one after Graph
+    expired the delta token with 410 Gone) requests `calendarView/delta` for
+    `since` (30 days ago by default) up to SYNC_LOOKAHEAD_DAYS ahead and stores
+    the final page's `@odata.deltaLink` on the account; a full round also
+    removes mapped events in the window that Graph no longer returns. Later
+    syncs call the delta link and only receive what changed: added and updated
+    events are upserted, `@removed` (and cancelled) ones are deleted.
+
+    A delta link keeps tracking the window of the round that created it, so
+    once that window's end (`delta_window_end`) is less than
+    OUTLOOK_DELTA_RENEW_DAYS away, the link is dropped and a full round opens a
+    new window; otherwise events further ahead would never be imported.
+
+    Pages (`Prefer: odata.maxpagesize` = INTEGRATIONS_PAGE_SIZE) are followed
+    through `@odata.nextLink` and applied in chunks of
+    INTEGRATIONS_SYNC_CHUNK_SIZE by `pipeline.upsert_chunk`, each in its own
+    commit. The new delta link is stored only after the last page, so an
+    interrupted sync repeats the round.
+    """
+    access_token = tokens.access_token(external_account)
     if not access_token:
         return 0
-    headers = {"Authorization": f"Bearer {access_token}", "Prefer": "outlook.timezone=UTC"}
+    page_size = int(current_app.config.get("INTEGRATIONS_PAGE_SIZE", 250))
+    chunk_size = int(current_app.config.get("INTEGRATIONS_SYNC_CHUNK_SIZE", 200))
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Prefer": f'outlook.timezone="UTC", odata.maxpagesize={page_size}',
+    }
     now = datetime.utcnow()
-    time_min = (since or (now - timedelta(days=30))).isoformat() + "Z"
-    params = {"startDateTime": time_min, "endDateTime": (now + timedelta(days=365)).isoformat() + "Z"}
-    # Graph API to list events in a calendar view: GET /me/calendarview?startDateTime=...&endDateTime=...
-    resp = requests.get("https://graph.microsoft.com/v1.0/me/calendarview", headers=headers, params=params, timeout=10)
-    if resp.status_code != 200:
-        current_app.logger.error("Outlook calendar list failed: %s %s", resp.status_code, resp.text)
+    time_min = since or (now - timedelta(days=30))
+
+    window_end = now + timedelta(days=SYNC_LOOKAHEAD_DAYS)
+
+    def sync(full: bool) -> tuple[int, PagedItems, set[str]]:
+        if full:
+            # calendarView/delta takes no $select; the window is part of the first request only
+            url = _delta_url()
+            params = {
+                "startDateTime": time_min.isoformat() + "Z",
+                "endDateTime": window_end.isoformat() + "Z",
+            }
+        else:
+            url, params = external_account.delta_link, None
+        listing = PagedItems(graph_pages(url, headers, params), "value")
+        changed, seen = 0, set()
+        for chunk in listing.chunks(chunk_size):
+            records = [rec for rec in map(_to_record, chunk) if rec is not None]
+            if full:
+                seen.update(rec.provider_event_id for rec in records if not rec.deleted)
+            changed += upsert_chunk(external_account, "outlook", records, now).changed
+        return changed, listing, seen
+
+    renew_days = int(current_app.config.get("OUTLOOK_DELTA_RENEW_DAYS", DELTA_RENEW_DAYS))
+    window_closing = (
+        external_account.delta_window_end is None
+        or external_account.delta_window_end <= now + timedelta(days=renew_days)
+    )
+    if external_account.delta_link and window_closing:
+        current_app.logger.info("Outlook delta window of account %s ends soon; starting a new round", external_account.id)
+    full = not external_account.delta_link or window_closing
+    try:
+        try:
+            changed, listing, seen = sync(full)
+        except SyncStateExpired:
+            if full:
+                raise
+            current_app.logger.info("Outlook delta token expired for account %s; running a full sync", external_account.id)
+            full = True
+            changed, listing, seen = sync(full)
+    except (requests.RequestException, SyncStateExpired) as e:
+        db.session.rollback()
+        current_app.logger.error("Outlook calendar sync failed for account %s: %s", external_account.id, e)
         return 0
-    items = resp.json().get("value", [])
-    created = 0
-    for it in items:
-        provider_event_id = it.get("id")
-        mapping = ExternalEventMapping.query.filter_by(provider="outlook", provider_event_id=provider_event_id, external_account_id=external_account.id).first()
-        start = it.get("start", {}).get("dateTime")
-        end = it.get("end", {}).get("dateTime")
-        if not mapping:
-            ev = Event(user_id=external_account.user_id, title=it.get("subject") or "(no title)", description=it.get("bodyPreview"), start_at=datetime.fromisoformat(start.replace("Z", "+00:00")), end_at=datetime.fromisoformat(end.replace("Z", "+00:00")))
-            db.session.add(ev)
-            db.session.commit()
-            mapping = ExternalEventMapping(provider="outlook", provider_event_id=provider_event_id, external_account_id=external_account.id, event_id=ev.id, last_synced_at=datetime.utcnow())
-            db.session.add(mapping)
-            db.session.commit()
-            created += 1
-    return created
+    if full:
+        changed += remove_unseen(external_account, "outlook", seen, time_min)
+    external_account.delta_link = listing.last_page.get("@odata.deltaLink")
+    if full:
+        external_account.delta_window_end = window_end
+    db.session.add(external_account)
+    db.session.commit()
+    return changed
+
+
+# JSON batching accepts at most 20 requests per $batch call
+MAX_BATCH_SIZE = 20
+
+
+def _to_graph_event(fields: dict) -> dict:
+    return {
+        "subject": fields["title"],
+        "body": {"contentType": "text", "content": fields["description"] or ""},
+        "location": {"displayName": fields["location"] or ""},
+        "start": {"dateTime": fields["start_at"].isoformat(), "timeZone": "UTC"},
+        "end": {"dateTime": fields["end_at"].isoformat(), "timeZone": "UTC"},
+    }
+
+
+def _batch_request(i: int, op: PushOp) -> dict:
+    if op.kind == "insert":
+        return {"id": str(i), "method": "POST", "url": "/me/events", "headers": {"Content-Type": "application/json"}, "body": _to_graph_event(op.fields)}
+    url = f"/me/events/{quote(op.provider_event_id, safe='')}"
+    if op.kind == "update":
+        return {"id": str(i), "method": "PATCH", "url": url, "headers": {"Content-Type": "application/json"}, "body": _to_graph_event(op.fields)}
+    return {"id": str(i), "method": "DELETE", "url": url}
+
+
+def _decode_response(item: dict) -> PushResult:
+    status = int(item.get("status") or 0)
+    body = item.get("body") if isinstance(item.get("body"), dict) else {}
+    retry_after = parse_retry_after((item.get("headers") or {}).get("Retry-After"))
+    if is_rate_limited(status, retry_after, None):
+        status = 429
+    error = (body.get("error") or {}).get("message") if not 200 <= status < 300 else None
+    return PushResult(status, body.get("id"), body.get("@odata.etag") or body.get("changeKey"), error, retry_after)
+
+
+def _send_batch(ops: list[PushOp], headers: dict) -> list[PushResult]:
+    url = _graph_url() + "/$batch"
+    payload = {"requests": [_batch_request(i, op) for i, op in enumerate(ops)]}
+    resp = http_client.post(url, json=payload, headers=headers, timeout=30)
+    raise_for_rate_limit(resp, url)
+    resp.raise_for_status()
+    results = [PushResult(0, error="missing from batch response") for _ in ops]
+    # responses may come back in any order; match them by id
+    for item in resp.json().get("responses") or []:
+        index = int(item.get("id", -1))
+        if 0 <= index < len(ops):
+            results[index] = _decode_response(item)
+    return results
+
+
+def push_changes(external_account: ExternalAccount, ops: list[PushOp]) -> list[PushResult]:
+    """Apply queued local changes to the Outlook calendar with Graph JSON batching.
+
+    Up to OUTLOOK_PUSH_BATCH_SIZE (at most 20) creates/patches/deletes go in
+    one `$batch` call, each with its own status. Returns one result per op.
+    """
+    access_token = tokens.access_token(external_account)
+    if not access_token:
+        return [PushResult(0, error="no access token") for _ in ops]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    size = min(MAX_BATCH_SIZE, int(current_app.config.get("OUTLOOK_PUSH_BATCH_SIZE", 20)))
+    return send_batches(ops, size, lambda batch: _send_batch(batch, headers))
@@ -0,0 +1,129 @@
+"""Streaming pagination over provider list endpoints.
+
+Google and Microsoft Graph both split listings into pages: Google repeats the
+request with `pageToken=<nextPageToken>`, Graph hands back a complete
+`@odata.nextLink` URL. The generators here fetch one page at a time, so an
+importer holds at most one page plus the chunk it is upserting, whatever the
+size of the calendar. `PagedItems` flattens pages into items and keeps the
+last page around for tokens that only arrive at the end (`nextSyncToken`,
+`@odata.deltaLink`).
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from ..utils import http_client
+
+
+class SyncStateExpired(Exception):
+    """The provider answered 410 Gone: the stored sync/delta token is no longer valid."""
+
+
+class RateLimited(Exception):
+    """The provider answered 429 (or 503 with Retry-After). Importers let this propagate.
+
+    `retry_after` is the delay in seconds the provider asked for, or None.
+    """
+
+    def __init__(self, retry_after: Optional[float], message: str = "") -> None:
+        super().__init__(message or f"rate limited (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or an HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+def is_rate_limited(status: int, retry_after: Optional[float], text: Optional[str]) -> bool:
+    return (
+        status == 429
+        or (status == 503 and retry_after is not None)
+        # Google reports quota exhaustion as 403 rateLimitExceeded / userRateLimitExceeded
+        or (status == 403 and "ratelimitexceeded" in (text or "").lower())
+    )
+
+
+def raise_for_rate_limit(resp, url: str) -> None:
+    """Raise RateLimited if `resp` is a provider rate-limit answer."""
+    retry_after = parse_retry_after((getattr(resp, "headers", None) or {}).get("Retry-After"))
+    if is_rate_limited(resp.status_code, retry_after, resp.text):
+        raise RateLimited(retry_after, f"{resp.status_code} from {url}")
+
+
+def _get(url: str, headers: dict, params: Optional[dict], timeout: float) -> dict:
+    resp = http_client.get(url, headers=headers, params=params, timeout=timeout)
+    if resp.status_code == 410:
+        raise SyncStateExpired(resp.text)
+    raise_for_rate_limit(resp, url)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def google_pages(url: str, headers: dict, params: dict, timeout: float = 10) -> Iterator[dict]:
+    """Yield each page of a Google list call, following nextPageToken."""
+    params = dict(params)
+    while True:
+        page = _get(url, headers, params, timeout)
+        yield page
+        token = page.get("nextPageToken")
+        if not token:
+            return
+        params["pageToken"] = token
+
+
+def graph_pages(url: str, headers: dict, params: Optional[dict] = None, timeout: float = 10) -> Iterator[dict]:
+    """Yield each page of a Graph collection, following @odata.nextLink.
+
+    The next link already carries every query option, so `params` only applies
+    to the first request.
+    """
+    next_url: Optional[str] = url
+    while next_url:
+        page = _get(next_url, headers, params, timeout)
+        yield page
+        next_url, params = page.get("@odata.nextLink"), None
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+class PagedItems:
+    """Iterate the `key` items of a page stream; `last_page` is the final page once exhausted."""
+
+    def __init__(self, pages: Iterable[dict], key: str) -> None:
+        self.pages = pages
+        self.key = key
+        self.last_page: dict = {}
+        self.page_count = 0
+
+    def __iter__(self) -> Iterator[dict]:
+        for page in self.pages:
+            self.page_count += 1
+            self.last_page = page
+            yield from page.get(self.key) or []
+
+    def chunks(self, size: int) -> Iterator[list[dict]]:
+        return chunked(self, size)
@@ -0,0 +1,62 @@
+"""Registry of calendar providers keyed by `ExternalAccount.provider`.
+
+Jobs look up what to do for an account here instead of branching on provider
+names, so a provider that is connected through OAuth is never silently skipped
+by background work. The built-in Google and Outlook modules are registered on
+first lookup (they import Flask blueprints, so not at module import time).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from ..models import ExternalAccount
+
+
+@dataclass(frozen=True)
+class Provider:
+    name: str
+    # refresh the account's access token; returns True when a new token was stored
+    refresh_access_token: Callable[[ExternalAccount], bool]
+    import_events: Optional[Callable[..., int]] = None
+    # push queued local changes (see outbound.py): (account, ops) -> one PushResult per op
+    push_changes: Optional[Callable[..., list]] = None
+
+
+_providers: dict[str, Provider] = {}
+_builtins_loaded = False
+
+
+def register_provider(provider: Provider) -> None:
+    _providers[provider.name] = provider
+
+
+def _load_builtins() -> None:
+    global _builtins_loaded
+    if _builtins_loaded:
+        return
+    _builtins_loaded = True
+    from . import google, outlook
+
+    for name, module in (("google", google), ("outlook", outlook)):
+        # explicit registrations (e.g. in tests) win over the built-in module
+        _providers.setdefault(
+            name,
+            Provider(
+                name=name,
+                refresh_access_token=module.refresh_access_token,
+                import_events=module.import_events_for_account,
+                push_changes=module.push_changes,
+            ),
+        )
+
+
+def get_provider(name: str) -> Optional[Provider]:
+    """Return the provider registered under `name`, or None if unknown."""
+    _load_builtins()
+    return _providers.get(name)
+
+
+def provider_names() -> list[str]:
+    _load_builtins()
+    return sorted(_providers)
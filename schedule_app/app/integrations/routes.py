@@ -155,40 +155,23 @@ def account_history(account_id: int):
 @integrations_bp.route('/accounts/<int:account_id>/sync', methods=['POST'])
 @login_required
 def account_sync(account_id: int):
+    """Queue the account for the sync worker (sync_requested_accounts job) and return at once.
+
+    The remote fetch can take a long time, so it never runs in the request thread.
+    """
     acc = ExternalAccount.query.get_or_404(account_id)
     if acc.user_id != current_user.id:
         return {'error': 'forbidden'}, 403
-    provider = acc.provider
-    created = 0
     from ..models import IntegrationLog
-    try:
-        if provider == 'google':
-            from .google import import_events_for_account, refresh_access_token as google_refresh
-            # attempt to refresh if expired
-            if acc.expires_at and acc.expires_at <= datetime.utcnow():
-                refreshed = google_refresh(acc)
-                if not refreshed:
-                    db.session.add(IntegrationLog(provider='google', account_id=acc.id, level='error', message='Token refresh failed'))
-                    db.session.commit()
-                    return {'error': 'token_refresh_failed'}, 400
-            created = import_events_for_account(acc)
-        elif provider == 'outlook':
-            from .outlook import import_events_for_account, refresh_access_token as outlook_refresh
-            if acc.expires_at and acc.expires_at <= datetime.utcnow():
-                refreshed = outlook_refresh(acc)
-                if not refreshed:
-                    db.session.add(IntegrationLog(provider='outlook', account_id=acc.id, level='error', message='Token refresh failed'))
-                    db.session.commit()
-                    return {'error': 'token_refresh_failed'}, 400
-            created = import_events_for_account(acc)
-        else:
-            db.session.add(IntegrationLog(provider=provider, account_id=acc.id, level='error', message='Unsupported provider for manual sync'))
-            db.session.commit()
-            return {'error': 'unsupported_provider'}, 400
-        db.session.add(IntegrationLog(provider=provider, account_id=acc.id, level='info', message=f'manual sync created {created} events'))
+    from .registry import get_provider
+
+    provider = get_provider(acc.provider)
+    if provider is None or provider.import_events is None:
+        db.session.add(IntegrationLog(provider=acc.provider, account_id=acc.id, level='error', message='Unsupported provider for manual sync'))
         db.session.commit()
-        return {'created': created}
-    except Exception as e:
-        db.session.add(IntegrationLog(provider=provider, account_id=acc.id, level='error', message=str(e)))
+        return {'error': 'unsupported_provider'}, 400
+    if acc.sync_requested_at is None:
+        acc.sync_requested_at = datetime.utcnow()
+        db.session.add(IntegrationLog(provider=acc.provider, account_id=acc.id, level='info', message='manual sync queued'))
         db.session.commit()
-        return {'error': 'sync_failed', 'message': str(e)}, 500
+    return {'queued': True, 'requested_at': acc.sync_requested_at.isoformat() + 'Z'}, 202
@@ -0,0 +1,118 @@
+"""Access tokens for external accounts: single-flight refresh and a decrypt cache.
+
+`ensure_fresh` is the one way to refresh a token outside the scheduled
+`refresh_external_accounts` job. It takes a per-account lock in this process
+and the account's row lock (`SELECT ... FOR UPDATE` on Postgres), then re-reads
+the row and checks the expiry again, so when a manual sync, the sync worker and
+the refresh job race, the first one refreshes and the others find the new
+token instead of calling the provider again (and overwriting each other's
+tokens). The provider's refresh commits, which releases the row lock. The
+refresh job takes the same per-account lock (`account_lock`), whose entries are
+reference-counted and dropped once no thread holds or waits for them.
+
+`access_token` returns the decrypted access token, cached in-process for
+TOKEN_CACHE_SECONDS. Entries are keyed by the stored ciphertext, so a refreshed
+token is never served stale.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from flask import current_app
+
+from .. import db
+from ..models import ExternalAccount
+from ..utils.crypto import decrypt_value
+
+# account id -> (ciphertext, plaintext, monotonic expiry)
+_cache: dict[int, tuple[str, str, float]] = {}
+_cache_lock = threading.Lock()
+# account id -> [lock, threads holding or waiting for it]
+_account_locks: dict[int, list] = {}
+_account_locks_lock = threading.Lock()
+
+
+def access_token(account: ExternalAccount) -> Optional[str]:
+    """Return the account's decrypted access token, decrypting at most once per TTL."""
+    ciphertext = account.access_token
+    if not ciphertext:
+        return None
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(account.id)
+        if entry is not None and entry[0] == ciphertext and entry[2] > now:
+            return entry[1]
+    plaintext = decrypt_value(ciphertext)
+    if plaintext is None:
+        return None
+    ttl = float(current_app.config.get("TOKEN_CACHE_SECONDS", 60))
+    if ttl > 0:
+        with _cache_lock:
+            _cache[account.id] = (ciphertext, plaintext, now + ttl)
+    return plaintext
+
+
+def forget(account_id: int) -> None:
+    with _cache_lock:
+        _cache.pop(account_id, None)
+
+
+@contextmanager
+def account_lock(account_id: int) -> Iterator[None]:
+    """Hold this process's refresh lock for one account; the entry is removed when unused."""
+    with _account_locks_lock:
+        entry = _account_locks.setdefault(account_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _account_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _account_locks[account_id]
+
+
+def _expiring(account: ExternalAccount, leeway: float) -> bool:
+    return account.expires_at is not None and account.expires_at <= datetime.utcnow() + timedelta(seconds=leeway)
+
+
+def ensure_fresh(account: ExternalAccount, leeway: Optional[float] = None) -> bool:
+    """Refresh the account's token if it expires within `leeway` seconds. Returns False if it
+    needed a refresh and the refresh failed.
+
+    Defaults to REFRESH_LEEWAY_SECONDS. Commits or rolls back the current session.
+    """
+    from ..utils.pg_lock import is_postgres
+    from .registry import get_provider
+
+    if leeway is None:
+        leeway = float(current_app.config.get("REFRESH_LEEWAY_SECONDS", 300))
+    if not _expiring(account, leeway):
+        return True
+    provider = get_provider(account.provider)
+    if provider is None:
+        current_app.logger.warning("no refresh handler for provider %s (account %s)", account.provider, account.id)
+        return False
+    with account_lock(account.id):
+        q = db.session.query(ExternalAccount).populate_existing().filter(ExternalAccount.id == account.id)
+        if is_postgres():
+            # wait (no SKIP LOCKED): whoever holds the lock is refreshing, and we want its result
+            q = q.with_for_update()
+        locked = q.one()
+        if not _expiring(locked, leeway):
+            # refreshed by someone else while we waited
+            db.session.commit()
+            return True
+        try:
+            ok = provider.refresh_access_token(locked)
+        except Exception:
+            current_app.logger.exception("failed to refresh %s account %s", account.provider, account.id)
+            ok = False
+        if not ok:
+            db.session.rollback()
+        return bool(ok)
@@ -0,0 +1,185 @@
+"""Asyncio worker that syncs many external accounts concurrently.
+
+`sync_accounts` (the `sync_external_accounts` job) runs one `SyncWorker` pass
+over every account whose provider has an importer; `sync_requested_accounts`
+runs one over the accounts queued by the manual sync button, and a finished
+sync clears the account's `sync_requested_at`. The event loop only
+schedules: each account's sync (the provider HTTP calls and the DB writes of
+its import) runs in a worker thread with its own app context, so it gets its
+own session and connection and the loop never blocks on the network or the
+database. The importers are synchronous (`requests` plus paging helpers), so
+the threads come from a pass-private executor sized to the sum of the
+per-provider limits; the default `asyncio.to_thread` executor would otherwise
+cap concurrency below those limits.
+
+Concurrency is limited per provider (SYNC_WORKER_CONCURRENCY syncs in flight
+for each of Google and Outlook). When a provider rate-limits a call (429, or
+503/403 with a rate-limit reason; see `paging.RateLimited`), the whole provider
+backs off until its Retry-After has passed (SYNC_WORKER_DEFAULT_RETRY_AFTER when
+the header is missing, capped at SYNC_WORKER_MAX_RETRY_AFTER), and the account
+is retried up to SYNC_WORKER_MAX_RETRIES times. The cooldown is checked after a
+sync has taken its provider slot, so syncs already queued on the limit wait
+too. Imports are idempotent, so retrying after a partial sync is safe.
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, Optional
+
+from flask import Flask, current_app
+
+from .. import db
+from ..models import ExternalAccount, IntegrationLog
+from .paging import RateLimited
+from .registry import get_provider
+from .tokens import ensure_fresh
+
+
+@dataclass
+class SyncOutcome:
+    account_id: int
+    provider: str
+    status: str  # ok, error, rate_limited, skipped
+    changed: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class SyncWorker:
+    def __init__(
+        self,
+        app: Flask,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.app = app
+        self.concurrency = max(1, int(concurrency or app.config.get("SYNC_WORKER_CONCURRENCY", 4)))
+        self.max_retries = int(max_retries if max_retries is not None else app.config.get("SYNC_WORKER_MAX_RETRIES", 3))
+        self.default_retry_after = float(app.config.get("SYNC_WORKER_DEFAULT_RETRY_AFTER", 30))
+        self.max_retry_after = float(app.config.get("SYNC_WORKER_MAX_RETRY_AFTER", 300))
+        self._sleep = sleep
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        # loop time before which no new request may go to the provider
+        self._cooldown_until: dict[str, float] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _limit(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._limits:
+            self._limits[provider] = asyncio.Semaphore(self.concurrency)
+        return self._limits[provider]
+
+    async def _wait_for_cooldown(self, provider: str) -> None:
+        waited_until = 0.0
+        # loop again if another sync was rate limited (and pushed the cooldown out) while we slept
+        while (until := self._cooldown_until.get(provider, 0.0)) > waited_until:
+            remaining = until - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            await self._sleep(remaining)
+            waited_until = until
+
+    def _back_off(self, provider: str, retry_after: Optional[float]) -> float:
+        delay = min(self.max_retry_after, retry_after if retry_after is not None else self.default_retry_after)
+        until = asyncio.get_running_loop().time() + delay
+        self._cooldown_until[provider] = max(self._cooldown_until.get(provider, 0.0), until)
+        return delay
+
+    def _sync_in_thread(self, account_id: int) -> int:
+        """Refresh the token if needed and run the provider import (runs in a worker thread)."""
+        with self.app.app_context():
+            account = None
+            started = datetime.utcnow()
+            try:
+                account = db.session.get(ExternalAccount, account_id)
+                provider = get_provider(account.provider) if account else None
+                if provider is None or provider.import_events is None:
+                    return 0
+                if not ensure_fresh(account):
+                    raise RuntimeError("token refresh failed")
+                changed = provider.import_events(account)
+                db.session.add(IntegrationLog(provider=account.provider, account_id=account.id, level="info", message=f"sync changed {changed} events"))
+                self._clear_request(account_id, started)
+                db.session.commit()
+                return changed
+            except RateLimited:
+                db.session.rollback()
+                raise
+            except Exception as e:
+                db.session.rollback()
+                db.session.add(IntegrationLog(provider=account.provider if account else "", account_id=account_id, level="error", message=f"sync failed: {e}"))
+                self._clear_request(account_id, started)
+                db.session.commit()
+                raise
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def _clear_request(account_id: int, started: datetime) -> None:
+        # a manual sync requested after this one started is left for the next pass
+        db.session.query(ExternalAccount).filter(
+            ExternalAccount.id == account_id, ExternalAccount.sync_requested_at <= started
+        ).update({ExternalAccount.sync_requested_at: None}, synchronize_session=False)
+
+    async def sync_account(self, account_id: int, provider: str) -> SyncOutcome:
+        outcome = SyncOutcome(account_id=account_id, provider=provider, status="rate_limited")
+        while outcome.attempts <= self.max_retries:
+            async with self._limit(provider):
+                await self._wait_for_cooldown(provider)
+                outcome.attempts += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    outcome.changed = await loop.run_in_executor(self._executor, self._sync_in_thread, account_id)
+                    outcome.status = "ok"
+                    return outcome
+                except RateLimited as e:
+                    delay = self._back_off(provider, e.retry_after)
+                    outcome.error = str(e)
+                    self.app.logger.warning("sync of %s account %s rate limited; backing off %.1fs", provider, account_id, delay)
+                except Exception as e:
+                    self.app.logger.exception("sync of %s account %s failed", provider, account_id)
+                    outcome.status, outcome.error = "error", str(e)
+                    return outcome
+        return outcome
+
+    def _load_accounts(self, account_ids: Optional[Iterable[int]]) -> list[tuple[int, str]]:
+        with self.app.app_context():
+            try:
+                q = db.session.query(ExternalAccount.id, ExternalAccount.provider).order_by(ExternalAccount.id)
+                if account_ids is not None:
+                    q = q.filter(ExternalAccount.id.in_(list(account_ids)))
+                return [(account_id, provider) for account_id, provider in q.all()]
+            finally:
+                db.session.remove()
+
+    async def run(self, account_ids: Optional[Iterable[int]] = None) -> list[SyncOutcome]:
+        accounts = await asyncio.to_thread(self._load_accounts, account_ids)
+        outcomes = []
+        tasks = []
+        providers = set()
+        for account_id, provider_name in accounts:
+            provider = get_provider(provider_name)
+            if provider is None or provider.import_events is None:
+                outcomes.append(SyncOutcome(account_id=account_id, provider=provider_name, status="skipped"))
+                continue
+            providers.add(provider_name)
+            tasks.append(self.sync_account(account_id, provider_name))
+        if not tasks:
+            return outcomes
+        # one thread per provider slot, so only the per-provider semaphores limit concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency * len(providers), thread_name_prefix="sync")
+        try:
+            outcomes.extend(await asyncio.gather(*tasks))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return outcomes
+
+
+def sync_accounts(account_ids: Optional[Iterable[int]] = None, app: Optional[Flask] = None) -> list[SyncOutcome]:
+    """Run one concurrent sync pass (blocking) and return the per-account outcomes."""
+    app = app or current_app._get_current_object()  # type: ignore[attr-defined]
+    return asyncio.run(SyncWorker(app).run(account_ids))
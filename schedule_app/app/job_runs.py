@@ -0,0 +1,251 @@
+"""Job execution telemetry (the job_runs table).
+
+Every run dispatched by `scheduler.run_job_in_app_context` or `tasks.py` is
+wrapped in `track_job_run`, which times it and records the rows processed (an
+int returned by the job), whether the job-level lock was acquired (reported by
+pg_lock through `note_lock_acquired`) and the error, if any.
+
+Records are buffered per process and written with one multi-row INSERT on a
+separate connection once JOB_RUNS_FLUSH_SIZE runs are queued or the oldest is
+JOB_RUNS_FLUSH_SECONDS old, so telemetry never shares a transaction with the
+job it describes. `rollup_job_runs` folds rows older than
+JOB_RUNS_RETENTION_DAYS into daily `JobRunRollup` rows and prunes old rollups.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Generator, Optional
+
+from flask import Flask, current_app
+from sqlalchemy import insert
+
+from . import db
+from .models import JobRun, JobRunRollup
+from .utils.pg_lock import worker_id
+
+
+@dataclass
+class JobRunState:
+    job_id: str
+    source: str
+    started_at: datetime
+    lock_acquired: Optional[bool] = None
+    rows_processed: Optional[int] = None
+
+
+_current_run: ContextVar[Optional[JobRunState]] = ContextVar("current_job_run", default=None)
+
+
+def note_lock_acquired(acquired: bool) -> None:
+    """Record the job-lock outcome on the run being tracked in this context, if any."""
+    state = _current_run.get()
+    if state is not None:
+        state.lock_acquired = bool(acquired)
+
+
+def note_rows_processed(count: int) -> None:
+    state = _current_run.get()
+    if state is not None:
+        state.rows_processed = (state.rows_processed or 0) + int(count)
+
+
+class JobRunRecorder:
+    """Thread-safe buffer of finished runs, flushed to job_runs in batches."""
+
+    def __init__(self, flush_size: int = 20, flush_seconds: float = 60.0) -> None:
+        self.flush_size = max(1, int(flush_size))
+        self.flush_seconds = float(flush_seconds)
+        # keep at most this many rows if the database is unreachable
+        self.max_buffer = self.flush_size * 10
+        self._rows: list[dict] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, row: dict, engine) -> None:
+        with self._lock:
+            self._rows.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = len(self._rows) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_seconds
+        if due:
+            self.flush(engine)
+
+    def flush(self, engine) -> int:
+        with self._lock:
+            rows, self._rows, self._oldest = self._rows, [], None
+        if not rows:
+            return 0
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(JobRun.__table__), rows)
+        except Exception:
+            current_app.logger.exception("job_runs: failed to write %s run record(s)", len(rows))
+            with self._lock:
+                self._rows = (rows + self._rows)[-self.max_buffer:]
+                self._oldest = time.monotonic()
+            return 0
+        return len(rows)
+
+
+_recorder_lock = threading.Lock()
+
+
+def get_recorder(app: Optional[Flask] = None) -> JobRunRecorder:
+    """Return the per-app recorder, creating it from config on first use."""
+    app = app or current_app._get_current_object()  # type: ignore[attr-defined]
+    with _recorder_lock:
+        recorder = app.extensions.get("job_run_recorder")
+        if recorder is None:
+            recorder = JobRunRecorder(
+                flush_size=int(app.config.get("JOB_RUNS_FLUSH_SIZE", 20)),
+                flush_seconds=float(app.config.get("JOB_RUNS_FLUSH_SECONDS", 60)),
+            )
+            app.extensions["job_run_recorder"] = recorder
+    return recorder
+
+
+def flush_job_runs() -> int:
+    """Write any buffered run records now (end of a tasks.py run, process shutdown)."""
+    return get_recorder().flush(db.engine)
+
+
+@contextmanager
+def track_job_run(job_id: str, source: str = "scheduler") -> Generator[JobRunState, None, None]:
+    """Time the enclosed job run and queue a job_runs record for it.
+
+    The yielded state can be updated by the caller (`rows_processed`,
+    `lock_acquired`); runs whose lock was not acquired are stored as 'skipped'.
+    """
+    state = JobRunState(job_id=job_id, source=source, started_at=datetime.utcnow())
+    if not current_app.config.get("JOB_RUNS_ENABLED", True):
+        yield state
+        return
+    token = _current_run.set(state)
+    started = time.monotonic()
+    error = None
+    try:
+        yield state
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_run.reset(token)
+        if error:
+            status = "error"
+        elif state.lock_acquired is False:
+            status = "skipped"
+        else:
+            status = "ok"
+        get_recorder().record(
+            {
+                "job_id": job_id,
+                "source": source,
+                "host": worker_id(),
+                "started_at": state.started_at,
+                "duration_ms": round((time.monotonic() - started) * 1000, 3),
+                "status": status,
+                "lock_acquired": state.lock_acquired,
+                "rows_processed": state.rows_processed,
+                "error": error,
+            },
+            db.engine,
+        )
+
+
+def percentile(sorted_values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _summarise(rows: list[tuple]) -> dict:
+    """Counts and duration percentiles for (duration_ms, status, rows_processed) tuples.
+
+    Skipped runs return almost immediately, so they are counted but left out of
+    the duration percentiles.
+    """
+    durations = sorted(d for d, status, _ in rows if status != "skipped")
+    return {
+        "runs": len(rows),
+        "errors": sum(1 for _, status, _ in rows if status == "error"),
+        "skipped": sum(1 for _, status, _ in rows if status == "skipped"),
+        "rows_processed": sum(n or 0 for _, _, n in rows),
+        "total_ms": sum(durations),
+        "max_ms": durations[-1] if durations else 0.0,
+        "p50_ms": percentile(durations, 0.50),
+        "p95_ms": percentile(durations, 0.95),
+    }
+
+
+def job_run_stats(since: datetime) -> list[dict]:
+    """Per-job run counts and p50/p95/max durations for runs started since `since`."""
+    rows = (
+        db.session.query(JobRun.job_id, JobRun.duration_ms, JobRun.status, JobRun.rows_processed, JobRun.started_at)
+        .filter(JobRun.started_at >= since)
+        .order_by(JobRun.job_id)
+        .all()
+    )
+    grouped: dict[str, list] = {}
+    last: dict[str, datetime] = {}
+    for job_id, duration, status, processed, started_at in rows:
+        grouped.setdefault(job_id, []).append((duration, status, processed))
+        if job_id not in last or started_at > last[job_id]:
+            last[job_id] = started_at
+    out = []
+    for job_id, items in grouped.items():
+        summary = _summarise(items)
+        summary.pop("total_ms")
+        summary["job_id"] = job_id
+        summary["last_started_at"] = last[job_id].isoformat() + "Z"
+        out.append(summary)
+    return out
+
+
+def rollup_job_runs(now: Optional[datetime] = None) -> int:
+    """Fold job_runs older than the retention window into daily rollups. Returns raw rows removed.
+
+    Only whole days are rolled up. A late row for a day that already has a rollup
+    is merged into it; its percentiles then keep the larger of the two values.
+    """
+    now = now or datetime.utcnow()
+    retention = int(current_app.config.get("JOB_RUNS_RETENTION_DAYS", 14))
+    cutoff = datetime.combine((now - timedelta(days=retention)).date(), datetime.min.time())
+    removed = 0
+    job_ids = [j for (j,) in db.session.query(JobRun.job_id).filter(JobRun.started_at < cutoff).distinct().all()]
+    for job_id in job_ids:
+        rows = (
+            db.session.query(JobRun.started_at, JobRun.duration_ms, JobRun.status, JobRun.rows_processed)
+            .filter(JobRun.job_id == job_id, JobRun.started_at < cutoff)
+            .all()
+        )
+        by_day: dict = {}
+        for started_at, duration, status, processed in rows:
+            by_day.setdefault(started_at.date(), []).append((duration, status, processed))
+        for day, items in by_day.items():
+            summary = _summarise(items)
+            rollup = db.session.get(JobRunRollup, (job_id, day))
+            if rollup is None:
+                db.session.add(JobRunRollup(job_id=job_id, day=day, **summary))
+                continue
+            for key in ("runs", "errors", "skipped", "rows_processed", "total_ms"):
+                setattr(rollup, key, getattr(rollup, key) + summary[key])
+            rollup.max_ms = max(rollup.max_ms, summary["max_ms"])
+            for key in ("p50_ms", "p95_ms"):
+                values = [v for v in (getattr(rollup, key), summary[key]) if v is not None]
+                setattr(rollup, key, max(values) if values else None)
+        removed += (
+            JobRun.query.filter(JobRun.job_id == job_id, JobRun.started_at < cutoff).delete(synchronize_session=False)
+        )
+        db.session.commit()
+    keep_days = int(current_app.config.get("JOB_RUNS_ROLLUP_RETENTION_DAYS", 365))
+    JobRunRollup.query.filter(JobRunRollup.day < (now - timedelta(days=keep_days)).date()).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
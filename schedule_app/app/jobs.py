@@ -2,48 +2,168 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 from typing import Iterable
 
+from sqlalchemy import and_, update
+
 from . import db
 from .models import Notification
+from .delivery import DeliveryResult, OutgoingMessage, backoff_seconds, get_delivery_pool
 from flask import current_app
 
-try:
-    # import optional helper for advisory locks
-    from .utils.pg_lock import pg_try_advisory_lock
-except Exception:  # pragma: no cover - optional
-    pg_try_advisory_lock = None  # type: ignore
+from .utils.pg_lock import claim_rows, is_postgres
 
 from .auth.routes import send_email
 from .models import ExternalAccount
 
-try:
-    from .integrations.google import refresh_access_token as google_refresh_access_token
-except Exception:  # optional
-    google_refresh_access_token = None  # type: ignore
 
+def _render_notification(n: Notification) -> OutgoingMessage:
+    user = n.user
+    event = n.event
+    start = n.occurrence_at or event.start_at
+    subject = f"[Schedule] リマインダー: {event.title}"
+    body = (
+        f"イベント '{event.title}' のリマインダーです。\n\n"
+        f"詳細: {event.description or ''}\n"
+        f"場所: {event.location or ''}\n"
+        f"開始: {start}\n終了: {start + (event.end_at - event.start_at)}\n"
+    )
+    return OutgoingMessage(
+        recipient=str(user.email),
+        subject=subject,
+        body=body,
+        provider=str(current_app.config.get("EMAIL_PROVIDER", "smtp")),
+        row_ids=[n.id],
+    )
 
-def _process_notification(n: Notification) -> None:
-    try:
-        user = n.user
+
+def _render_digest(group: list[Notification]) -> OutgoingMessage:
+    """Render several reminders for one user as a single email."""
+    user = group[0].user
+    items = sorted(group, key=lambda n: n.occurrence_at or n.event.start_at)
+    lines = [f"{len(items)} 件の予定のリマインダーです。", ""]
+    for n in items:
         event = n.event
-        subject = f"[Schedule] リマインダー: {event.title}"
-        body = (
-            f"イベント '{event.title}' のリマインダーです。\n\n"
-            f"詳細: {event.description or ''}\n"
-            f"場所: {event.location or ''}\n"
-            f"開始: {event.start_at}\n終了: {event.end_at}\n"
-        )
-        ok = send_email(subject, str(user.email), body)
-        if ok:
-            n.sent = True
-            n.sent_at = datetime.utcnow()
-            db.session.add(n)
+        start = n.occurrence_at or event.start_at
+        lines.append(f"- {event.title}")
+        lines.append(f"  開始: {start}  終了: {start + (event.end_at - event.start_at)}")
+        if event.location:
+            lines.append(f"  場所: {event.location}")
+    return OutgoingMessage(
+        recipient=str(user.email),
+        subject=f"[Schedule] リマインダー: {len(items)} 件の予定",
+        body="\n".join(lines) + "\n",
+        provider=str(current_app.config.get("EMAIL_PROVIDER", "smtp")),
+        row_ids=[n.id for n in items],
+    )
+
+
+def _build_messages(notifications: list[Notification]) -> list[OutgoingMessage]:
+    """Render claimed notifications; in digest mode one message per user."""
+    digest = int(current_app.config.get("REMINDER_DIGEST_WINDOW_MINUTES", 0)) > 0
+    if digest:
+        by_user: dict[int, list[Notification]] = {}
+        for n in notifications:
+            by_user.setdefault(n.user_id, []).append(n)
+        groups = list(by_user.values())
+    else:
+        groups = [[n] for n in notifications]
+    messages = []
+    for group in groups:
+        try:
+            messages.append(_render_notification(group[0]) if len(group) == 1 else _render_digest(group))
+        except Exception as e:
+            ids = [n.id for n in group]
+            current_app.logger.exception("Failed to render Notification(s) %s", ids)
+            try:
+                _record_failures(ids, f"render: {type(e).__name__}: {e}", datetime.utcnow())
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+    return messages
+
+
+def _send_message(msg: OutgoingMessage) -> bool:
+    # runs on a delivery worker thread (inside an app context)
+    return send_email(msg.subject, msg.recipient, msg.body, html=msg.html)
+
+
+def _record_outcomes(results: list[DeliveryResult]) -> None:
+    """Write delivery results back to the claimed rows, committing in batches."""
+    batch_size = max(1, int(current_app.config.get("NOTIFICATION_COMMIT_BATCH", 50)))
+    now = datetime.utcnow()
+    for i in range(0, len(results), batch_size):
+        chunk = results[i:i + batch_size]
+        sent_ids = [nid for r in chunk if r.ok for nid in r.message.row_ids]
+        try:
+            if sent_ids:
+                db.session.execute(
+                    update(Notification)
+                    .where(Notification.id.in_(sent_ids))
+                    .values(sent=True, sent_at=now, status="sent", lease_expires_at=None, last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+            for r in chunk:
+                if not r.ok:
+                    current_app.logger.error("Notification(s) %s failed to send: %s", r.message.row_ids, r.error)
+                    _record_failures(r.message.row_ids, r.error, now)
             db.session.commit()
-            current_app.logger.info("Notification %s sent", n.id)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Failed to record delivery outcomes for %s", [rid for r in chunk for rid in r.message.row_ids])
+
+
+def _record_failures(ids: list[int], error: str | None, now: datetime) -> None:
+    """Schedule a retry with exponential backoff, or move rows to 'failed' once out of attempts.
+
+    Rows in backoff or 'failed' drop out of the pending due scan, so a permanently
+    bad address can't keep occupying the batch. Caller commits.
+    """
+    cfg = current_app.config
+    max_attempts = int(cfg.get("NOTIFICATION_MAX_ATTEMPTS", 5))
+    base = float(cfg.get("NOTIFICATION_BACKOFF_BASE", 60))
+    cap = float(cfg.get("NOTIFICATION_BACKOFF_MAX", 21600))
+    for n in Notification.query.filter(Notification.id.in_(ids)).all():
+        n.attempts = (n.attempts or 0) + 1
+        n.last_error = (error or "")[:2000]
+        n.claimed_by = None
+        n.lease_expires_at = None
+        if n.attempts >= max_attempts:
+            n.status = "failed"
+            current_app.logger.error("Notification %s failed permanently after %s attempts", n.id, n.attempts)
         else:
-            current_app.logger.error("Notification %s failed to send", n.id)
+            n.status = "pending"
+            n.next_attempt_at = now + timedelta(seconds=backoff_seconds(n.attempts, base, cap))
+
+
+def claim_due_notifications(
+    limit: int | None = None,
+    worker_id: str | None = None,
+    now: datetime | None = None,
+    until: datetime | None = None,
+    user_ids: Iterable[int] | None = None,
+    ids: Iterable[int] | None = None,
+) -> list[Notification]:
+    """Claim up to `limit` due notifications for this worker and return them.
+
+    See `utils.pg_lock.claim_rows`: rows are claimed with ``FOR UPDATE SKIP LOCKED``
+    under a lease, so several workers can drain the queue concurrently. `until`,
+    `user_ids` and `ids` widen/narrow the scan (digest companions, timing-wheel fires).
+    """
+    now = now or datetime.utcnow()
+    if limit is None:
+        limit = int(current_app.config.get("NOTIFICATION_BATCH_SIZE", 100))
+    lease_seconds = int(current_app.config.get("NOTIFICATION_LEASE_SECONDS", 300))
+    # next_attempt_at starts at scheduled_at and moves forward on each failed attempt
+    ready = and_(Notification.sent == False, Notification.next_attempt_at <= (until or now))  # noqa: E712
+    if user_ids is not None:
+        ready = and_(ready, Notification.user_id.in_(list(user_ids)))
+    if ids is not None:
+        ready = and_(ready, Notification.id.in_(list(ids)))
+    try:
+        return claim_rows(Notification, ready, Notification.next_attempt_at, limit, lease_seconds, owner=worker_id, now=now)
     except Exception:
         db.session.rollback()
-        current_app.logger.exception("Failed to process Notification %s", getattr(n, "id", None))
+        current_app.logger.exception("Failed to claim due notifications")
+        return []
 
 
 # Job decorator for scheduler auto-discovery
@@ -54,7 +174,16 @@ def job(**meta):
         @job(schedule='interval', minutes=15, id='cleanup_old_events')
         def cleanup_old_events():
             ...
-    Supported meta keys: schedule (e.g. 'interval'), id, minutes, seconds, hours
+    Supported meta keys: schedule ('interval', 'cron' or 'date'), id, the trigger's
+    own arguments (interval: weeks/days/hours/minutes/seconds; cron: year/month/day/
+    week/day_of_week/hour/minute/second; date: run_date; plus start_date/end_date/
+    timezone), jitter (seconds of random delay so replicas don't fire together),
+    and the APScheduler job options coalesce, max_instances and misfire_grace_time.
+
+        @job(schedule='cron', hour=3, minute=0, jitter=600, id='nightly_cleanup')
+
+    A job may return the number of rows it processed; it is stored with the run
+    in the job_runs table.
     """
 
     def _decorator(fn):
@@ -67,57 +196,219 @@ def job(**meta):
 def run_due_jobs():
     """Process due notifications and run maintenance jobs.
 
-    This function is intended to be safe to call under a Postgres advisory lock
-    (see tasks.py) so that only one process executes it across replicas.
+    Notifications are claimed with row locks (see `claim_due_notifications`), so
+    any number of worker replicas can call this concurrently without sending the
+    same reminder twice. With REMINDER_DIGEST_WINDOW_MINUTES > 0 each user's
+    reminders are grouped into one email; all rows covered by a message are
+    marked sent in the same UPDATE.
     """
     current_app.logger.info("run_due_jobs: scanning for due notifications")
+    drained = drain_email_outbox()
     now = datetime.utcnow()
-    due = (
-        Notification.query.filter(Notification.scheduled_at <= now, Notification.sent == False)
-        .order_by(Notification.scheduled_at)
-        .limit(100)
-        .all()
-    )
-    for n in due:
-        _process_notification(n)
+    return drained + _deliver_claimed(claim_due_notifications(now=now), now)
+
+
+def dispatch_notifications(ids: Iterable[int], now: datetime | None = None) -> int:
+    """Claim and deliver specific notifications (fired by the scheduler's timing wheel).
+
+    Rows already claimed elsewhere, sent, or not yet due are skipped by the claim.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    now = now or datetime.utcnow()
+    return _deliver_claimed(claim_due_notifications(now=now, ids=ids), now)
 
 
-@job(schedule="interval", minutes=15, id="cleanup_old_events")
+def _deliver_claimed(due: list[Notification], now: datetime) -> int:
+    if not due:
+        return 0
+    window = int(current_app.config.get("REMINDER_DIGEST_WINDOW_MINUTES", 0))
+    if window > 0:
+        # Digest mode: a user who has a due reminder also gets the ones coming up
+        # within the window in the same email, instead of one email per reminder.
+        due += claim_due_notifications(now=now, until=now + timedelta(minutes=window), user_ids={n.user_id for n in due})
+    messages = _build_messages(due)
+    pool = get_delivery_pool()
+    results = pool.deliver(messages, _send_message)
+    _record_outcomes(results)
+    current_app.logger.info("delivered %s reminder message(s); stats=%s", len(results), pool.stats.snapshot())
+    return len(results)
+
+
+@job(schedule="interval", seconds=30, id="drain_email_outbox")
+def drain_email_outbox():
+    """Send queued transactional emails (see outbox.py) until the due backlog is empty."""
+    from .outbox import drain_outbox
+
+    batch = int(current_app.config.get("EMAIL_OUTBOX_BATCH_SIZE", 100))
+    total = 0
+    while True:
+        processed = drain_outbox(limit=batch)
+        total += processed
+        if processed < batch:
+            break
+    if total:
+        current_app.logger.info("drain_email_outbox: processed %s outbox row(s)", total)
+    return total
+
+
+@job(schedule="interval", hours=1, id="extend_reminder_horizon")
+def extend_reminder_horizon():
+    """Materialise reminder rows for recurring series up to the rolling horizon."""
+    from .reminders import extend_reminder_horizon as _extend
+
+    created = _extend()
+    current_app.logger.info("extend_reminder_horizon: created %s notification(s)", created)
+    return created
+
+
+@job(schedule="cron", hour=3, minute=0, jitter=900, coalesce=True, max_instances=1, misfire_grace_time=3600, id="cleanup_old_events")
 def cleanup_old_events():
-    """Trivial cleanup job: remove events that are completely in the distant past.
+    """Purge events that ended more than EVENT_RETENTION_DAYS ago, with their child rows.
 
-    This is a placeholder; adjust retention policy as needed.
+    Runs in primary-key batches with a throttle and resumes an interrupted run;
+    see cleanup.py.
     """
-    cutoff = datetime.utcnow().replace(year=datetime.utcnow().year - 2)
-    # lazy import to avoid circular at module import time
-    from .models import Event
+    from .cleanup import purge_old_events
 
-    q = Event.query.filter(Event.end_at != None, Event.end_at < cutoff)
-    count = q.count()
+    count = purge_old_events()
     if count:
-        current_app.logger.info("cleanup_old_events: deleting %s old events", count)
-        q.delete(synchronize_session=False)
-        db.session.commit()
+        current_app.logger.info("cleanup_old_events: deleted %s old events", count)
     else:
         current_app.logger.info("cleanup_old_events: nothing to delete")
+    return count
+
+
+def refresh_shard(config=None) -> tuple[int, int]:
+    """Return this worker's (shard index, shard count) for account refreshes.
+
+    REFRESH_SHARD_COUNT splits accounts into N slices; REFRESH_SHARD_INDEX picks
+    ours. Without an explicit index the ordinal suffix of HOSTNAME is used
+    (StatefulSet pods are named "<name>-0", "<name>-1", ...).
+    """
+    import os
+
+    config = config or current_app.config
+    count = max(1, int(config.get("REFRESH_SHARD_COUNT", 1) or 1))
+    raw = str(config.get("REFRESH_SHARD_INDEX", "") or "")
+    if not raw:
+        raw = os.getenv("HOSTNAME", "").rsplit("-", 1)[-1]
+    index = int(raw) if raw.isdigit() else 0
+    return index % count, count
 
 
 @job(schedule="interval", minutes=10, id="refresh_external_accounts")
-def refresh_external_accounts():
-    """Refresh access tokens for external accounts whose tokens are expired or about to expire.
+def refresh_external_accounts(shard_index: int | None = None, shard_count: int | None = None):
+    """Refresh access tokens that expire within REFRESH_LEEWAY_SECONDS for this worker's shard.
 
-    This job is intentionally conservative: it will refresh accounts with expires_at within the next 5 minutes.
+    Accounts are sharded deterministically: hash(account_id) is the integer id
+    itself, so shard = id mod N, evaluated in SQL. Each account is claimed with
+    `SELECT ... FOR UPDATE SKIP LOCKED` (re-checking its expiry) before the
+    provider is called, so overlapping workers during a shard rebalance never
+    refresh the same account twice; the in-process lock from integrations.tokens
+    does the same against `ensure_fresh`. Providers come from integrations.registry.
     """
-    current_app.logger.info("refresh_external_accounts: scanning external accounts for refresh")
-    now = datetime.utcnow()
-    threshold = now + timedelta(minutes=5)
-    accounts = ExternalAccount.query.filter(ExternalAccount.expires_at != None, ExternalAccount.expires_at <= threshold).all()
-    for a in accounts:
-        try:
-            if a.provider == "google" and google_refresh_access_token:
-                ok = google_refresh_access_token(a)
-                current_app.logger.info("refreshed google account %s ok=%s", a.id, ok)
-            else:
-                current_app.logger.info("no refresh handler for provider %s", a.provider)
-        except Exception:
-            current_app.logger.exception("failed to refresh external account %s", a.id)
+    from .integrations.registry import get_provider
+    from .integrations.tokens import account_lock
+
+    if shard_index is None or shard_count is None:
+        shard_index, shard_count = refresh_shard()
+    leeway = int(current_app.config.get("REFRESH_LEEWAY_SECONDS", 300))
+    batch = int(current_app.config.get("REFRESH_BATCH_SIZE", 200))
+    threshold = datetime.utcnow() + timedelta(seconds=leeway)
+    due = and_(ExternalAccount.expires_at != None, ExternalAccount.expires_at <= threshold)  # noqa: E711
+    if shard_count > 1:
+        due = and_(due, ExternalAccount.id % shard_count == shard_index)
+    current_app.logger.info("refresh_external_accounts: shard %s/%s scanning for expiring tokens", shard_index, shard_count)
+
+    refreshed = 0
+    last_id = 0
+    while True:
+        ids = [i for (i,) in db.session.query(ExternalAccount.id).filter(due, ExternalAccount.id > last_id).order_by(ExternalAccount.id).limit(batch).all()]
+        db.session.rollback()
+        if not ids:
+            break
+        last_id = ids[-1]
+        for account_id in ids:
+            # same in-process lock as tokens.ensure_fresh, so a sync refreshing this account is waited for
+            with account_lock(account_id):
+                q = ExternalAccount.query.filter(ExternalAccount.id == account_id, due)
+                if is_postgres():
+                    q = q.with_for_update(skip_locked=True)
+                account = q.first()
+                if account is None:
+                    # claimed by another worker, or refreshed since the scan
+                    db.session.rollback()
+                    continue
+                provider = get_provider(account.provider)
+                if provider is None:
+                    current_app.logger.warning("no refresh handler for provider %s (account %s)", account.provider, account.id)
+                    db.session.rollback()
+                    continue
+                try:
+                    # the provider commits the new token, which also releases the row lock
+                    ok = provider.refresh_access_token(account)
+                    refreshed += 1 if ok else 0
+                    current_app.logger.info("refreshed %s account %s ok=%s", account.provider, account.id, ok)
+                except Exception:
+                    current_app.logger.exception("failed to refresh external account %s", account_id)
+                finally:
+                    db.session.rollback()
+    return refreshed
+
+
+@job(schedule="interval", minutes=15, jitter=60, coalesce=True, max_instances=1, id="sync_external_accounts")
+def sync_external_accounts():
+    """Import calendar changes for every connected account (see integrations/worker.py).
+
+    Accounts are synced concurrently on an asyncio loop, with per-provider limits
+    and Retry-After backoff; returns the number of events changed.
+    """
+    from .integrations.worker import sync_accounts
+
+    outcomes = sync_accounts()
+    failed = [o.account_id for o in outcomes if o.status in ("error", "rate_limited")]
+    if failed:
+        current_app.logger.warning("sync_external_accounts: %s account(s) not synced: %s", len(failed), failed)
+    return sum(o.changed for o in outcomes)
+
+
+@job(schedule="interval", seconds=15, coalesce=True, max_instances=1, id="sync_requested_accounts")
+def sync_requested_accounts():
+    """Sync the accounts queued by the manual sync button (integrations.account_sync)."""
+    from .integrations.worker import sync_accounts
+
+    ids = [i for (i,) in db.session.query(ExternalAccount.id).filter(ExternalAccount.sync_requested_at != None).all()]  # noqa: E711
+    db.session.rollback()
+    if not ids:
+        return 0
+    outcomes = sync_accounts(ids)
+    return sum(o.changed for o in outcomes)
+
+
+@job(schedule="interval", minutes=1, coalesce=True, max_instances=1, id="push_external_changes")
+def push_external_changes():
+    """Push queued local event changes to connected calendars (see integrations/outbound.py)."""
+    from .integrations.outbound import push_changes
+
+    batch = int(current_app.config.get("OUTBOUND_BATCH_SIZE", 200))
+    total = 0
+    while True:
+        processed = push_changes(limit=batch)
+        total += processed
+        if processed < batch:
+            break
+    if total:
+        current_app.logger.info("push_external_changes: processed %s queued change(s)", total)
+    return total
+
+
+@job(schedule="cron", hour=4, minute=0, jitter=600, coalesce=True, max_instances=1, id="rollup_job_runs")
+def rollup_job_runs():
+    """Fold aged job_runs telemetry into daily rollups (see job_runs.py)."""
+    from .job_runs import rollup_job_runs as _rollup
+
+    removed = _rollup()
+    current_app.logger.info("rollup_job_runs: rolled up %s run record(s)", removed)
+    return removed
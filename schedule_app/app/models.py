@@ -27,6 +27,8 @@ class User(UserMixin, db.Model):
     two_factor_secret = db.Column(db.String(128), nullable=True)
     # JSON-encoded list of hashed backup codes (one-time use)
     two_factor_backup_codes = db.Column(db.Text, nullable=True)
+    # Default reminder offsets (minutes before start, CSV) for events without their own
+    default_reminder_offsets = db.Column(db.String(255), nullable=True)
 
     def generate_backup_codes(self, count: int = 10) -> list[str]:
         """Generate a list of one-time backup codes, store their hashed forms, and return plaintext codes.
@@ -115,6 +117,10 @@ class Event(db.Model):
     rrule = db.Column(db.String(512), nullable=True)  # RFC5545 RRULE string for recurrence
     timezone = db.Column(db.String(64), nullable=True)
     color = db.Column(db.String(7), nullable=False, default="#4287f5")
+    # Reminder offsets in minutes before start (CSV, e.g. "10,60"); NULL uses the owner's default
+    reminder_offsets = db.Column(db.String(255), nullable=True)
+    # For recurring events: occurrences before this instant already have Notification rows
+    reminders_generated_until = db.Column(db.DateTime, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
@@ -171,12 +177,114 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     method = db.Column(db.String(32), nullable=False, default="email")  # email, push, sms
     scheduled_at = db.Column(db.DateTime, nullable=False, index=True)
+    # Start of the occurrence this reminder is for (differs from event.start_at for recurring events)
+    occurrence_at = db.Column(db.DateTime, nullable=True)
     sent = db.Column(db.Boolean, default=False, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    # Queue state: pending -> processing (claimed under a lease) -> sent, or failed once out of attempts
+    status = db.Column(db.String(16), nullable=False, default="pending", index=True)
+    claimed_by = db.Column(db.String(128), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # when the row is next eligible for sending: scheduled_at, pushed back by retry backoff
+    next_attempt_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=lambda ctx: ctx.get_current_parameters()["scheduled_at"],
+    )
+    last_error = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     event = db.relationship("Event", backref="notifications")
     user = db.relationship("User")
 
+    __table_args__ = (
+        # partial index: the due scan only ever reads rows still waiting to be sent
+        db.Index(
+            "ix_notifications_pending_next_attempt",
+            "next_attempt_at",
+            postgresql_where=db.text("status = 'pending'"),
+            sqlite_where=db.text("status = 'pending'"),
+        ),
+    )
+
+
+class EmailOutbox(db.Model):
+    """Transactional outbox: emails written in the request transaction, sent by a worker."""
+    __tablename__ = "email_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False, index=True)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=True)
+    # hash of recipient + message kind (or the full content when no kind is given); see outbox.py
+    dedupe_key = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default="pending", index=True)  # pending, processing, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(128), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+class JobRun(db.Model):
+    """One execution of a scheduled job (scheduler.py or tasks.py), written in batches."""
+    __tablename__ = "job_runs"
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(128), nullable=False, index=True)
+    source = db.Column(db.String(16), nullable=False, default="scheduler")  # scheduler, tasks
+    host = db.Column(db.String(128), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
+    duration_ms = db.Column(db.Float, nullable=False, default=0.0)
+    status = db.Column(db.String(16), nullable=False, default="ok")  # ok, error, skipped (lock not acquired)
+    # None when the job doesn't use a job-level lock
+    lock_acquired = db.Column(db.Boolean, nullable=True)
+    rows_processed = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+
+class JobRunRollup(db.Model):
+    """Per-job daily summary of job_runs rows that have aged out of retention."""
+    __tablename__ = "job_run_rollups"
+    job_id = db.Column(db.String(128), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_ms = db.Column(db.Float, nullable=False, default=0.0)
+    p50_ms = db.Column(db.Float, nullable=True)
+    p95_ms = db.Column(db.Float, nullable=True)
+
+
+class JobCheckpoint(db.Model):
+    """Progress of a resumable batch job (e.g. the old-event purge), one row per job name."""
+    __tablename__ = "job_checkpoints"
+    name = db.Column(db.String(128), primary_key=True)
+    # last primary key fully processed; the next batch starts after it
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    # the run's fixed parameters, so a resumed run keeps selecting the same rows
+    cutoff = db.Column(db.DateTime, nullable=True)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class Lease(db.Model):
+    """A named, time-limited lease (e.g. scheduler leadership) held by one process at a time."""
+    __tablename__ = "leases"
+    name = db.Column(db.String(128), primary_key=True)
+    holder = db.Column(db.String(128), nullable=True)
+    # incremented every time the lease changes hands; stale holders compare against it
+    fencing_token = db.Column(db.BigInteger, nullable=False, default=0)
+    acquired_at = db.Column(db.DateTime, nullable=True)
+    renewed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 
 # Participants for events (explicit model rather than CSV in Event.participants)
 class EventParticipant(db.Model):
@@ -273,6 +381,14 @@ class ExternalAccount(db.Model):
     refresh_token = db.Column(db.Text, nullable=True)
     expires_at = db.Column(db.DateTime, nullable=True)
     scope = db.Column(db.String(255), nullable=True)
+    # Google nextSyncToken from the last completed sync; NULL forces a full sync
+    sync_token = db.Column(db.Text, nullable=True)
+    # Graph @odata.deltaLink from the last completed calendarView/delta round (Outlook)
+    delta_link = db.Column(db.Text, nullable=True)
+    # end of the calendarView window that delta_link tracks; the round is re-baselined before it
+    delta_window_end = db.Column(db.DateTime, nullable=True)
+    # set by the manual sync button; the sync_requested_accounts job picks the account up and clears it
+    sync_requested_at = db.Column(db.DateTime, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
@@ -287,11 +403,50 @@ class ExternalEventMapping(db.Model):
     external_account_id = db.Column(db.Integer, db.ForeignKey("external_accounts.id"), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey("events.id"), nullable=False, index=True)
     last_synced_at = db.Column(db.DateTime, nullable=True)
+    # Provider version of the item (Google etag / Graph @odata.etag) and a SHA-256 of the
+    # imported fields; an import whose item matches either is skipped without writes
+    etag = db.Column(db.String(255), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
 
     external_account = db.relationship("ExternalAccount", backref="event_mappings")
     event = db.relationship("Event", backref="external_mappings")
 
 
+class ExternalChange(db.Model):
+    """Outbound change queue: a local event edit waiting to be pushed to the owner's calendars.
+
+    Rows are written by the session listeners in integrations/outbound.py in the same
+    transaction as the edit. Further edits before the push update the pending row
+    instead of adding one, so a burst of edits to an event is pushed once.
+    """
+    __tablename__ = "external_changes"
+    id = db.Column(db.Integer, primary_key=True)
+    # not a foreign key: a queued delete outlives its event
+    event_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    operation = db.Column(db.String(16), nullable=False, default="upsert")  # upsert, delete
+    # for deletes: JSON list of the remote copies ({account_id, provider, provider_event_id})
+    targets = db.Column(db.Text, nullable=True)
+    # pending -> processing (claimed under a lease) -> row deleted once pushed, or failed
+    status = db.Column(db.String(16), nullable=False, default="pending", index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(128), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            "ix_external_changes_pending_next_attempt",
+            "next_attempt_at",
+            postgresql_where=db.text("status = 'pending'"),
+            sqlite_where=db.text("status = 'pending'"),
+        ),
+    )
+
+
 class IntegrationLog(db.Model):
     __tablename__ = "integration_logs"
     id = db.Column(db.Integer, primary_key=True)
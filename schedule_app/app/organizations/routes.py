@@ -7,7 +7,7 @@ from ..models import Organization, OrganizationMember, User
 from ..models import Invitation
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from sqlalchemy.exc import SQLAlchemyError
-from ..auth.routes import send_email
+from ..outbox import enqueue_email
 from typing import cast
 from ..models import User as UserModel
 
@@ -92,7 +92,7 @@ def invite_member(org_id: int):
             inv = Invitation(email=email, organization_id=org.id, invited_by=current_user.id, role="member")
             try:
                 db.session.add(inv)
-                db.session.commit()
+                db.session.flush()
                 # generate token
                 serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
                 token = serializer.dumps({"inv_id": inv.id}, salt=current_app.config.get("SECURITY_PASSWORD_SALT"))
@@ -120,8 +120,10 @@ def invite_member(org_id: int):
                     landing_url=landing_url,
                     inviter_name=current_user.username,
                 )
-                send_email(subject, str(email), text_body, html=html_body)
-                flash("招待メールを送信しました。受信トレイを確認してください。", "success")
+                # queued in the same transaction as the invitation; the outbox worker sends it
+                enqueue_email(subject, str(email), text_body, html=html_body, kind=f"org_invite:{org.id}")
+                db.session.commit()
+                flash("招待メールの送信を受け付けました。数分以内に相手に届きます。", "success")
             except SQLAlchemyError:
                 db.session.rollback()
                 current_app.logger.exception("招待レコード作成中に DB エラー")
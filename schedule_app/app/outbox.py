@@ -0,0 +1,142 @@
+"""Transactional email outbox.
+
+Web requests call `enqueue_email` instead of `send_email`; the message is added to
+the caller's session and committed together with the rows it belongs to (a new
+user, an invitation, ...), so the request never waits on the mail provider and
+an email is never sent for a transaction that rolled back.
+
+`drain_outbox` (run from the scheduler / tasks runner) claims pending rows with
+row leases, coalesces rows that share a dedupe key, sends them through the
+delivery pool and records the outcome: sent, retried later with exponential
+backoff, or dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+Callers pass a `kind` naming what the message is for ("confirm_email",
+"event_invite:<event id>", ...). Rows with the same recipient and kind that are
+claimed together are sent once, using the newest row, because every resend
+carries a fresh token or link and the latest one is the one to deliver. Without
+a kind, only byte-identical messages are coalesced.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .delivery import OutgoingMessage, backoff_seconds, get_delivery_pool
+from .models import EmailOutbox
+from .utils.pg_lock import claim_rows
+
+
+def _dedupe_key(recipient: str, subject: str, body: str, html: Optional[str], kind: Optional[str] = None) -> str:
+    h = hashlib.sha256()
+    parts = ("kind", kind) if kind else ("content", subject, body, html or "")
+    for part in (recipient.strip().lower(), *parts):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def enqueue_email(subject: str, recipient: str, body: str, html: Optional[str] = None, kind: Optional[str] = None) -> EmailOutbox:
+    """Queue an email in the current transaction. The caller is responsible for committing.
+
+    Queued rows with the same recipient and `kind` are delivered once (the newest).
+    """
+    row = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        html=html,
+        dedupe_key=_dedupe_key(recipient, subject, body, html, kind),
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(row)
+    return row
+
+
+def _send_message(msg: OutgoingMessage) -> bool:
+    # runs on a delivery worker thread (inside an app context); imported lazily
+    # because auth.routes itself enqueues through this module
+    from .auth.routes import send_email
+
+    return send_email(msg.subject, msg.recipient, msg.body, html=msg.html)
+
+
+def drain_outbox(limit: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    """Send one batch of due outbox rows. Returns the number of rows processed."""
+    cfg = current_app.config
+    now = now or datetime.utcnow()
+    limit = limit or int(cfg.get("EMAIL_OUTBOX_BATCH_SIZE", 100))
+    try:
+        rows = claim_rows(
+            EmailOutbox,
+            EmailOutbox.next_attempt_at <= now,
+            EmailOutbox.next_attempt_at,
+            limit,
+            int(cfg.get("EMAIL_OUTBOX_LEASE_SECONDS", 300)),
+            now=now,
+        )
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("drain_outbox: failed to claim rows")
+        return 0
+    if not rows:
+        return 0
+
+    # coalesce rows with one key (double-submitted forms, repeated resends) into one send of the newest
+    groups: dict[str, list[EmailOutbox]] = {}
+    for row in sorted(rows, key=lambda r: r.id):
+        groups.setdefault(row.dedupe_key, []).append(row)
+    provider = str(cfg.get("EMAIL_PROVIDER", "smtp"))
+    messages = [
+        OutgoingMessage(
+            recipient=group[-1].recipient,
+            subject=group[-1].subject,
+            body=group[-1].body,
+            html=group[-1].html,
+            provider=provider,
+            row_ids=[r.id for r in group],
+        )
+        for group in groups.values()
+    ]
+    results = get_delivery_pool().deliver(messages, _send_message)
+
+    by_id = {r.id: r for r in rows}
+    max_attempts = int(cfg.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 8))
+    base = float(cfg.get("EMAIL_OUTBOX_BACKOFF_BASE", 30))
+    cap = float(cfg.get("EMAIL_OUTBOX_BACKOFF_MAX", 3600))
+    try:
+        sent_ids = [rid for r in results if r.ok for rid in r.message.row_ids]
+        if sent_ids:
+            db.session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(sent_ids))
+                .values(status="sent", sent_at=now, claimed_by=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+        for r in results:
+            if r.ok:
+                continue
+            for rid in r.message.row_ids:
+                row = by_id[rid]
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = r.error
+                row.claimed_by = None
+                row.lease_expires_at = None
+                if row.attempts >= max_attempts:
+                    row.status = "dead"
+                    current_app.logger.error("Outbox email %s to %s dead-lettered after %s attempts: %s", row.id, row.recipient, row.attempts, r.error)
+                else:
+                    row.status = "pending"
+                    row.next_attempt_at = now + timedelta(seconds=backoff_seconds(row.attempts, base, cap))
+                    current_app.logger.warning("Outbox email %s to %s failed (attempt %s): %s", row.id, row.recipient, row.attempts, r.error)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("drain_outbox: failed to record results")
+    return len(rows)
@@ -0,0 +1,256 @@
+"""Reminder (Notification row) generation for events.
+
+Offsets are minutes before the start of an occurrence and are resolved per
+recipient: the event's own `reminder_offsets` win, then that recipient's
+`default_reminder_offsets` (set through PUT /api/v1/me/reminder-offsets), then
+the DEFAULT_REMINDER_OFFSETS config value.
+
+Single events get their rows when they are created or edited. Recurring series
+are only materialised up to a rolling horizon (REMINDER_HORIZON_DAYS); the
+`extend_reminder_horizon` job moves each series' `reminders_generated_until`
+forward, so an open-ended weekly series never produces unbounded rows.
+
+Writes that create reminders close to now call `signal_reminders_changed`, so
+the scheduler's timing wheel (see scheduler.ReminderDispatcher) picks them up
+without waiting for its next horizon refill: in-process subscribers are called
+after the transaction commits, and on PostgreSQL a NOTIFY on the
+`reminders_changed` channel reaches other processes on commit as well.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from dateutil import tz as dateutil_tz
+from dateutil.rrule import rrulestr
+from dateutil.tz import tzutc
+from flask import current_app
+from sqlalchemy import event as sa_event, insert, or_, text
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Event, EventParticipant, Notification, User
+from .utils.pg_lock import is_postgres
+
+REMINDERS_CHANNEL = "reminders_changed"
+_subscribers: list[Callable[[set[int]], None]] = []
+
+
+def subscribe_reminder_changes(callback: Callable[[set[int]], None]) -> None:
+    """Call `callback(event_ids)` after each commit that changed near-term reminders."""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+
+def unsubscribe_reminder_changes(callback: Callable[[set[int]], None]) -> None:
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def signal_reminders_changed(event_id: int) -> None:
+    """Record that `event_id`'s reminders changed in the current transaction."""
+    db.session.info.setdefault("reminders_changed", set()).add(event_id)
+    if is_postgres():
+        # NOTIFY is transactional: listeners only see it if this transaction commits
+        db.session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": REMINDERS_CHANNEL, "payload": str(event_id)})
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _publish_reminder_changes(session) -> None:
+    changed = session.info.pop("reminders_changed", None)
+    if not changed:
+        return
+    for callback in list(_subscribers):
+        try:
+            callback(set(changed))
+        except Exception:
+            current_app.logger.exception("reminder change subscriber failed")
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _discard_reminder_changes(session) -> None:
+    session.info.pop("reminders_changed", None)
+
+
+def parse_offsets(raw: Optional[str]) -> list[int]:
+    """Parse "10, 60" into sorted unique minute offsets; invalid parts are ignored."""
+    if not raw:
+        return []
+    out = set()
+    for part in str(raw).split(","):
+        part = part.strip()
+        if part.isdigit():
+            out.add(int(part))
+    return sorted(out)
+
+
+def effective_offsets(event: Event, user: Optional[User] = None) -> list[int]:
+    """Offsets for one recipient of `event` (the owner unless `user` is given)."""
+    user = user if user is not None else event.user
+    return _resolve_offsets(event, getattr(user, "default_reminder_offsets", None) if user else None)
+
+
+def _resolve_offsets(event: Event, user_default: Optional[str]) -> list[int]:
+    return (
+        parse_offsets(event.reminder_offsets)
+        or parse_offsets(user_default)
+        or parse_offsets(current_app.config.get("DEFAULT_REMINDER_OFFSETS", "10"))
+    )
+
+
+def _recipient_ids(event: Event) -> list[int]:
+    ids = [event.user_id]
+    accepted = (
+        db.session.query(EventParticipant.user_id)
+        .filter(EventParticipant.event_id == event.id, EventParticipant.status == "accepted", EventParticipant.user_id != None)  # noqa: E711
+        .all()
+    )
+    for (uid,) in accepted:
+        if uid not in ids:
+            ids.append(uid)
+    return ids
+
+
+def occurrences_between(event: Event, start: datetime, end: datetime) -> list[datetime]:
+    """Occurrence starts (naive UTC) in [start, end) for a recurring event."""
+    event_tz = dateutil_tz.gettz(event.timezone or "UTC") or tzutc()
+    dtstart = event.start_at.replace(tzinfo=tzutc()).astimezone(event_tz)
+    rule = rrulestr(event.rrule, dtstart=dtstart)
+    window_start = start.replace(tzinfo=tzutc()).astimezone(event_tz)
+    window_end = end.replace(tzinfo=tzutc()).astimezone(event_tz)
+    out = []
+    for occ in rule.between(window_start, window_end, inc=True):
+        occ_utc = occ.astimezone(tzutc()).replace(tzinfo=None)
+        if start <= occ_utc < end:
+            out.append(occ_utc)
+    return out
+
+
+def _insert_rows(event: Event, occurrence_starts: list[datetime], now: datetime, user_ids: Optional[list[int]] = None) -> int:
+    if not occurrence_starts:
+        return 0
+    recipients = user_ids if user_ids is not None else _recipient_ids(event)
+    defaults = dict(db.session.query(User.id, User.default_reminder_offsets).filter(User.id.in_(recipients)).all())
+    rows = []
+    for user_id in recipients:
+        offsets = _resolve_offsets(event, defaults.get(user_id))
+        for occ in occurrence_starts:
+            for minutes in offsets:
+                scheduled_at = occ - timedelta(minutes=minutes)
+                if scheduled_at <= now:
+                    continue
+                rows.append({
+                    "event_id": event.id,
+                    "user_id": user_id,
+                    "method": "email",
+                    "scheduled_at": scheduled_at,
+                    "next_attempt_at": scheduled_at,
+                    "occurrence_at": occ,
+                    "sent": False,
+                    "status": "pending",
+                    "created_at": now,
+                })
+    if rows:
+        # one multi-row INSERT instead of an ORM flush per notification
+        db.session.execute(insert(Notification), rows)
+        wheel_horizon = now + timedelta(minutes=int(current_app.config.get("REMINDER_WHEEL_HORIZON_MINUTES", 10)))
+        if min(r["scheduled_at"] for r in rows) < wheel_horizon:
+            signal_reminders_changed(event.id)
+    return len(rows)
+
+
+def generate_reminders(event: Event, now: Optional[datetime] = None) -> int:
+    """Create Notification rows for `event` that don't exist yet. Caller commits.
+
+    Single events get one row per recipient and offset. Recurring events get rows
+    for occurrences between `reminders_generated_until` (or now) and the horizon.
+    """
+    now = now or datetime.utcnow()
+    if not event.rrule:
+        return _insert_rows(event, [event.start_at], now)
+    horizon = now + timedelta(days=int(current_app.config.get("REMINDER_HORIZON_DAYS", 14)))
+    window_start = event.reminders_generated_until or now
+    if window_start >= horizon:
+        return 0
+    try:
+        starts = occurrences_between(event, window_start, horizon)
+    except Exception:
+        current_app.logger.exception("RRULE expansion failed for event %s; no reminders generated", event.id)
+        return 0
+    created = _insert_rows(event, starts, now)
+    event.reminders_generated_until = horizon
+    db.session.add(event)
+    return created
+
+
+def replace_event_reminders(event: Event, now: Optional[datetime] = None) -> int:
+    """Drop the event's pending reminders and regenerate them (after a time/offset change). Caller commits."""
+    db.session.flush()
+    Notification.query.filter(
+        Notification.event_id == event.id,
+        Notification.sent == False,  # noqa: E712
+        Notification.status == "pending",
+    ).delete(synchronize_session=False)
+    event.reminders_generated_until = None
+    return generate_reminders(event, now=now)
+
+
+def sync_participant_reminders(event: Event, user_id: int, now: Optional[datetime] = None) -> int:
+    """Bring one participant's reminders in line with their current status. Caller commits.
+
+    Recipients are resolved when rows are generated, so a participant who accepts
+    later would otherwise get nothing. Drops the user's pending rows for the
+    event and, if they are now an accepted recipient, creates rows for what the
+    other recipients already have (up to `reminders_generated_until` for series).
+    """
+    now = now or datetime.utcnow()
+    if user_id == event.user_id:
+        return 0
+    db.session.flush()
+    Notification.query.filter(
+        Notification.event_id == event.id,
+        Notification.user_id == user_id,
+        Notification.sent == False,  # noqa: E712
+        Notification.status == "pending",
+    ).delete(synchronize_session=False)
+    if user_id not in _recipient_ids(event):
+        return 0
+    if not event.rrule:
+        starts = [event.start_at]
+    else:
+        until = event.reminders_generated_until
+        if until is None or until <= now:
+            return 0
+        try:
+            starts = occurrences_between(event, now, until)
+        except Exception:
+            current_app.logger.exception("RRULE expansion failed for event %s; no reminders generated", event.id)
+            return 0
+    return _insert_rows(event, starts, now, user_ids=[user_id])
+
+
+def extend_reminder_horizon(now: Optional[datetime] = None, chunk_size: int = 200) -> int:
+    """Generate reminder rows for recurring series whose horizon is behind. Returns rows created."""
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(days=int(current_app.config.get("REMINDER_HORIZON_DAYS", 14)))
+    created = 0
+    last_id = 0
+    while True:
+        events = (
+            Event.query.filter(
+                Event.id > last_id,
+                Event.rrule != None,  # noqa: E711
+                Event.rrule != "",
+                or_(Event.reminders_generated_until == None, Event.reminders_generated_until < horizon),  # noqa: E711
+            )
+            .order_by(Event.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not events:
+            break
+        for ev in events:
+            created += generate_reminders(ev, now=now)
+        last_id = events[-1].id
+        db.session.commit()
+    return created
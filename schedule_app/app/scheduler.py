@@ -3,15 +3,37 @@
 This process is intended to run separately from the WSGI workers (e.g. as a separate container or systemd service).
 It uses APScheduler with SQLAlchemyJobStore so job definitions are persisted, and each job should acquire
 an advisory lock in Postgres to ensure single execution across processes.
+
+Reminders are not polled: `ReminderDispatcher` keeps the next few minutes of
+pending notifications in a hierarchical `TimingWheel` and hands each one to
+`jobs.dispatch_notifications` at its exact send time. The wheel is refilled
+from the database as its horizon approaches and updated in between whenever
+reminders.signal_reminders_changed reports new rows (LISTEN/NOTIFY on Postgres).
+
+Several scheduler replicas may run; `LeaderElector` lets exactly one of them
+hold the `leases` row. Only the leader registers jobs (register_jobs clears
+the shared job store) and runs them and the reminder dispatcher; standbys poll
+the lease and take over within SCHEDULER_LEASE_TTL_SECONDS of the leader dying.
 """
 from __future__ import annotations
 
 import logging
+import math
+import os
+import select
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from logging.handlers import RotatingFileHandler
+from typing import Hashable, Iterable, Optional
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from flask import Flask
+from sqlalchemy.exc import SQLAlchemyError
+
 from . import create_app, db
+from .utils.pg_lock import LeaseLock, lease_expired
 from .config import Config
 
 logger = logging.getLogger("scheduler")
@@ -34,29 +56,412 @@ def get_scheduler(app: Flask) -> BackgroundScheduler:
     return sched
 
 
+class TimingWheel:
+    """Hierarchical timing wheel keyed by arbitrary hashable ids.
+
+    Level 0 has `wheel_sizes[0]` slots of one tick each, level 1 slots span a full
+    turn of level 0, and so on (default: seconds, minutes, hours). Adding or
+    removing an entry is O(1); entries in higher levels are cascaded down when
+    the lower wheel wraps, so each entry is touched at most once per level.
+    Entries beyond the top level's span wait in an overflow bucket.
+    """
+
+    def __init__(self, tick: float = 1.0, wheel_sizes: tuple[int, ...] = (60, 60, 24), start: Optional[float] = None) -> None:
+        self.tick = float(tick)
+        self.sizes = tuple(int(n) for n in wheel_sizes)
+        self.granularity = [math.prod(self.sizes[:level]) for level in range(len(self.sizes))]
+        self.span = self.granularity[-1] * self.sizes[-1]
+        self.current = self._to_tick(time.time() if start is None else start, math.floor)
+        self._slots: list[list[set]] = [[set() for _ in range(n)] for n in self.sizes]
+        self._overflow: set = set()
+        # keys already due, in firing order (a dict so membership and removal stay O(1))
+        self._ready: dict[Hashable, None] = {}
+        # key -> (fire tick, bucket holding it)
+        self._entries: dict[Hashable, tuple[int, set]] = {}
+        self._lock = threading.Lock()
+
+    def _to_tick(self, ts: float, rounding=math.ceil) -> int:
+        return int(rounding(ts / self.tick))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries) + len(self._ready)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries or key in self._ready
+
+    def _place(self, key: Hashable, fire_tick: int) -> None:
+        delta = fire_tick - self.current
+        if delta <= 0:
+            self._entries.pop(key, None)
+            self._ready[key] = None
+            return
+        bucket = self._overflow
+        for level, size in enumerate(self.sizes):
+            if delta < self.granularity[level] * size:
+                bucket = self._slots[level][(fire_tick // self.granularity[level]) % size]
+                break
+        bucket.add(key)
+        self._entries[key] = (fire_tick, bucket)
+
+    def _discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[1].discard(key)
+            return True
+        if key in self._ready:
+            del self._ready[key]
+            return True
+        return False
+
+    def add(self, key: Hashable, fire_at: float) -> None:
+        """Schedule `key` to fire at unix time `fire_at` (never earlier); re-adding moves it."""
+        with self._lock:
+            self._discard(key)
+            self._place(key, self._to_tick(fire_at))
+
+    def remove(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._discard(key)
+
+    def advance(self, now: float) -> list:
+        """Move the wheel to `now` and return the keys that became due, in firing order."""
+        target = self._to_tick(now, math.floor)
+        with self._lock:
+            fired, self._ready = list(self._ready), {}
+            while self.current < target:
+                self.current += 1
+                # cascade coarser levels first so their entries can land in this tick's slot
+                for level in range(len(self.sizes) - 1, 0, -1):
+                    if self.current % self.granularity[level]:
+                        continue
+                    slot = self._slots[level][(self.current // self.granularity[level]) % self.sizes[level]]
+                    moving = list(slot)
+                    slot.clear()
+                    for key in moving:
+                        self._place(key, self._entries[key][0])
+                    if level == len(self.sizes) - 1 and self._overflow:
+                        waiting = list(self._overflow)
+                        self._overflow.clear()
+                        for key in waiting:
+                            self._place(key, self._entries[key][0])
+                slot = self._slots[0][self.current % self.sizes[0]]
+                for key in slot:
+                    self._entries.pop(key, None)
+                    fired.append(key)
+                slot.clear()
+                fired.extend(self._ready)
+                self._ready = {}
+            return fired
+
+
+def _epoch(dt: datetime) -> float:
+    # notification times are stored as naive UTC
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class ReminderDispatcher:
+    """Fire pending reminders at their exact send time from an in-memory timing wheel.
+
+    Only notifications due within REMINDER_WHEEL_HORIZON_MINUTES are loaded; the
+    wheel is refilled from the database once half of that horizon has elapsed.
+    Overdue rows (e.g. the backlog after an outage) are loaded oldest first at
+    most REMINDER_WHEEL_OVERDUE_BATCH at a time; while more are waiting, every
+    tick refills and fires the next page. Rows stuck in 'processing' after
+    their claim lease expired (a crashed worker) are part of that page, so
+    they are retried without waiting for the `run_due_jobs` fallback.
+    Event ids reported by `reminders.subscribe_reminder_changes` (and, on
+    Postgres, NOTIFY on the reminders channel from other processes) are reloaded
+    immediately. Delivery goes through `jobs.dispatch_notifications`, which claims
+    the rows first, so the dispatcher and `run_due_jobs` never send twice.
+    """
+
+    def __init__(self, app: Flask, wheel: Optional[TimingWheel] = None) -> None:
+        self.app = app
+        self.horizon = timedelta(minutes=int(app.config.get("REMINDER_WHEEL_HORIZON_MINUTES", 10)))
+        self.wheel = wheel or TimingWheel(tick=float(app.config.get("REMINDER_WHEEL_TICK_SECONDS", 1)))
+        self.overdue_batch = max(1, int(app.config.get("REMINDER_WHEEL_OVERDUE_BATCH", 500)))
+        self.loaded_until: Optional[datetime] = None
+        self._overdue_backlog = False
+        self._changed: set[int] = set()
+        self._changed_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def notify_changed(self, event_ids: Iterable[int]) -> None:
+        with self._changed_lock:
+            self._changed.update(event_ids)
+
+    def _load(self, query, now: datetime) -> int:
+        from .models import Notification
+
+        until = now + self.horizon
+        unsent = query.filter(Notification.sent == False).with_entities(Notification.id, Notification.next_attempt_at)  # noqa: E712
+        pending = unsent.filter(Notification.status == "pending")
+        oldest_first = (Notification.next_attempt_at, Notification.id)
+        # claims left behind by a crashed worker (what claim_rows would reclaim) come first in the overdue page
+        overdue = unsent.filter(lease_expired(Notification, now)).order_by(*oldest_first).limit(self.overdue_batch).all()
+        if len(overdue) < self.overdue_batch:
+            overdue += (
+                pending.filter(Notification.next_attempt_at < now)
+                .order_by(*oldest_first)
+                .limit(self.overdue_batch - len(overdue))
+                .all()
+            )
+        if len(overdue) >= self.overdue_batch:
+            self._overdue_backlog = True
+        rows = overdue + pending.filter(Notification.next_attempt_at >= now, Notification.next_attempt_at < until).all()
+        for nid, fire_at in rows:
+            self.wheel.add(nid, _epoch(fire_at))
+        return len(rows)
+
+    def refill(self, now: Optional[datetime] = None) -> int:
+        """Load pending reminders due before now + horizon and the oldest page of overdue ones (fired on the next tick)."""
+        from .models import Notification
+
+        now = now or datetime.utcnow()
+        self._overdue_backlog = False
+        loaded = self._load(Notification.query, now)
+        self.loaded_until = now + self.horizon
+        logger.info("Reminder wheel refilled: %s notification(s) until %s", loaded, self.loaded_until)
+        return loaded
+
+    def reload_events(self, event_ids: Iterable[int], now: Optional[datetime] = None) -> int:
+        from .models import Notification
+
+        event_ids = list(event_ids)
+        if not event_ids:
+            return 0
+        return self._load(Notification.query.filter(Notification.event_id.in_(event_ids)), now or datetime.utcnow())
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """One dispatcher step: refill or apply changes, then deliver whatever came due."""
+        from . import jobs
+
+        now = now or datetime.utcnow()
+        if self.loaded_until is None or now >= self.loaded_until - self.horizon / 2 or self._overdue_backlog:
+            self.refill(now)
+        with self._changed_lock:
+            changed, self._changed = self._changed, set()
+        if changed:
+            self.reload_events(changed, now)
+        due = self.wheel.advance(_epoch(now))
+        if not due:
+            return 0
+        sent = jobs.dispatch_notifications(due, now=now)
+        # failed sends were pushed back with a later next_attempt_at; put those back on the wheel
+        self._load(self._query_ids(due), now)
+        return sent
+
+    @staticmethod
+    def _query_ids(ids: list[int]):
+        from .models import Notification
+
+        return Notification.query.filter(Notification.id.in_(ids))
+
+    def _run(self) -> None:
+        from .reminders import subscribe_reminder_changes
+
+        subscribe_reminder_changes(self.notify_changed)
+        while not self._stop.is_set():
+            started = time.monotonic()
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except Exception:
+                    logger.exception("Reminder dispatcher tick failed")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            self._stop.wait(max(0.0, self.wheel.tick - (time.monotonic() - started)))
+
+    def _listen(self) -> None:
+        """Forward NOTIFY payloads from other processes into `notify_changed` (Postgres only)."""
+        from .reminders import REMINDERS_CHANNEL
+
+        with self.app.app_context():
+            url = db.engine.url
+        try:
+            import psycopg2
+        except ImportError:
+            return
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(url.set(drivername="postgresql").render_as_string(hide_password=False))
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {REMINDERS_CHANNEL}")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    ids = set()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        if payload.isdigit():
+                            ids.add(int(payload))
+                    if ids:
+                        self.notify_changed(ids)
+            except Exception:
+                logger.exception("Reminder LISTEN connection failed; retrying")
+                self._stop.wait(5)
+
+    def start(self) -> None:
+        self._threads = [threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)]
+        with self.app.app_context():
+            postgres = db.engine.dialect.name == "postgresql"
+        if postgres:
+            self._threads.append(threading.Thread(target=self._listen, name="reminder-listener", daemon=True))
+        for t in self._threads:
+            t.start()
+        logger.info("Reminder dispatcher started (horizon=%s, tick=%ss)", self.horizon, self.wheel.tick)
+
+    def stop(self) -> None:
+        from .reminders import unsubscribe_reminder_changes
+
+        self._stop.set()
+        unsubscribe_reminder_changes(self.notify_changed)
+        for t in self._threads:
+            t.join(timeout=10)
+
+
+_app: Optional[Flask] = None
+_app_pid: Optional[int] = None
+_app_lock = threading.Lock()
+
+
+def get_app() -> Flask:
+    """Return the process-wide Flask app used to run jobs, creating it on first use.
+
+    Building an app re-registers every blueprint, creates a new engine and
+    connection pool and adds another log handler, so it happens once per process
+    (again after a fork) rather than once per job.
+    """
+    global _app, _app_pid
+    app = _app
+    if app is not None and _app_pid == os.getpid():
+        return app
+    with _app_lock:
+        if _app is None or _app_pid != os.getpid():
+            _app = create_app()
+            _app_pid = os.getpid()
+        return _app
+
+
+def set_app(app: Flask) -> None:
+    """Use `app` for job execution in this process (the runner's own app)."""
+    global _app, _app_pid
+    with _app_lock:
+        _app = app
+        _app_pid = os.getpid()
+
+
+def shutdown_app() -> None:
+    """Flush job telemetry, then dispose the cached app's engine and pooled mail/HTTP connections."""
+    global _app, _app_pid
+    with _app_lock:
+        app, _app, _app_pid = _app, None, None
+    if app is None:
+        return
+    from .job_runs import flush_job_runs
+    from .utils.http_client import close_session
+    from .utils.mail_transport import close_all
+
+    with app.app_context():
+        flush_job_runs()
+        pool = app.extensions.pop("delivery_pool", None)
+        if pool is not None:
+            pool.shutdown()
+        db.engine.dispose()
+    close_all()
+    close_session()
+
+
+class LeaderElector(LeaseLock):
+    """Scheduler leadership: whoever holds the unexpired lease row is the leader.
+
+    Acquire and renew are single guarded UPDATEs (see pg_lock.LeaseLock), so two
+    processes can never both believe they hold the lease; each change of holder
+    increments `fencing_token`. Database errors count as not holding the lease.
+    """
+
+    @property
+    def is_leader(self) -> bool:
+        return self.held
+
+    def try_acquire(self, now: Optional[datetime] = None) -> bool:
+        """Renew the lease if we hold it, otherwise take it if it is free or expired."""
+        try:
+            return self.renew(now) if self.held else self.acquire(now)
+        except SQLAlchemyError:
+            logger.exception("Leader election: lease %s unavailable", self.name)
+            self.token = None
+            return False
+
+    def release(self) -> None:
+        try:
+            super().release()
+        except SQLAlchemyError:
+            logger.exception("Leader election: releasing lease %s failed", self.name)
+            self.token = None
+
+
 def run_job_in_app_context(module_name: str, func_name: str, *a, **kw):
-    """Import and run a function inside a fresh Flask app context.
+    """Import and run a function inside an application context.
 
     This function is importable by textual reference (module:function) so it can be
     stored by APScheduler as a string reference. The dispatcher will import the
-    target function by module/name and execute it inside a newly created
-    application context (calls `create_app()` each time).
+    target function by module/name and execute it inside an application context of
+    the process-wide app from `get_app()`. Each run is recorded in job_runs.
     """
     try:
-        # Create an app for the scheduler execution context
-        app = create_app()
+        app = get_app()
         # Import the target module and fetch the callable
         import importlib
 
+        from .job_runs import track_job_run
+
         mod = importlib.import_module(module_name)
         fn = getattr(mod, func_name)
+        job_id = (getattr(fn, "job_meta", None) or {}).get("id", func_name)
         with app.app_context():
-            return fn(*a, **kw)
+            with track_job_run(job_id, source="scheduler") as run:
+                result = fn(*a, **kw)
+                if isinstance(result, int) and not isinstance(result, bool):
+                    run.rows_processed = result
+            return result
     except Exception:
         logger.exception("Failed to run job %s.%s in app context", module_name, func_name)
         raise
 
 
+# @job(...) meta keys passed through to each APScheduler trigger type
+TRIGGER_KEYS = {
+    "interval": ("weeks", "days", "hours", "minutes", "seconds", "start_date", "end_date", "timezone", "jitter"),
+    "cron": (
+        "year", "month", "day", "week", "day_of_week", "hour", "minute", "second",
+        "start_date", "end_date", "timezone", "jitter",
+    ),
+    "date": ("run_date", "timezone"),
+}
+# @job(...) meta keys passed through to add_job itself
+JOB_OPTION_KEYS = ("coalesce", "max_instances", "misfire_grace_time")
+
+
+def job_trigger_kwargs(meta: dict) -> Optional[dict]:
+    """Trigger arguments for a job's meta, or None when the schedule type is unsupported."""
+    schedule_type = meta.get("schedule", "interval")
+    keys = TRIGGER_KEYS.get(schedule_type)
+    if keys is None:
+        return None
+    trigger_kwargs = {k: meta[k] for k in keys if k in meta}
+    if schedule_type == "interval" and not set(trigger_kwargs) & {"weeks", "days", "hours", "minutes", "seconds"}:
+        # sensible default if none provided
+        trigger_kwargs["minutes"] = 15
+    return trigger_kwargs
+
+
 def register_jobs(scheduler: BackgroundScheduler, app: Flask):
     """Import and register jobs here.
 
@@ -103,30 +508,25 @@ def register_jobs(scheduler: BackgroundScheduler, app: Flask):
             schedule_type = meta.get("schedule", "interval")
             job_id = meta.get("id", name)
             try:
+                trigger_kwargs = job_trigger_kwargs(meta)
+                if trigger_kwargs is None:
+                    logger.info("Unsupported schedule type %s for job %s", schedule_type, name)
+                    continue
                 # textual reference to the dispatcher in this module
                 dispatcher_ref = f"{__name__}:run_job_in_app_context"
                 kwargs = {"id": job_id, "replace_existing": True}
-                if schedule_type == "interval":
-                    interval_kwargs = {}
-                    # copy supported interval args if provided
-                    for k in ("weeks", "days", "hours", "minutes", "seconds"):
-                        if k in meta:
-                            interval_kwargs[k] = meta[k]
-                    if not interval_kwargs:
-                        # sensible default if none provided
-                        interval_kwargs["minutes"] = 15
-                    # Pass the target function's module and name as the first
-                    # two positional args to the dispatcher.
-                    scheduler.add_job(
-                        dispatcher_ref,
-                        "interval",
-                        args=[fn.__module__, fn.__name__],
-                        **interval_kwargs,
-                        **kwargs,
-                    )
-                else:
-                    logger.info("Unsupported schedule type %s for job %s", schedule_type, name)
-                    continue
+                for k in JOB_OPTION_KEYS:
+                    if k in meta:
+                        kwargs[k] = meta[k]
+                # Pass the target function's module and name as the first
+                # two positional args to the dispatcher.
+                scheduler.add_job(
+                    dispatcher_ref,
+                    schedule_type,
+                    args=[fn.__module__, fn.__name__],
+                    **trigger_kwargs,
+                    **kwargs,
+                )
                 registered += 1
                 logger.info("Registered job %s (via dispatcher) schedule=%s meta=%s", job_id, schedule_type, meta)
             except Exception:
@@ -138,21 +538,48 @@ def register_jobs(scheduler: BackgroundScheduler, app: Flask):
 
 
 def run():
-    app = create_app()
+    app = get_app()
     setup_logging()
 
     scheduler = get_scheduler(app)
-    register_jobs(scheduler, app)
+    heartbeat = float(app.config.get("SCHEDULER_HEARTBEAT_SECONDS", 5))
+    dispatcher: Optional[ReminderDispatcher] = None
+    leading = False
 
-    # Start scheduler inside app context
     with app.app_context():
-        scheduler.start()
-        logger.info("Scheduler started")
+        elector = LeaderElector(
+            app.config.get("SCHEDULER_LEASE_NAME", "scheduler-leader"),
+            ttl=float(app.config.get("SCHEDULER_LEASE_TTL_SECONDS", 15)),
+        )
+        logger.info("Scheduler %s started; waiting for leadership", elector.holder)
         try:
-            # Keep the process alive; APScheduler runs in background threads
-            import time
             while True:
-                time.sleep(60)
+                if elector.try_acquire():
+                    if not leading:
+                        # only the leader touches the shared job store (register_jobs clears it)
+                        register_jobs(scheduler, app)
+                        if scheduler.running:
+                            scheduler.resume()
+                        else:
+                            scheduler.start()
+                        if app.config.get("REMINDER_DISPATCHER_ENABLED", True):
+                            dispatcher = ReminderDispatcher(app)
+                            dispatcher.start()
+                        leading = True
+                        logger.info("Became scheduler leader (fencing token %s)", elector.token)
+                elif leading:
+                    logger.warning("Lost scheduler leadership; pausing jobs")
+                    scheduler.pause()
+                    if dispatcher is not None:
+                        dispatcher.stop()
+                        dispatcher = None
+                    leading = False
+                time.sleep(heartbeat)
         except (KeyboardInterrupt, SystemExit):
             logger.info("Shutting down scheduler")
-            scheduler.shutdown()
+            if dispatcher is not None:
+                dispatcher.stop()
+            if scheduler.running:
+                scheduler.shutdown()
+            elector.release()
+            shutdown_app()
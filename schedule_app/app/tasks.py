@@ -2,71 +2,188 @@
 
 Run with:
   python -m schedule_app.app.tasks run
-
-This module will import `schedule_app.app.jobs` if present and attempt to run
-`run_due_jobs()` or fallback known job functions. Each top-level invocation is
-guarded by a Postgres advisory lock via `pg_lock` to avoid duplicate execution
-across replicas/processes.
+  python -m schedule_app.app.tasks run --jobs run_due_jobs,refresh_external_accounts
+  python -m schedule_app.app.tasks run --loop --interval 30
+
+Without `--jobs` this runs `run_due_jobs()` from `schedule_app.app.jobs` (or a
+fallback known job). Jobs that claim their own rows (`FOR UPDATE SKIP LOCKED`)
+are safe to run from several replicas at once; the others are guarded by a
+job lock via `pg_lock.job_lock` (lease or advisory, per JOB_LOCK_BACKEND) to
+avoid duplicate execution.
+
+`--loop` keeps one app, engine and connection pool for the life of the process
+instead of paying interpreter start-up and `create_app()` per CronJob run. It
+sleeps `--interval` seconds between passes, halving the sleep (down to
+`--min-interval`) while passes keep finding work, and exits cleanly after the
+current pass on SIGTERM/SIGINT.
 """
 from __future__ import annotations
 
+import argparse
 import logging
+import signal
 import sys
+import threading
+from contextlib import ExitStack
 
-from . import create_app
+from . import create_app, db
 
 
 logger = logging.getLogger("tasks")
 
-
-def _run_app_tasks():
-    app = create_app()
+# jobs that claim individual rows and may run on several replicas concurrently
+ROW_CLAIMING_JOBS = {"run_due_jobs", "drain_email_outbox", "refresh_external_accounts"}
+
+
+def _resolve_jobs(names: list[str] | None) -> list[tuple[str, object]]:
+    """Map job names (function names or @job ids) to callables in schedule_app.app.jobs."""
+    from . import jobs as jobs_module
+
+    if not names:
+        # Prefer a consolidated runner function, then known per-job fallbacks
+        for fallback in ("run_due_jobs", "cleanup_old_events"):
+            fn = getattr(jobs_module, fallback, None)
+            if callable(fn):
+                return [(fallback, fn)]
+        logger.warning("No jobs found in schedule_app.app.jobs; nothing to run")
+        return []
+    by_id = {}
+    for attr in dir(jobs_module):
+        fn = getattr(jobs_module, attr)
+        meta = getattr(fn, "job_meta", None)
+        if callable(fn) and meta:
+            by_id[meta.get("id", attr)] = (attr, fn)
+    out = []
+    for name in names:
+        fn = getattr(jobs_module, name, None)
+        if callable(fn) and (name == "run_due_jobs" or getattr(fn, "job_meta", None)):
+            out.append((name, fn))
+        elif name in by_id:
+            out.append(by_id[name])
+        else:
+            raise SystemExit(f"Unknown job: {name}")
+    return out
+
+
+def _run_pass(app, jobs: list[tuple[str, object]]) -> int:
+    """Run each job once inside the app context; returns total rows processed."""
+    from .job_runs import flush_job_runs
+
+    processed = 0
     with app.app_context():
-        logger.info("Starting tasks runner")
-        # Prefer a consolidated runner function in schedule_app.app.jobs
         try:
-            from .jobs import run_due_jobs  # type: ignore
-
-            fn_name = "run_due_jobs"
-            fn = run_due_jobs
+            for fn_name, fn in jobs:
+                processed += _run_tracked(fn_name, fn)
+        finally:
+            flush_job_runs()
+            # hand the connection back to the pool between passes
+            db.session.remove()
+    return processed
+
+
+def _run_loop(app, jobs: list[tuple[str, object]], interval: float, min_interval: float, stop: threading.Event) -> None:
+    sleep = interval
+    while not stop.is_set():
+        processed = _run_pass(app, jobs)
+        # backlog: come back sooner while passes keep finding work; relax once idle
+        sleep = max(min_interval, sleep / 2) if processed else interval
+        logger.info("Pass processed %s row(s); sleeping %.1fs", processed, sleep)
+        stop.wait(sleep)
+
+
+def _install_signal_handlers(stop: threading.Event) -> None:
+    def _handle(signum, frame):
+        logger.info("Received signal %s; stopping after the current pass", signum)
+        stop.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _handle)
+
+
+def _run_tracked(fn_name, fn) -> int:
+    """Run one job and record it in job_runs (source 'tasks'); returns rows processed."""
+    from .job_runs import track_job_run
+
+    def _call(run) -> int:
+        result = fn()
+        if isinstance(result, int) and not isinstance(result, bool):
+            run.rows_processed = result
+            return result
+        return 0
+
+    # row-claiming jobs may run concurrently on replicas; only the others need the
+    # whole-job lock.
+    if fn_name in ROW_CLAIMING_JOBS:
+        logger.info("Running %s without job lock (row-level claiming)", fn_name)
+        try:
+            with track_job_run(fn_name, source="tasks") as run:
+                processed = _call(run)
+            logger.info("Job %s finished", fn_name)
+            return processed
         except Exception:
-            # Fallbacks: known per-job functions
-            try:
-                from .jobs import cleanup_old_events  # type: ignore
+            logger.exception("Job %s failed", fn_name)
+            return 0
 
-                fn_name = "cleanup_old_events"
-                fn = cleanup_old_events
-            except Exception:
-                logger.warning("No jobs found in schedule_app.app.jobs; nothing to run")
-                return
+    # Take the job lock to ensure single execution across processes. Only a failure to
+    # *acquire* it falls back to an unlocked run; an error from the job itself (including
+    # LeaseLost from the fencing check) is logged and recorded once and never re-run.
+    from .utils.pg_lock import job_lock
 
-        # Use Postgres advisory lock to ensure single execution across processes
-        try:
-            from .utils.pg_lock import pg_try_advisory_lock
-
-            with pg_try_advisory_lock(fn_name) as locked:
-                if not locked:
-                    logger.info("Lock not acquired for %s, skipping", fn_name)
-                    return
-                logger.info("Lock acquired for %s, running job", fn_name)
-                fn()
-                logger.info("Job %s finished", fn_name)
-        except Exception:
-            # If pg_lock isn't available or Postgres not configured, run once and log
-            logger.exception("pg_lock failed or not available; attempting to run job directly")
+    try:
+        with track_job_run(fn_name, source="tasks") as run, ExitStack() as stack:
             try:
-                fn()
+                locked = stack.enter_context(job_lock(fn_name))
             except Exception:
-                logger.exception("Job %s failed", fn_name)
+                # e.g. JOB_LOCK_BACKEND=advisory without Postgres
+                logger.exception("Job lock for %s not available; running without it", fn_name)
+                locked = True
+            if not locked:
+                logger.info("Lock not acquired for %s, skipping", fn_name)
+                return 0
+            logger.info("Running job %s", fn_name)
+            processed = _call(run)
+            logger.info("Job %s finished", fn_name)
+            return processed
+    except Exception:
+        logger.exception("Job %s failed", fn_name)
+        return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m schedule_app.app.tasks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run jobs once, or continuously with --loop")
+    run.add_argument("--jobs", default="", help="comma-separated job names or @job ids (default: run_due_jobs)")
+    run.add_argument("--loop", action="store_true", help="keep running passes until SIGTERM")
+    run.add_argument("--interval", type=float, default=30.0, help="seconds between passes when idle (default 30)")
+    run.add_argument("--min-interval", type=float, default=1.0, help="shortest sleep while there is a backlog (default 1)")
+    return parser
 
 
 def main(argv: list[str] | None = None) -> int:
-    argv = argv or sys.argv[1:]
-    if not argv or argv[0] != "run":
-        print("Usage: python -m schedule_app.app.tasks run")
-        return 2
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit as exc:
+        return int(exc.code or 0)
     logging.basicConfig(level=logging.INFO)
-    _run_app_tasks()
+    app = create_app()
+    logger.info("Starting tasks runner")
+    with app.app_context():
+        jobs = _resolve_jobs([n.strip() for n in args.jobs.split(",") if n.strip()])
+    if not jobs:
+        return 0
+    if not args.loop:
+        _run_pass(app, jobs)
+        return 0
+    stop = threading.Event()
+    _install_signal_handlers(stop)
+    try:
+        _run_loop(app, jobs, max(args.interval, 0.1), max(min(args.min_interval, args.interval), 0.1), stop)
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        logger.info("Tasks runner stopped")
     return 0
 
 
@@ -0,0 +1,17 @@
+"""Entry point for `python -m schedule_app.app.tasks`.
+
+This package (the ToDo blueprint) shadows the sibling `tasks.py` job runner
+module, so `-m` lands here; load the runner from its file and delegate to it.
+"""
+import importlib.util
+import os
+import sys
+
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tasks.py")
+_spec = importlib.util.spec_from_file_location("schedule_app.app._tasks_runner", _path)
+_runner = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = _runner
+_spec.loader.exec_module(_runner)
+
+if __name__ == "__main__":
+    raise SystemExit(_runner.main())
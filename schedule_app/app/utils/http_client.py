@@ -0,0 +1,168 @@
+"""Process-wide HTTP client for outbound API calls (calendar providers, OAuth, Resend).
+
+Every call goes through one `requests.Session` per process, so connections to
+a host are kept alive and reused instead of paying a TCP/TLS handshake per
+request. The session's adapter adds:
+
+- timeouts: HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT when the caller passes none,
+- retries with exponential backoff (HTTP_MAX_RETRIES, HTTP_RETRY_BACKOFF) on
+  connection errors and on 500/502/503/504 — status retries only for idempotent
+  methods (GET, HEAD, PUT, DELETE, OPTIONS), so a POST is never sent twice after
+  the server has seen it; 429 is left to the caller (see integrations.worker),
+- per-host metrics (`host_metrics()`): requests, errors, retries, status
+  classes and time spent.
+
+Settings come from the Flask config when the session is first created inside
+an app context, else from the environment. The session is recreated after a
+fork (gunicorn workers must not share sockets) and closed by `close_session()`.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    total_ms: float = 0.0
+    statuses: dict = field(default_factory=dict)  # "2xx" -> count
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.requests, 3) if self.requests else 0.0,
+            "statuses": dict(self.statuses),
+        }
+
+
+_metrics: dict[str, HostStats] = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(host: str, elapsed_ms: float, status: Optional[int], retries: int) -> None:
+    with _metrics_lock:
+        stats = _metrics.setdefault(host, HostStats())
+        stats.requests += 1
+        stats.total_ms += elapsed_ms
+        stats.retries += retries
+        if status is None:
+            stats.errors += 1
+        else:
+            key = f"{status // 100}xx"
+            stats.statuses[key] = stats.statuses.get(key, 0) + 1
+            if status >= 500:
+                stats.errors += 1
+
+
+def host_metrics() -> dict[str, dict]:
+    """Snapshot of the per-host counters since process start (or `reset_metrics`)."""
+    with _metrics_lock:
+        return {host: stats.as_dict() for host, stats in _metrics.items()}
+
+
+def reset_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+
+class MeteredAdapter(HTTPAdapter):
+    """HTTPAdapter that applies default timeouts and records per-host metrics."""
+
+    def __init__(self, timeout: tuple[float, float], **kwargs) -> None:
+        self.default_timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        host = urlsplit(request.url).netloc
+        started = time.monotonic()
+        try:
+            resp = super().send(request, stream=stream, timeout=timeout or self.default_timeout, verify=verify, cert=cert, proxies=proxies)
+        except requests.RequestException:
+            _record(host, (time.monotonic() - started) * 1000, None, 0)
+            raise
+        retries = getattr(getattr(resp.raw, "retries", None), "history", ()) or ()
+        _record(host, (time.monotonic() - started) * 1000, resp.status_code, len(retries))
+        return resp
+
+
+def _setting(name: str, default: str) -> str:
+    if has_app_context() and current_app.config.get(name) is not None:
+        return str(current_app.config[name])
+    return os.getenv(name, default)
+
+
+def _build_session() -> requests.Session:
+    retries = Retry(
+        total=int(_setting("HTTP_MAX_RETRIES", "3")),
+        backoff_factor=float(_setting("HTTP_RETRY_BACKOFF", "0.5")),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        # hand the final error response back instead of raising, and never sleep for a
+        # server-chosen Retry-After inside a request; callers decide how to back off
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = MeteredAdapter(
+        timeout=(float(_setting("HTTP_CONNECT_TIMEOUT", "5")), float(_setting("HTTP_READ_TIMEOUT", "10"))),
+        max_retries=retries,
+        pool_connections=int(_setting("HTTP_POOL_HOSTS", "10")),
+        pool_maxsize=int(_setting("HTTP_POOL_MAXSIZE", "16")),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return this process's shared session, creating it on first use (and after a fork)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def close_session() -> None:
+    """Close pooled connections (process shutdown); the next call opens a new session."""
+    global _session, _session_pid
+    with _session_lock:
+        session, _session, _session_pid = _session, None, None
+    if session is not None:
+        session.close()
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_session().get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return get_session().post(url, **kwargs)
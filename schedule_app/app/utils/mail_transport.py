@@ -0,0 +1,218 @@
+"""Pooled, reusable transports for outgoing email.
+
+`send_email` used to open a fresh SMTP connection (TCP + STARTTLS + AUTH) for
+every message. `SMTPConnectionPool` keeps a small set of authenticated
+connections per process and hands them out to threads one at a time:
+
+- idle connections are health-checked with NOOP before reuse,
+- a connection found broken before the message went out (disconnected, reset)
+  is discarded and the message is retried once on a fresh connection; once DATA
+  has started the message is never resent, since the server may already have
+  accepted it, and a rejection from the server (e.g. 550 on RCPT) is raised
+  with the connection returned to the pool,
+- connections are retired after `max_messages` sends so long-lived sessions
+  don't run into provider-side limits.
+
+The Resend provider goes through the shared HTTP session in `http_client`, so
+its HTTPS connections are kept alive between calls as well.
+"""
+from __future__ import annotations
+
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Callable
+
+
+@dataclass
+class _PooledConnection:
+    smtp: smtplib.SMTP
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    messages_sent: int = 0
+    # set once the current send reached DATA; from then on it must not be retried
+    in_data: bool = False
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of logged-in SMTP connections to one server."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_tls: bool = True,
+        username: str = "",
+        password: str = "",
+        max_size: int = 4,
+        max_messages: int = 100,
+        health_check_after: float = 30.0,
+        timeout: float = 10.0,
+        smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.max_size = max(1, int(max_size))
+        self.max_messages = max(1, int(max_messages))
+        self.health_check_after = float(health_check_after)
+        self.timeout = float(timeout)
+        self._smtp_factory = smtp_factory
+        self._idle: deque[_PooledConnection] = deque()
+        self._lock = threading.Lock()
+        # bounds the number of connections in use or idle at any one time
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self.connections_opened = 0
+
+    def _connect(self) -> _PooledConnection:
+        smtp = self._smtp_factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            self._close_quietly(smtp)
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        conn = _PooledConnection(smtp)
+        send_data = smtp.data
+
+        def data(msg):
+            conn.in_data = True
+            return send_data(msg)
+
+        smtp.data = data  # type: ignore[method-assign]
+        return conn
+
+    @staticmethod
+    def _close_quietly(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        try:
+            code, _ = conn.smtp.noop()
+            return code == 250
+        except Exception:
+            return False
+
+    def _checkout(self) -> _PooledConnection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._is_healthy(conn):
+                return conn
+            self._close_quietly(conn.smtp)
+
+    def _checkin(self, conn: _PooledConnection) -> None:
+        conn.last_used = time.monotonic()
+        if conn.messages_sent >= self.max_messages:
+            self._close_quietly(conn.smtp)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def _send(self, conn: _PooledConnection, msg: EmailMessage) -> None:
+        conn.in_data = False
+        try:
+            conn.smtp.send_message(msg)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+            # the server answered and smtplib has RSET the session: the connection is
+            # still usable unless the server is closing it (421)
+            if getattr(e, "smtp_code", None) == 421:
+                self._close_quietly(conn.smtp)
+            else:
+                self._checkin(conn)
+            raise
+        except Exception:
+            self._close_quietly(conn.smtp)
+            raise
+        conn.messages_sent += 1
+        self._checkin(conn)
+
+    def send_message(self, msg: EmailMessage) -> None:
+        """Send `msg` on a pooled connection, reconnecting once if it was broken before DATA."""
+        with self._slots:
+            conn = self._checkout()
+            try:
+                self._send(conn, msg)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                raise
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if conn.in_data:
+                    raise
+                # stale connection: retry on a fresh one
+                self._send(self._connect(), msg)
+
+    def close(self) -> None:
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            self._close_quietly(conn.smtp)
+
+
+_pools: dict[tuple, SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def _reset_after_fork() -> None:
+    # sockets must not be shared with a forked child (e.g. gunicorn workers)
+    global _pools_pid
+    if os.getpid() != _pools_pid:
+        _pools.clear()
+        _pools_pid = os.getpid()
+
+
+def get_smtp_pool(config) -> SMTPConnectionPool:
+    """Return the process-wide pool for the SMTP settings in `config` (a Flask config mapping)."""
+    key = (
+        str(config.get("MAIL_SERVER")),
+        int(config.get("MAIL_PORT") or 0),
+        bool(config.get("MAIL_USE_TLS")),
+        str(config.get("MAIL_USERNAME") or ""),
+    )
+    with _pools_lock:
+        _reset_after_fork()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(
+                host=key[0],
+                port=key[1],
+                use_tls=key[2],
+                username=key[3],
+                password=str(config.get("MAIL_PASSWORD") or ""),
+                max_size=int(config.get("MAIL_POOL_SIZE", 4)),
+                max_messages=int(config.get("MAIL_MAX_MESSAGES_PER_CONNECTION", 100)),
+                health_check_after=float(config.get("MAIL_POOL_HEALTH_CHECK_SECONDS", 30)),
+                timeout=float(config.get("MAIL_TIMEOUT", 10)),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def close_all() -> None:
+    """Close every pooled SMTP connection (e.g. on process shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -1,17 +1,114 @@
-"""Postgres advisory lock context manager and decorator.
+"""Job lock context managers and decorator.
 
-Uses PostgreSQL advisory locks (pg_try_advisory_lock / pg_advisory_unlock) to ensure
-that a named job only runs in one process at a time. Lock keys should be integers; we compute
-a 64-bit key by hashing a string job id.
+Two backends ensure that a named job only runs in one process at a time:
+
+- advisory: PostgreSQL advisory locks (pg_try_advisory_lock / pg_advisory_unlock).
+  Lock keys should be integers; we compute a 64-bit key by hashing a string job id.
+  The lock lives as long as the connection holding it, so a hung process holds it forever.
+- lease: a row in the `leases` table with a TTL, renewed by a heartbeat thread while
+  the job runs. A crashed or hung holder loses the lock once the TTL passes. Every
+  acquisition increments the row's fencing token; a job checks it with
+  `LeaseHandle.assert_held()` before committing, so a holder whose lease was taken
+  over can't overwrite the new holder's work. Works on SQLite for local runs.
+
+`job_lock` / `single_instance` pick the backend from JOB_LOCK_BACKEND (default
+'advisory'). Fencing only protects jobs that call `assert_held()` before they
+commit; today that is `cleanup_old_events`.
 """
 from __future__ import annotations
 
 import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
 from contextlib import contextmanager
-from typing import Generator
-from sqlalchemy import text
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Generator, Optional
+from flask import current_app
+from sqlalchemy import and_, insert, literal_column, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
 from .. import db
 
+logger = logging.getLogger(__name__)
+
+
+def is_postgres() -> bool:
+    """Return True when the session is bound to PostgreSQL.
+
+    Row-level locking helpers (``FOR UPDATE SKIP LOCKED``) and advisory locks are
+    Postgres-only; callers use this to fall back to portable SQL on SQLite.
+    """
+    try:
+        return db.session.get_bind().dialect.name == "postgresql"
+    except Exception:
+        return False
+
+
+def worker_id() -> str:
+    """Identifier for this process, recorded on rows it claims."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_expired(model, now: datetime):
+    """Rows claimed under a lease that has run out (the worker died mid-batch)."""
+    return and_(model.status == "processing", model.lease_expires_at < now)
+
+
+def _candidate_ids(model, criteria, order_by, limit: int) -> list[int]:
+    q = db.session.query(model.id).filter(criteria).order_by(order_by).limit(limit)
+    if is_postgres():
+        q = q.with_for_update(skip_locked=True)
+    return [row[0] for row in q.all()]
+
+
+def claim_rows(model, ready, order_by, limit: int, lease_seconds: int, owner: str | None = None, now: datetime | None = None) -> list:
+    """Claim up to `limit` queue rows of `model` matching `ready` and return them.
+
+    `model` must have ``status``, ``claimed_by`` and ``lease_expires_at`` columns.
+    Claimed rows move from 'pending' to 'processing' with a lease; a claim whose
+    lease has expired (the worker died mid-batch) becomes claimable again. On
+    Postgres the candidate rows are selected with ``FOR UPDATE SKIP LOCKED`` so
+    concurrent workers never block on or double-claim the same rows. On SQLite
+    the row lock is skipped and the guarded UPDATE is what keeps claims exclusive.
+    The claim is committed before returning.
+    """
+    now = now or datetime.utcnow()
+    claim_token = f"{owner or worker_id()}:{uuid.uuid4().hex[:12]}"
+    # 'pending' inlined rather than bound: a planner only matches a partial index
+    # (WHERE status = 'pending') against a literal
+    pending = and_(ready, model.status == literal_column("'pending'"))
+    expired = and_(ready, lease_expired(model, now))
+    # two queries instead of one OR, so the pending scan can use the partial index on
+    # pending rows; the (few) expired claims are taken first
+    ids = _candidate_ids(model, expired, order_by, limit)
+    if len(ids) < limit:
+        ids += _candidate_ids(model, pending, order_by, limit - len(ids))
+    claimable = or_(pending, expired)
+    if not ids:
+        db.session.commit()
+        return []
+    db.session.execute(
+        update(model)
+        .where(model.id.in_(ids), claimable)
+        .values(status="processing", claimed_by=claim_token, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return model.query.filter(model.claimed_by == claim_token, model.status == "processing").order_by(order_by).all()
+
+
+def release_claims(model, ids: list[int]) -> None:
+    """Hand claimed rows back to the queue (caller commits)."""
+    db.session.execute(
+        update(model)
+        .where(model.id.in_(ids), model.status == "processing")
+        .values(status="pending", claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
 
 def _job_key(job_id: str) -> int:
     # produce a stable 64-bit signed integer from the job id
@@ -42,6 +139,7 @@ def pg_try_advisory_lock(job_id: str) -> Generator[bool, None, None]:
         # pg_try_advisory_lock returns boolean
         result = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key})
         locked = bool(result.scalar())
+        _note_lock(locked)
         yield locked
     finally:
         if 'locked' in locals() and locked:
@@ -56,11 +154,215 @@ def pg_try_advisory_lock(job_id: str) -> Generator[bool, None, None]:
         conn.close()
 
 
+class LeaseLost(RuntimeError):
+    """Raised when a job's lease expired or was taken over before it committed."""
+
+
+def _leases():
+    # lazy: models imports the app package, which imports this module's users
+    from ..models import Lease
+
+    return Lease.__table__
+
+
+class LeaseLock:
+    """A named lease row held with a TTL and a fencing token.
+
+    Acquire, renew and release are single guarded statements on their own
+    connection (never the caller's session), so they commit independently of the
+    job's transaction. Acquiring succeeds only if the row is free, expired or
+    already held by `holder`; each acquisition increments `fencing_token`.
+    """
+
+    def __init__(self, name: str, ttl: float, holder: Optional[str] = None, engine=None) -> None:
+        self.name = name
+        self.ttl = timedelta(seconds=float(ttl))
+        self.holder = holder or f"{worker_id()}:{uuid.uuid4().hex[:8]}"
+        self.engine = engine if engine is not None else db.engine
+        self.token: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self.token is not None
+
+    def acquire(self, now: Optional[datetime] = None) -> bool:
+        leases = _leases()
+        now = now or datetime.utcnow()
+        values = dict(holder=self.holder, acquired_at=now, renewed_at=now, expires_at=now + self.ttl)
+        try:
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    update(leases)
+                    .where(leases.c.name == self.name, or_(leases.c.holder == self.holder, leases.c.expires_at < now))
+                    .values(fencing_token=leases.c.fencing_token + 1, **values)
+                )
+                if result.rowcount == 0:
+                    if conn.execute(select(leases.c.name).where(leases.c.name == self.name)).first() is not None:
+                        return False
+                    conn.execute(insert(leases).values(name=self.name, fencing_token=1, **values))
+                self.token = conn.execute(
+                    select(leases.c.fencing_token).where(leases.c.name == self.name, leases.c.holder == self.holder)
+                ).scalar()
+        except IntegrityError:
+            # another process inserted the row first
+            return False
+        return self.token is not None
+
+    def renew(self, now: Optional[datetime] = None) -> bool:
+        """Extend the lease by the TTL; False (and the lease dropped) if it was lost."""
+        if not self.held:
+            return False
+        leases = _leases()
+        now = now or datetime.utcnow()
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(leases)
+                .where(
+                    leases.c.name == self.name,
+                    leases.c.holder == self.holder,
+                    leases.c.fencing_token == self.token,
+                    leases.c.expires_at >= now,
+                )
+                .values(renewed_at=now, expires_at=now + self.ttl)
+            )
+        if result.rowcount != 1:
+            self.token = None
+            return False
+        return True
+
+    def release(self) -> None:
+        """Expire the lease now so the next holder doesn't wait for the TTL."""
+        if not self.held:
+            return
+        leases = _leases()
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(leases)
+                .where(leases.c.name == self.name, leases.c.holder == self.holder, leases.c.fencing_token == self.token)
+                .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+        self.token = None
+
+
+class LeaseHandle:
+    """What `lease_lock` yields: truthy when the lease was acquired, like the advisory lock's bool."""
+
+    def __init__(self, lock: LeaseLock, acquired: bool) -> None:
+        self.lock = lock
+        self.acquired = acquired
+        self.lost = threading.Event()
+
+    def __bool__(self) -> bool:
+        return self.acquired
+
+    @property
+    def token(self) -> Optional[int]:
+        return self.lock.token if self.acquired else None
+
+    def assert_held(self, session=None) -> None:
+        """Verify, inside the caller's transaction, that our fencing token is still current.
+
+        On Postgres the lease row is read FOR SHARE, so a takeover (an UPDATE of that
+        row) waits until this transaction ends. Call right before committing.
+        """
+        if not self.acquired or self.lost.is_set():
+            raise LeaseLost(f"lease {self.lock.name} is not held")
+        session = session or db.session
+        leases = _leases()
+        q = select(leases.c.fencing_token, leases.c.holder).where(leases.c.name == self.lock.name)
+        if is_postgres():
+            q = q.with_for_update(read=True)
+        row = session.execute(q).first()
+        if row is None or row.fencing_token != self.lock.token or row.holder != self.lock.holder:
+            self.lost.set()
+            raise LeaseLost(f"lease {self.lock.name} was taken over (token {self.lock.token})")
+
+
+_current_lease: ContextVar[Optional[LeaseHandle]] = ContextVar("current_lease", default=None)
+
+
+def current_lease() -> Optional[LeaseHandle]:
+    """The lease held by the job running in this context (set by `lease_lock`), if any."""
+    return _current_lease.get()
+
+
+def _heartbeat(lock: LeaseLock, handle: LeaseHandle, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            if not lock.renew():
+                logger.warning("Lease %s lost (fencing token superseded or expired)", lock.name)
+                handle.lost.set()
+                return
+        except Exception:
+            # keep trying until the TTL runs out; assert_held catches a real loss
+            logger.exception("Lease %s heartbeat failed", lock.name)
+
+
+@contextmanager
+def lease_lock(job_id: str, ttl: Optional[float] = None, heartbeat: Optional[float] = None) -> Generator[LeaseHandle, None, None]:
+    """Try to take the lease for job_id. Yields a handle that is truthy if acquired.
+
+    Usage mirrors `pg_try_advisory_lock`:
+        with lease_lock('cleanup_job') as lease:
+            if not lease:
+                return
+            ...
+            lease.assert_held()
+            db.session.commit()
+
+    While held, a daemon thread renews the lease every `heartbeat` seconds (TTL/3 by default).
+    """
+    ttl = float(ttl if ttl is not None else current_app.config.get("JOB_LOCK_TTL_SECONDS", 60))
+    interval = float(heartbeat if heartbeat is not None else max(ttl / 3, 0.05))
+    lock = LeaseLock(f"job:{job_id}", ttl=ttl)
+    handle = LeaseHandle(lock, lock.acquire())
+    _note_lock(handle.acquired)
+    if not handle:
+        yield handle
+        return
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(lock, handle, interval, stop), name=f"lease-{job_id}", daemon=True)
+    beat.start()
+    token = _current_lease.set(handle)
+    try:
+        yield handle
+    finally:
+        _current_lease.reset(token)
+        stop.set()
+        beat.join(timeout=interval + 1)
+        try:
+            lock.release()
+        except Exception:
+            logger.exception("Releasing lease %s failed; it expires after its TTL", lock.name)
+
+
+def _note_lock(acquired: bool) -> None:
+    # lazy import: job_runs imports this module
+    from ..job_runs import note_lock_acquired
+
+    note_lock_acquired(acquired)
+
+
+@contextmanager
+def job_lock(job_id: str) -> Generator[object, None, None]:
+    """Take the job lock with the configured backend (JOB_LOCK_BACKEND: 'advisory' or 'lease').
+
+    Yields something truthy when acquired. The advisory backend needs Postgres.
+    """
+    backend = current_app.config.get("JOB_LOCK_BACKEND", "advisory")
+    if backend == "advisory":
+        with pg_try_advisory_lock(job_id) as locked:
+            yield locked
+    else:
+        with lease_lock(job_id) as lease:
+            yield lease
+
+
 def single_instance(job_id: str):
     """Decorator to ensure the wrapped function runs only when lock is acquired."""
     def decorator(func):
         def wrapper(*args, **kwargs):
-            with pg_try_advisory_lock(job_id) as locked:
+            with job_lock(job_id) as locked:
                 if not locked:
                     # another process is running this job
                     return None
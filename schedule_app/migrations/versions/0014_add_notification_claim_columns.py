@@ -0,0 +1,32 @@
+"""Add claim/lease columns to notifications
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notifications', sa.Column('sent_at', sa.DateTime(), nullable=True))
+    op.add_column('notifications', sa.Column('status', sa.String(length=16), nullable=False, server_default='pending'))
+    op.add_column('notifications', sa.Column('claimed_by', sa.String(length=128), nullable=True))
+    op.add_column('notifications', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE notifications SET status = 'sent' WHERE sent = true")
+    op.create_index(op.f('ix_notifications_status'), 'notifications', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_notifications_status'), table_name='notifications')
+    op.drop_column('notifications', 'lease_expires_at')
+    op.drop_column('notifications', 'claimed_by')
+    op.drop_column('notifications', 'status')
+    op.drop_column('notifications', 'sent_at')
@@ -0,0 +1,47 @@
+"""Add email_outbox table
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=255), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.Column('dedupe_key', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('claimed_by', sa.String(length=128), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_email_outbox_recipient'), 'email_outbox', ['recipient'], unique=False)
+    op.create_index(op.f('ix_email_outbox_dedupe_key'), 'email_outbox', ['dedupe_key'], unique=False)
+    op.create_index(op.f('ix_email_outbox_status'), 'email_outbox', ['status'], unique=False)
+    op.create_index(op.f('ix_email_outbox_next_attempt_at'), 'email_outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_email_outbox_next_attempt_at'), table_name='email_outbox')
+    op.drop_index(op.f('ix_email_outbox_status'), table_name='email_outbox')
+    op.drop_index(op.f('ix_email_outbox_dedupe_key'), table_name='email_outbox')
+    op.drop_index(op.f('ix_email_outbox_recipient'), table_name='email_outbox')
+    op.drop_table('email_outbox')
@@ -0,0 +1,31 @@
+"""Add reminder offsets and generation horizon
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('default_reminder_offsets', sa.String(length=255), nullable=True))
+    op.add_column('events', sa.Column('reminder_offsets', sa.String(length=255), nullable=True))
+    op.add_column('events', sa.Column('reminders_generated_until', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_events_reminders_generated_until'), 'events', ['reminders_generated_until'], unique=False)
+    op.add_column('notifications', sa.Column('occurrence_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('notifications', 'occurrence_at')
+    op.drop_index(op.f('ix_events_reminders_generated_until'), table_name='events')
+    op.drop_column('events', 'reminders_generated_until')
+    op.drop_column('events', 'reminder_offsets')
+    op.drop_column('users', 'default_reminder_offsets')
@@ -0,0 +1,37 @@
+"""Add retry/backoff state and pending partial index to notifications
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notifications', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('notifications', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('notifications', sa.Column('last_error', sa.Text(), nullable=True))
+    op.execute("UPDATE notifications SET next_attempt_at = scheduled_at")
+    op.alter_column('notifications', 'next_attempt_at', nullable=False)
+    op.create_index(
+        'ix_notifications_pending_next_attempt',
+        'notifications',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_notifications_pending_next_attempt', table_name='notifications')
+    op.drop_column('notifications', 'last_error')
+    op.drop_column('notifications', 'next_attempt_at')
+    op.drop_column('notifications', 'attempts')
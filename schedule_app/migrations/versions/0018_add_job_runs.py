@@ -0,0 +1,53 @@
+"""Add job_runs telemetry and job_run_rollups tables
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.String(length=128), nullable=False),
+    sa.Column('source', sa.String(length=16), nullable=False),
+    sa.Column('host', sa.String(length=128), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('duration_ms', sa.Float(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('lock_acquired', sa.Boolean(), nullable=True),
+    sa.Column('rows_processed', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_job_runs_job_id'), 'job_runs', ['job_id'], unique=False)
+    op.create_index(op.f('ix_job_runs_started_at'), 'job_runs', ['started_at'], unique=False)
+    op.create_table('job_run_rollups',
+    sa.Column('job_id', sa.String(length=128), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Integer(), nullable=False),
+    sa.Column('skipped', sa.Integer(), nullable=False),
+    sa.Column('rows_processed', sa.Integer(), nullable=False),
+    sa.Column('total_ms', sa.Float(), nullable=False),
+    sa.Column('max_ms', sa.Float(), nullable=False),
+    sa.Column('p50_ms', sa.Float(), nullable=True),
+    sa.Column('p95_ms', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('job_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('job_run_rollups')
+    op.drop_index(op.f('ix_job_runs_started_at'), table_name='job_runs')
+    op.drop_index(op.f('ix_job_runs_job_id'), table_name='job_runs')
+    op.drop_table('job_runs')
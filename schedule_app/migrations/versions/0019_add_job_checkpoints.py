@@ -0,0 +1,32 @@
+"""Add job_checkpoints table for resumable batch jobs
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0019'
+down_revision = '0018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_checkpoints',
+    sa.Column('name', sa.String(length=128), nullable=False),
+    sa.Column('cursor', sa.Integer(), nullable=False),
+    sa.Column('cutoff', sa.DateTime(), nullable=True),
+    sa.Column('rows_processed', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_checkpoints')
@@ -0,0 +1,31 @@
+"""Add leases table for scheduler leader election
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0020'
+down_revision = '0019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('leases',
+    sa.Column('name', sa.String(length=128), nullable=False),
+    sa.Column('holder', sa.String(length=128), nullable=True),
+    sa.Column('fencing_token', sa.BigInteger(), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(), nullable=True),
+    sa.Column('renewed_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('leases')
@@ -0,0 +1,23 @@
+"""Add sync_token to external_accounts for incremental Google sync
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0021'
+down_revision = '0020'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('external_accounts', sa.Column('sync_token', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('external_accounts', 'sync_token')
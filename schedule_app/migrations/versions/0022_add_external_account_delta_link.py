@@ -0,0 +1,23 @@
+"""Add delta_link to external_accounts for Outlook delta sync
+
+Revision ID: 0022
+Revises: 0021
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0022'
+down_revision = '0021'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('external_accounts', sa.Column('delta_link', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('external_accounts', 'delta_link')
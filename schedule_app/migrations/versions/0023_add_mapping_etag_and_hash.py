@@ -0,0 +1,25 @@
+"""Add etag and content_hash to external_event_mappings
+
+Revision ID: 0023
+Revises: 0022
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0023'
+down_revision = '0022'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('external_event_mappings', sa.Column('etag', sa.String(length=255), nullable=True))
+    op.add_column('external_event_mappings', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('external_event_mappings', 'content_hash')
+    op.drop_column('external_event_mappings', 'etag')
@@ -0,0 +1,53 @@
+"""Add external_changes outbound change queue
+
+Revision ID: 0024
+Revises: 0023
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0024'
+down_revision = '0023'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('external_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=16), nullable=False),
+    sa.Column('targets', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('claimed_by', sa.String(length=128), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_external_changes_event_id'), 'external_changes', ['event_id'], unique=False)
+    op.create_index(op.f('ix_external_changes_user_id'), 'external_changes', ['user_id'], unique=False)
+    op.create_index(op.f('ix_external_changes_status'), 'external_changes', ['status'], unique=False)
+    op.create_index(
+        'ix_external_changes_pending_next_attempt',
+        'external_changes',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_external_changes_pending_next_attempt', table_name='external_changes')
+    op.drop_index(op.f('ix_external_changes_status'), table_name='external_changes')
+    op.drop_index(op.f('ix_external_changes_user_id'), table_name='external_changes')
+    op.drop_index(op.f('ix_external_changes_event_id'), table_name='external_changes')
+    op.drop_table('external_changes')
@@ -0,0 +1,24 @@
+"""Add delta_window_end to external_accounts
+
+Revision ID: 0025
+Revises: 0024
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0025'
+down_revision = '0024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing delta links have no recorded window: their next sync starts a new round
+    op.add_column('external_accounts', sa.Column('delta_window_end', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('external_accounts', 'delta_window_end')
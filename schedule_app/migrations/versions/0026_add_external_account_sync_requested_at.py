@@ -0,0 +1,25 @@
+"""Add sync_requested_at to external_accounts
+
+Revision ID: 0026
+Revises: 0025
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0026'
+down_revision = '0025'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('external_accounts', sa.Column('sync_requested_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_external_accounts_sync_requested_at', 'external_accounts', ['sync_requested_at'])
+
+
+def downgrade():
+    op.drop_index('ix_external_accounts_sync_requested_at', table_name='external_accounts')
+    op.drop_column('external_accounts', 'sync_requested_at')
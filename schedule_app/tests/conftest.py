@@ -1,5 +1,7 @@
 import sys
 import os
+from datetime import datetime, timedelta
+
 import pytest
 
 # ensure repository root is on sys.path so `schedule_app` package can be imported
@@ -11,6 +13,7 @@ if ROOT not in sys.path:
 os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
 from schedule_app.app import create_app, db
 from schedule_app.app.config import Config
+from schedule_app.app.models import Event, Role, User
 
 # 親 Config が Final アノテーションを持つため、継承して属性を再宣言すると
 # 型チェッカ（Pylance）で警告が出る。テスト用は独立クラスとして定義する。
@@ -33,3 +36,41 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+# Factories for the rows most tests need. They work in whichever app context is
+# active, so tests on their own app (file databases, fake API servers) use them too.
+@pytest.fixture
+def make_user():
+    """Create and commit a confirmed user (password 'pw123', email <username>@example.com)."""
+    def make(username='user', email=None, password='pw123', roles=(), **attrs):
+        u = User()
+        u.username = username
+        u.email = email or f'{username}@example.com'
+        u.set_password(password)
+        u.confirmed = True
+        for name in roles:
+            u.roles.append(Role.query.filter_by(name=name).first() or Role(name=name))
+        for key, value in attrs.items():
+            setattr(u, key, value)
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    return make
+
+
+@pytest.fixture
+def make_event():
+    """Create an event for `user` (default: an hour long, starting in an hour); commits unless commit=False."""
+    def make(user, start=None, end=None, title='Meeting', commit=True, **kw):
+        start = start or datetime.utcnow() + timedelta(hours=1)
+        ev = Event(user_id=user.id, title=title, start_at=start, end_at=end or start + timedelta(hours=1), **kw)
+        db.session.add(ev)
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+        return ev
+
+    return make
@@ -0,0 +1,64 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from schedule_app.app import db
+from schedule_app.app.cleanup import purge_old_events
+from schedule_app.app.models import (
+    Event, EventComment, Notification, Reaction, Task, JobCheckpoint,
+)
+
+
+@pytest.fixture
+def create_old_event(make_event):
+    """An ended event with a comment thread, a reminder, a reaction and a task hanging off it."""
+    def create(user, end, **kw):
+        ev = make_event(user, end - timedelta(hours=1), end, title='Old', commit=False, **kw)
+        root = EventComment(event_id=ev.id, user_id=user.id, content='root')
+        db.session.add(root)
+        db.session.flush()
+        db.session.add_all([
+            EventComment(event_id=ev.id, user_id=user.id, parent_id=root.id, content='reply'),
+            Notification(event_id=ev.id, user_id=user.id, scheduled_at=ev.start_at),
+            Reaction(event_id=ev.id, user_id=user.id, emoji='👍'),
+            Task(user_id=user.id, event_id=ev.id, title='follow up'),
+        ])
+        db.session.commit()
+        return ev.id
+
+    return create
+
+
+def test_purge_batches_cascades_archives_and_resumes(app, tmp_path, make_user, create_old_event):
+    app.config.update(CLEANUP_BATCH_SIZE=2, CLEANUP_THROTTLE_SECONDS=0, CLEANUP_ARCHIVE_DIR=str(tmp_path), EVENT_RETENTION_DAYS=730)
+    now = datetime(2030, 1, 1)
+    user = make_user('purge')
+    old_ids = [create_old_event(user, now - timedelta(days=800 + i)) for i in range(3)]
+    recent = create_old_event(user, now - timedelta(days=10))
+    series = create_old_event(user, now - timedelta(days=900), rrule='FREQ=WEEKLY')
+
+    # interrupted after the first batch: the checkpoint stays open
+    assert purge_old_events(now=now, max_batches=1) == 2
+    cp = db.session.get(JobCheckpoint, 'cleanup_old_events')
+    assert cp.cursor == old_ids[1] and cp.finished_at is None
+
+    assert purge_old_events(now=now + timedelta(days=1)) == 1
+    cp = db.session.get(JobCheckpoint, 'cleanup_old_events')
+    assert cp.finished_at is not None and cp.rows_processed == 3
+    # resumed with the original cutoff
+    assert cp.cutoff == now - timedelta(days=730)
+
+    assert {e.id for e in Event.query.all()} == {recent, series}
+    assert EventComment.query.filter(EventComment.event_id.in_(old_ids)).count() == 0
+    assert Notification.query.filter(Notification.event_id.in_(old_ids)).count() == 0
+    assert Reaction.query.filter(Reaction.event_id.in_(old_ids)).count() == 0
+    assert Task.query.count() == 5 and Task.query.filter(Task.event_id == None).count() == 3  # noqa: E711
+
+    archived = []
+    for path in sorted(tmp_path.glob('*.jsonl.gz')):
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            archived += [json.loads(line) for line in fh]
+    assert sorted(r['row']['id'] for r in archived if r['table'] == 'events') == sorted(old_ids)
+    assert sum(1 for r in archived if r['table'] == 'event_comments') == 6
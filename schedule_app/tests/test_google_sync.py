@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import pytest
+import requests
+
+from schedule_app.app import db
+from schedule_app.app.integrations import google
+from schedule_app.app.models import Event, ExternalAccount, ExternalEventMapping
+from schedule_app.app.utils import http_client
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = str(payload)
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code}')
+
+
+@pytest.fixture
+def create_account(make_user):
+    def create():
+        u = make_user('gsync')
+        acc = ExternalAccount(user_id=u.id, provider='google', access_token=encrypt_value('tok'))
+        db.session.add(acc)
+        db.session.commit()
+        return acc
+
+    return create
+
+
+def item(event_id, title, day, status='confirmed'):
+    return {
+        'id': event_id,
+        'status': status,
+        'summary': title,
+        'start': {'dateTime': f'2030-01-{day:02d}T09:00:00+09:00'},
+        'end': {'date': f'2030-01-{day + 1:02d}'},
+    }
+
+
+def test_full_then_incremental_sync(app, monkeypatch, create_account):
+    acc = create_account()
+    calls = []
+    pages = {
+        None: {'items': [item('a', 'A', 1)], 'nextPageToken': 'p2'},
+        'p2': {'items': [item('b', 'B', 2)], 'nextSyncToken': 'sync-1'},
+    }
+
+    def fake_get(url, headers, params, timeout):
+        calls.append(dict(params))
+        assert headers['Authorization'] == 'Bearer tok'
+        assert params['maxResults'] == 250 and params['fields'].startswith('items(id,etag,status')
+        if 'syncToken' in params:
+            assert params['syncToken'] == 'sync-1' and 'timeMin' not in params
+            return FakeResponse(200, {
+                'items': [item('a', 'A renamed', 3), item('b', None, 2, status='cancelled'), item('zz', None, 2, status='cancelled')],
+                'nextSyncToken': 'sync-2',
+            })
+        return FakeResponse(200, pages[params.get('pageToken')])
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    assert google.import_events_for_account(acc) == 2
+    assert acc.sync_token == 'sync-1'
+    ev_a = Event.query.filter_by(title='A').one()
+    assert ev_a.start_at == datetime(2030, 1, 1, 0, 0)  # converted to UTC
+
+    assert google.import_events_for_account(acc) == 2
+    assert acc.sync_token == 'sync-2'
+    assert [e.title for e in Event.query.all()] == ['A renamed']
+    assert ExternalEventMapping.query.count() == 1
+    assert len(calls) == 3
+
+
+def test_gone_sync_token_triggers_full_resync(app, monkeypatch, create_account):
+    acc = create_account()
+    acc.sync_token = 'expired'
+    db.session.commit()
+    old = Event(user_id=acc.user_id, title='Removed upstream', start_at=datetime(2030, 1, 5), end_at=datetime(2030, 1, 5, 1))
+    db.session.add(old)
+    db.session.flush()
+    db.session.add(ExternalEventMapping(provider='google', provider_event_id='gone', external_account_id=acc.id, event_id=old.id))
+    db.session.commit()
+
+    def fake_get(url, headers, params, timeout):
+        if 'syncToken' in params:
+            return FakeResponse(410, {'error': {'code': 410}})
+        return FakeResponse(200, {'items': [item('c', 'C', 4)], 'nextSyncToken': 'fresh'})
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    assert google.import_events_for_account(acc, since=datetime(2030, 1, 1)) == 2
+    assert acc.sync_token == 'fresh'
+    assert [e.title for e in Event.query.all()] == ['C']
@@ -0,0 +1,67 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from schedule_app.app.utils import http_client
+
+
+class Flaky(BaseHTTPRequestHandler):
+    """503 on the first call to each path, 200 afterwards; counts calls and connections."""
+
+    calls = {}
+    connections = set()
+
+    def _handle(self):
+        cls = type(self)
+        cls.connections.add(self.client_address)
+        cls.calls[self.path] = cls.calls.get(self.path, 0) + 1
+        status = 503 if cls.calls[self.path] == 1 else 200
+        body = json.dumps({'n': cls.calls[self.path]}).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv('HTTP_RETRY_BACKOFF', '0')
+    http_client.close_session()
+    http_client.reset_metrics()
+    Flaky.calls.clear()
+    Flaky.connections.clear()
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Flaky)
+    srv.protocol_version = 'HTTP/1.1'
+    Flaky.protocol_version = 'HTTP/1.1'
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield f'127.0.0.1:{srv.server_address[1]}'
+    http_client.close_session()
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_idempotent_calls_retry_and_post_does_not(server):
+    resp = http_client.get(f'http://{server}/events')
+    assert resp.status_code == 200 and resp.json() == {'n': 2}
+    # a POST may have been processed: the 503 is returned, not retried
+    resp = http_client.post(f'http://{server}/token', data={'a': 1})
+    assert resp.status_code == 503 and Flaky.calls['/token'] == 1
+
+
+def test_connections_are_reused_and_metrics_kept_per_host(server):
+    for i in range(3):
+        http_client.get(f'http://{server}/page/{i}')
+    assert len(Flaky.connections) == 1  # keep-alive: one socket for every request
+    stats = http_client.host_metrics()[server]
+    assert stats['requests'] == 3 and stats['retries'] == 3
+    assert stats['statuses'] == {'2xx': 3} and stats['errors'] == 0
+    assert http_client.get_session() is http_client.get_session()
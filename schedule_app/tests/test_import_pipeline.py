@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event as sa_event
+
+from schedule_app.app import db
+from schedule_app.app.integrations.pipeline import ImportedEvent, upsert_chunk
+from schedule_app.app.models import Event, ExternalAccount, ExternalEventMapping
+
+
+@pytest.fixture
+def create_account(make_user):
+    def create():
+        u = make_user('bulk')
+        acc = ExternalAccount(user_id=u.id, provider='google')
+        db.session.add(acc)
+        db.session.commit()
+        return acc
+
+    return create
+
+
+def record(i, title=None):
+    start = datetime(2030, 1, 1) + timedelta(hours=i)
+    return ImportedEvent(f'g{i}', dict(title=title or f'E{i}', description=None, location=None, start_at=start, end_at=start + timedelta(minutes=30)))
+
+
+def count_statements():
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    sa_event.listen(db.engine, 'before_cursor_execute', before)
+    return statements, lambda: sa_event.remove(db.engine, 'before_cursor_execute', before)
+
+
+def test_upsert_chunk_uses_constant_statements(app, create_account):
+    acc = create_account()
+    acc.id, acc.user_id  # load the expired account outside the counted window
+    # SQLite can't order a batched INSERT ... RETURNING, so it inserts events row by row
+    batched = db.engine.dialect.name != 'sqlite'
+    statements, stop = count_statements()
+    try:
+        result = upsert_chunk(acc, 'google', [record(i) for i in range(50)])
+    finally:
+        stop()
+    assert (result.created, result.updated, result.deleted) == (50, 0, 0)
+    # mapping prefetch + events insert + mappings insert, independent of the chunk size
+    assert statements.count('SELECT') == 1
+    assert statements.count('INSERT') == (2 if batched else 51)
+    assert Event.query.count() == 50 and ExternalEventMapping.query.count() == 50
+
+    acc.id
+    statements, stop = count_statements()
+    try:
+        result = upsert_chunk(acc, 'google', [record(i, title='moved') for i in range(40)] + [ImportedEvent('g45'), record(60)])
+    finally:
+        stop()
+    assert (result.created, result.updated, result.deleted) == (1, 40, 1)
+    # one executemany UPDATE each for events and mappings
+    assert statements.count('UPDATE') == 2 + 1  # + detaching tasks of the deleted event
+    assert Event.query.filter_by(title='moved').count() == 40
+    assert Event.query.count() == 50 and ExternalEventMapping.query.count() == 50
+
+
+def test_last_entry_for_an_id_wins(app, create_account):
+    acc = create_account()
+    result = upsert_chunk(acc, 'google', [record(1), record(1, title='second'), record(2), ImportedEvent('g2')])
+    assert (result.created, result.updated, result.deleted) == (1, 0, 0)
+    assert [e.title for e in Event.query.all()] == ['second']
+
+
+def test_unchanged_items_are_skipped_without_writes(app, create_account):
+    acc = create_account()
+    first = [record(i) for i in range(5)]
+    for rec in first[:3]:
+        rec.etag = f'"v1-{rec.provider_event_id}"'
+    upsert_chunk(acc, 'google', first)
+
+    relisted = [record(i) for i in range(5)]
+    relisted[0].etag = '"v1-g0"'  # same etag: skipped before hashing
+    relisted[1].etag = '"v2-g1"'  # new etag, same content: only the etag is remembered
+    relisted[2].etag = '"v2-g2"'
+    relisted[2].fields['title'] = 'Edited upstream'
+    acc.id
+    statements, stop = count_statements()
+    try:
+        result = upsert_chunk(acc, 'google', relisted)
+    finally:
+        stop()
+    assert (result.created, result.updated, result.deleted, result.unchanged) == (0, 1, 0, 4)
+    assert 'INSERT' not in statements and 'DELETE' not in statements
+    mapping = ExternalEventMapping.query.filter_by(provider_event_id='g1').one()
+    assert mapping.etag == '"v2-g1"'
+    assert Event.query.filter_by(title='Edited upstream').count() == 1
+
+    statements, stop = count_statements()
+    try:
+        result = upsert_chunk(acc, 'google', [record(3), record(4)])
+    finally:
+        stop()
+    assert result.unchanged == 2 and statements.count('UPDATE') == 0
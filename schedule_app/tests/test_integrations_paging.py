@@ -0,0 +1,71 @@
+import requests
+
+from schedule_app.app import db
+from schedule_app.app.integrations import outlook, paging
+from schedule_app.app.models import Event, ExternalAccount, ExternalEventMapping
+from schedule_app.app.utils import http_client
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+def test_google_pages_are_fetched_lazily(monkeypatch):
+    requested = []
+
+    def fake_get(url, headers, params, timeout):
+        requested.append(params.get('pageToken'))
+        token = params.get('pageToken')
+        if token is None:
+            return FakeResponse({'items': [1, 2], 'nextPageToken': 't2'})
+        return FakeResponse({'items': [3], 'nextSyncToken': 'done'})
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    listing = paging.PagedItems(paging.google_pages('http://x', {}, {'a': 1}), 'items')
+    chunks = listing.chunks(2)
+    assert next(chunks) == [1, 2]
+    assert requested == [None]  # second page not fetched until needed
+    assert list(chunks) == [[3]]
+    assert requested == [None, 't2']
+    assert listing.last_page['nextSyncToken'] == 'done' and listing.page_count == 2
+
+
+def test_outlook_import_follows_next_link(app, monkeypatch, make_user):
+    u = make_user('pager')
+    acc = ExternalAccount(user_id=u.id, provider='outlook', access_token=encrypt_value('tok'))
+    db.session.add(acc)
+    db.session.commit()
+    app.config['INTEGRATIONS_SYNC_CHUNK_SIZE'] = 2
+
+    def ev(i):
+        return {'id': f'o{i}', 'subject': f'E{i}', 'start': {'dateTime': '2030-01-01T09:00:00.0000000'},
+                'end': {'dateTime': '2030-01-01T10:00:00.0000000'}}
+
+    seen = []
+
+    def fake_get(url, headers, params, timeout):
+        seen.append((url, params))
+        if url == outlook.GRAPH_URL + '/me/calendarView/delta':
+            assert 'startDateTime' in params
+            assert 'odata.maxpagesize=250' in headers['Prefer']
+            return FakeResponse({'value': [ev(1), ev(2), ev(3)], '@odata.nextLink': 'https://graph/next?skip=3'})
+        assert params is None  # the next link carries the query
+        return FakeResponse({'value': [ev(4), ev(1)], '@odata.deltaLink': 'https://graph/delta?token=1'})
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    # o1 shows up again on the second page unchanged: created once, then skipped
+    assert outlook.import_events_for_account(acc) == 4
+    assert len(seen) == 2
+    assert Event.query.count() == 4 and ExternalEventMapping.query.count() == 4
+    assert acc.delta_link == 'https://graph/delta?token=1'
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from schedule_app.app import db
+from schedule_app.app import scheduler
+from schedule_app.app.job_runs import flush_job_runs, rollup_job_runs
+from schedule_app.app.models import JobRun, JobRunRollup
+
+
+def login(client, username, password='pw123'):
+    return client.post('/login', data={'username': username, 'password': password}, follow_redirects=True)
+
+
+def test_dispatched_runs_are_recorded(app, monkeypatch):
+    monkeypatch.setattr(scheduler, '_app', None)
+    scheduler.set_app(app)
+    try:
+        assert scheduler.run_job_in_app_context('schedule_app.app.jobs', 'extend_reminder_horizon') == 0
+        with pytest.raises(ValueError):
+            scheduler.run_job_in_app_context('json', 'loads', '{')
+        # buffered until the flush threshold
+        assert JobRun.query.count() == 0
+        flush_job_runs()
+    finally:
+        monkeypatch.setattr(scheduler, '_app', None)
+
+    ok = JobRun.query.filter_by(job_id='extend_reminder_horizon').one()
+    assert ok.status == 'ok' and ok.rows_processed == 0 and ok.source == 'scheduler'
+    assert ok.duration_ms >= 0 and ok.lock_acquired is None
+    failed = JobRun.query.filter_by(job_id='loads').one()
+    assert failed.status == 'error' and failed.error.startswith('JSONDecodeError')
+
+
+def test_rollup_folds_old_runs_into_daily_summary(app):
+    now = datetime(2030, 6, 30, 12, 0)
+    old_day = now - timedelta(days=app.config.get('JOB_RUNS_RETENTION_DAYS', 14) + 2)
+    for i, ms in enumerate([10, 20, 30, 40, 1000]):
+        db.session.add(JobRun(job_id='drain_email_outbox', started_at=old_day + timedelta(minutes=i), duration_ms=ms, status='ok', rows_processed=1))
+    db.session.add(JobRun(job_id='drain_email_outbox', started_at=old_day, duration_ms=0.1, status='skipped', lock_acquired=False))
+    db.session.add(JobRun(job_id='drain_email_outbox', started_at=now - timedelta(hours=1), duration_ms=5, status='ok'))
+    db.session.commit()
+
+    assert rollup_job_runs(now=now) == 6
+    rollup = db.session.get(JobRunRollup, ('drain_email_outbox', old_day.date()))
+    assert (rollup.runs, rollup.skipped, rollup.rows_processed) == (6, 1, 5)
+    assert rollup.p50_ms == 30 and rollup.p95_ms == 1000 and rollup.max_ms == 1000
+    assert JobRun.query.count() == 1
+
+
+def test_job_stats_endpoint_requires_admin(client, app, make_user):
+    make_user('viewer')
+    make_user('ops', roles=('admin',))
+    now = datetime.utcnow()
+    for ms in (100, 200, 300, 400):
+        db.session.add(JobRun(job_id='cleanup_old_events', started_at=now - timedelta(minutes=5), duration_ms=ms, status='ok'))
+    db.session.add(JobRun(job_id='cleanup_old_events', started_at=now - timedelta(days=3), duration_ms=9999, status='ok'))
+    db.session.commit()
+
+    login(client, 'viewer')
+    assert client.get('/api/v1/jobs/stats').status_code == 403
+    client.get('/logout')
+
+    login(client, 'ops')
+    rv = client.get('/api/v1/jobs/stats?hours=24')
+    assert rv.status_code == 200
+    [stats] = rv.get_json()['jobs']
+    assert stats['job_id'] == 'cleanup_old_events'
+    assert stats['runs'] == 4 and stats['p50_ms'] == 200 and stats['p95_ms'] == 400
+
+
+def test_failed_tasks_run_is_recorded_once(app):
+    app.config['JOB_LOCK_BACKEND'] = 'lease'
+    from schedule_app.app.tasks.__main__ import _runner
+
+    def job():
+        raise RuntimeError('boom')
+
+    assert _runner._run_tracked('cleanup_old_events', job) == 0
+    flush_job_runs()
+    runs = JobRun.query.filter_by(job_id='cleanup_old_events').all()
+    assert [(r.status, r.lock_acquired, r.source) for r in runs] == [('error', True, 'tasks')]
+    assert runs[0].error == 'RuntimeError: boom'
@@ -0,0 +1,245 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from schedule_app.app import db
+from schedule_app.app.models import Notification
+from schedule_app.app import jobs
+
+
+@pytest.fixture
+def create_notifications(make_user, make_event):
+    def create(count, scheduled_at=None):
+        user = make_user('jobuser')
+        ev = make_event(user)
+        scheduled_at = scheduled_at or datetime.utcnow() - timedelta(minutes=1)
+        rows = [Notification(event_id=ev.id, user_id=user.id, scheduled_at=scheduled_at) for _ in range(count)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [n.id for n in rows]
+
+    return create
+
+
+def test_claims_are_exclusive_between_workers(app, create_notifications):
+    ids = create_notifications(5)
+    first = jobs.claim_due_notifications(limit=3, worker_id='worker-a')
+    second = jobs.claim_due_notifications(limit=10, worker_id='worker-b')
+    assert len(first) == 3
+    assert len(second) == 2
+    assert {n.id for n in first} | {n.id for n in second} == set(ids)
+    assert not ({n.id for n in first} & {n.id for n in second})
+    assert all(n.status == 'processing' for n in first + second)
+    assert jobs.claim_due_notifications(worker_id='worker-c') == []
+
+
+def test_expired_lease_is_reclaimed(app, create_notifications):
+    create_notifications(1)
+    claimed = jobs.claim_due_notifications(worker_id='crashed')
+    assert len(claimed) == 1
+    later = datetime.utcnow() + timedelta(seconds=app.config.get('NOTIFICATION_LEASE_SECONDS', 300) + 1)
+    reclaimed = jobs.claim_due_notifications(worker_id='survivor', now=later)
+    assert [n.id for n in reclaimed] == [claimed[0].id]
+    assert reclaimed[0].claimed_by.startswith('survivor:')
+
+
+def test_claim_scans_pending_and_expired_rows_separately(app, create_notifications):
+    from sqlalchemy import event
+
+    create_notifications(3)
+    claimed = jobs.claim_due_notifications(limit=1, worker_id='crashed')
+    later = datetime.utcnow() + timedelta(seconds=app.config.get('NOTIFICATION_LEASE_SECONDS', 300) + 1)
+    selects = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith('SELECT notifications.id') and 'LIMIT' in statement:
+            selects.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        reclaimed = jobs.claim_due_notifications(limit=2, worker_id='survivor', now=later)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    # the expired claim comes back first, then the oldest pending row
+    assert [n.id for n in reclaimed][:1] == [claimed[0].id] and len(reclaimed) == 2
+    # one scan per branch, no OR; the pending scan repeats the partial index's predicate literally
+    assert len(selects) == 2 and not any(' OR ' in sql for sql, _ in selects)
+    assert "status = 'pending'" in selects[1][0]
+
+
+def test_run_due_jobs_marks_sent(app, monkeypatch, create_notifications):
+    sent = []
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: sent.append(recipient) or True)
+    ids = create_notifications(2)
+    first = db.session.get(Notification, ids[0])
+    future = Notification(event_id=first.event_id, user_id=first.user_id, scheduled_at=datetime.utcnow() + timedelta(hours=1))
+    db.session.add(future)
+    db.session.commit()
+
+    jobs.run_due_jobs()
+
+    assert len(sent) == 2
+    for nid in ids:
+        n = db.session.get(Notification, nid)
+        assert n.sent is True and n.status == 'sent' and n.sent_at is not None
+    assert db.session.get(Notification, future.id).status == 'pending'
+
+
+def test_delivery_pool_respects_provider_limit(app):
+    import threading
+    import time
+    from schedule_app.app.delivery import DeliveryPool, OutgoingMessage
+
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+
+    def slow_send(msg):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.02)
+        with lock:
+            state['active'] -= 1
+        return msg.recipient != 'bad@example.com'
+
+    pool = DeliveryPool(max_workers=8, provider_limits={'smtp': 2})
+    msgs = [OutgoingMessage(recipient=f'u{i}@example.com', subject='s', body='b') for i in range(8)]
+    msgs.append(OutgoingMessage(recipient='bad@example.com', subject='s', body='b'))
+    results = pool.deliver(msgs, slow_send)
+    pool.shutdown()
+
+    assert state['peak'] <= 2
+    assert [r.message.recipient for r in results] == [m.recipient for m in msgs]
+    assert [r.ok for r in results].count(False) == 1
+    snap = pool.stats.snapshot()
+    assert snap['sent'] == 8 and snap['failed'] == 1
+    assert snap['per_provider']['smtp'] == {'sent': 8, 'failed': 1}
+
+
+def test_saturated_provider_does_not_hold_workers(app):
+    import threading
+    import time
+    from schedule_app.app.delivery import DeliveryPool, OutgoingMessage
+
+    sending, release = threading.Event(), threading.Event()
+
+    def send(msg):
+        if msg.provider == 'smtp':
+            sending.set()
+            release.wait(5)
+        return True
+
+    pool = DeliveryPool(max_workers=2, provider_limits={'smtp': 1})
+    smtp_msgs = [OutgoingMessage(recipient=f's{i}@example.com', subject='s', body='b') for i in range(4)]
+
+    def deliver_smtp():
+        with app.app_context():
+            pool.deliver(smtp_msgs, send)
+
+    blocked = threading.Thread(target=deliver_smtp)
+    blocked.start()
+    sending.wait(5)
+    time.sleep(0.1)  # let the rest of the SMTP batch be queued
+    try:
+        # one SMTP send holds its only permit; the other three wait in the queue, not in a worker
+        resend = OutgoingMessage(recipient='r@example.com', subject='s', body='b', provider='resend')
+        started = time.monotonic()
+        [result] = pool.deliver([resend], send)
+        assert result.ok and time.monotonic() - started < 2
+    finally:
+        release.set()
+        blocked.join(5)
+        pool.shutdown()
+    assert pool.stats.snapshot()['per_provider']['smtp'] == {'sent': 4, 'failed': 0}
+
+
+def test_digest_groups_user_reminders_into_one_email(app, monkeypatch, make_user, make_event):
+    app.config['REMINDER_DIGEST_WINDOW_MINUTES'] = 30
+    sent = []
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: sent.append((recipient, subject)) or True)
+    now = datetime.utcnow()
+    alice = make_user('alice')
+    bob = make_user('bob')
+    ev_a = make_event(alice, title='A')
+    ev_b = make_event(bob, title='B')
+    rows = {
+        'a_due1': Notification(event_id=ev_a.id, user_id=alice.id, scheduled_at=now - timedelta(minutes=2)),
+        'a_due2': Notification(event_id=ev_a.id, user_id=alice.id, scheduled_at=now - timedelta(minutes=1)),
+        'a_soon': Notification(event_id=ev_a.id, user_id=alice.id, scheduled_at=now + timedelta(minutes=20)),
+        'a_later': Notification(event_id=ev_a.id, user_id=alice.id, scheduled_at=now + timedelta(hours=2)),
+        'b_due': Notification(event_id=ev_b.id, user_id=bob.id, scheduled_at=now - timedelta(minutes=1)),
+    }
+    db.session.add_all(rows.values())
+    db.session.commit()
+
+    jobs.run_due_jobs()
+
+    assert sorted(r for r, _ in sent) == ['alice@example.com', 'bob@example.com']
+    assert dict(sent)['alice@example.com'].endswith('3 件の予定')
+    for key in ('a_due1', 'a_due2', 'a_soon', 'b_due'):
+        assert db.session.get(Notification, rows[key].id).status == 'sent'
+    assert db.session.get(Notification, rows['a_later'].id).status == 'pending'
+
+
+def test_failed_sends_back_off_then_fail_permanently(app, monkeypatch, create_notifications):
+    app.config['NOTIFICATION_MAX_ATTEMPTS'] = 2
+    app.config['NOTIFICATION_BACKOFF_BASE'] = 60
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: False)
+    [nid] = create_notifications(1)
+
+    jobs.run_due_jobs()
+    n = db.session.get(Notification, nid)
+    assert n.status == 'pending' and n.attempts == 1 and n.last_error
+    assert n.next_attempt_at > datetime.utcnow() + timedelta(seconds=50)
+    # still backing off: the next due scan does not pick it up
+    assert jobs.claim_due_notifications() == []
+
+    later = n.next_attempt_at + timedelta(seconds=1)
+    claimed = jobs.claim_due_notifications(now=later)
+    assert [c.id for c in claimed] == [nid]
+    jobs._record_failures([nid], 'still failing', later)
+    db.session.commit()
+    n = db.session.get(Notification, nid)
+    assert n.status == 'failed' and n.attempts == 2
+    assert jobs.claim_due_notifications(now=later + timedelta(days=1)) == []
+
+
+def test_refresh_external_accounts_shards_and_uses_registry(app, monkeypatch, make_user):
+    from schedule_app.app.integrations import registry
+    from schedule_app.app.models import ExternalAccount
+
+    refreshed = []
+
+    def fake_refresh(account):
+        refreshed.append((account.provider, account.id))
+        account.expires_at = datetime.utcnow() + timedelta(hours=1)
+        db.session.commit()
+        return True
+
+    monkeypatch.setattr(registry, '_providers', {})
+    # restored afterwards so later tests load the built-in providers again
+    monkeypatch.setattr(registry, '_builtins_loaded', registry._builtins_loaded)
+    for name in ('google', 'outlook'):
+        registry.register_provider(registry.Provider(name=name, refresh_access_token=fake_refresh))
+    user = make_user('jobuser')
+    soon = datetime.utcnow() + timedelta(minutes=1)
+    accounts = [ExternalAccount(user_id=user.id, provider=('google', 'outlook')[i % 2], expires_at=soon) for i in range(6)]
+    accounts.append(ExternalAccount(user_id=user.id, provider='google', expires_at=soon + timedelta(days=1)))
+    db.session.add_all(accounts)
+    db.session.commit()
+    ids = [a.id for a in accounts]
+
+    assert jobs.refresh_external_accounts(shard_index=1, shard_count=3) == 2
+    assert sorted(i for _, i in refreshed) == [i for i in ids[:6] if i % 3 == 1]
+
+    refreshed.clear()
+    assert jobs.refresh_external_accounts(shard_index=0, shard_count=1) == 4
+    assert {p for p, _ in refreshed} == {'google', 'outlook'}
+    assert ids[6] not in [i for _, i in refreshed]
+
+
+def test_refresh_shard_from_hostname(app, monkeypatch):
+    monkeypatch.setenv('HOSTNAME', 'refresher-4')
+    assert jobs.refresh_shard({'REFRESH_SHARD_COUNT': 3}) == (1, 3)
+    assert jobs.refresh_shard({'REFRESH_SHARD_COUNT': 3, 'REFRESH_SHARD_INDEX': '2'}) == (2, 3)
+    assert jobs.refresh_shard({}) == (0, 1)
@@ -0,0 +1,128 @@
+import socket
+
+import pytest
+
+from email.message import EmailMessage
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+from schedule_app.app.utils.mail_transport import SMTPConnectionPool
+
+
+class _CollectingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content)
+        return '250 OK'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = _CollectingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def _message(i):
+    msg = EmailMessage()
+    msg['Subject'] = f'hello {i}'
+    msg['From'] = 'no-reply@example.com'
+    msg['To'] = f'user{i}@example.com'
+    msg.set_content('body')
+    return msg
+
+
+def test_pool_reuses_and_recycles_connections(smtp_server):
+    controller, handler = smtp_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, use_tls=False, max_size=1, max_messages=3)
+    for i in range(7):
+        pool.send_message(_message(i))
+    pool.close()
+    assert len(handler.messages) == 7
+    # 7 messages at 3 per connection -> 3 connections instead of 7
+    assert pool.connections_opened == 3
+
+
+def test_pool_reconnects_after_broken_connection(smtp_server):
+    controller, handler = smtp_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, use_tls=False, max_size=1, health_check_after=0)
+    pool.send_message(_message(0))
+    # simulate the server dropping the idle connection
+    pool._idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+    pool.send_message(_message(1))
+    pool.close()
+    assert len(handler.messages) == 2
+    assert pool.connections_opened == 2
+
+
+class _PickyHandler(_CollectingHandler):
+    """Refuses recipients at bad.example.com and stalls before acknowledging slow@ messages."""
+
+    def __init__(self):
+        super().__init__()
+        self.rcpts = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.rcpts.append(address)
+        if address.endswith('@bad.example.com'):
+            return '550 5.1.1 no such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        import asyncio
+
+        self.messages.append(envelope.content)
+        if any(rcpt.startswith('slow@') for rcpt in envelope.rcpt_tos):
+            await asyncio.sleep(1)
+        return '250 OK'
+
+
+@pytest.fixture
+def picky_server():
+    handler = _PickyHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def test_rejected_recipient_is_not_resent_and_keeps_the_connection(picky_server):
+    import smtplib
+
+    controller, handler = picky_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, use_tls=False, max_size=1)
+    msg = _message(0)
+    msg.replace_header('To', 'nobody@bad.example.com')
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send_message(msg)
+    assert handler.rcpts == ['nobody@bad.example.com']
+    pool.send_message(_message(1))
+    pool.close()
+    assert len(handler.messages) == 1
+    assert pool.connections_opened == 1
+
+
+def test_timeout_after_data_is_not_resent(picky_server):
+    import time
+
+    controller, handler = picky_server
+    pool = SMTPConnectionPool(controller.hostname, controller.port, use_tls=False, max_size=1, timeout=0.3)
+    msg = _message(0)
+    msg.replace_header('To', 'slow@example.com')
+    with pytest.raises(OSError):
+        pool.send_message(msg)
+    time.sleep(1.2)
+    pool.close()
+    assert len(handler.messages) == 1
+    assert pool.connections_opened == 1
@@ -196,8 +196,8 @@ def test_send_email_called_on_unregistered_invite(client, app, monkeypatch):
         called['html'] = html
         return True
 
-    # patch the send_email function imported in organizations.routes
-    monkeypatch.setattr('schedule_app.app.organizations.routes.send_email', fake_send_email)
+    # invitations are queued in the email outbox; patch the sender used when it is drained
+    monkeypatch.setattr('schedule_app.app.auth.routes.send_email', fake_send_email)
 
     with app.app_context():
         owner = create_user('owner5', 'owner5@example.com')
@@ -212,4 +212,13 @@ def test_send_email_called_on_unregistered_invite(client, app, monkeypatch):
     assert rv.status_code == 200
     resp = client.post(f'/orgs/{org_id}/invite', data={'username': 'invitee@example.com'}, follow_redirects=True)
     assert resp.status_code == 200
+    # the request itself only writes the outbox row
+    assert 'recipient' not in called
+    with app.app_context():
+        from schedule_app.app.models import EmailOutbox
+        from schedule_app.app.outbox import drain_outbox
+        row = EmailOutbox.query.filter_by(recipient='invitee@example.com').one()
+        assert row.status == 'pending'
+        assert drain_outbox() == 1
+        assert db.session.get(EmailOutbox, row.id).status == 'sent'
     assert 'recipient' in called and called['recipient'] == 'invitee@example.com'
@@ -0,0 +1,294 @@
+import email
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from schedule_app.app import create_app, db
+from schedule_app.app.integrations.outbound import push_changes
+from schedule_app.app.models import Event, ExternalAccount, ExternalChange, ExternalEventMapping
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+class FakeCalendars(BaseHTTPRequestHandler):
+    """Google's multipart batch endpoint and Graph's JSON $batch, backed by dicts."""
+
+    lock = threading.Lock()
+    google_calls = []  # list of [(method, path, body)] per batch request
+    graph_calls = []
+    google_events = {}
+    graph_events = {}
+    graph_throttle = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.lock:
+            if self.path == '/batch/calendar/v3':
+                self._google_batch(body)
+            elif self.path == '/v1.0/$batch':
+                self._graph_batch(json.loads(body))
+            else:
+                self._send(404, 'application/json', b'{}')
+
+    def _google_batch(self, body):
+        cls = type(self)
+        message = email.message_from_bytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+        calls, parts, boundary = [], [], 'resp_boundary'
+        for part in message.get_payload():
+            head, *rest = re.split(r'\r?\n\r?\n', part.get_payload(), maxsplit=1)
+            method, path, _ = head.splitlines()[0].split()
+            resource = json.loads(rest[0]) if rest and rest[0].strip() else None
+            calls.append((method, path, resource))
+            event_id = path.rsplit('/', 1)[-1]
+            if method == 'POST':
+                event_id = f'g-{len(cls.google_events) + 1}'
+                cls.google_events[event_id] = dict(resource, etag='"1"')
+                status, out = '200 OK', dict(cls.google_events[event_id], id=event_id)
+            elif event_id not in cls.google_events:
+                status, out = '404 Not Found', {'error': {'code': 404, 'message': 'Not Found'}}
+            elif method == 'PATCH':
+                current = cls.google_events[event_id]
+                current.update(resource, etag=f'"{int(current["etag"].strip(chr(34))) + 1}"')
+                status, out = '200 OK', dict(current, id=event_id)
+            else:
+                del cls.google_events[event_id]
+                status, out = '204 No Content', None
+            text = f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n' + (json.dumps(out) if out else '')
+            parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{part["Content-ID"].strip("<>")}>\r\n\r\n{text}\r\n')
+        cls.google_calls.append(calls)
+        self._send(200, f'multipart/mixed; boundary={boundary}', (''.join(parts) + f'--{boundary}--\r\n').encode())
+
+    def _graph_batch(self, payload):
+        cls = type(self)
+        requests_ = payload['requests']
+        cls.graph_calls.append([(r['method'], r['url'], r.get('body')) for r in requests_])
+        assert len(requests_) <= 20
+        if cls.graph_throttle:
+            self._send(429, 'application/json', b'{}', {'Retry-After': '120'})
+            return
+        responses = []
+        for r in reversed(requests_):  # Graph does not promise any order
+            event_id = r['url'].rsplit('/', 1)[-1]
+            if r['method'] == 'POST':
+                event_id = f'o-{len(cls.graph_events) + 1}'
+                cls.graph_events[event_id] = r['body']
+                responses.append({'id': r['id'], 'status': 201, 'body': {'id': event_id, '@odata.etag': 'W/"1"'}})
+            elif event_id not in cls.graph_events:
+                responses.append({'id': r['id'], 'status': 404, 'body': {'error': {'message': 'not found'}}})
+            elif r['method'] == 'PATCH':
+                cls.graph_events[event_id].update(r['body'])
+                responses.append({'id': r['id'], 'status': 200, 'body': {'id': event_id, '@odata.etag': 'W/"2"'}})
+            else:
+                del cls.graph_events[event_id]
+                responses.append({'id': r['id'], 'status': 204})
+        self._send(200, 'application/json', json.dumps({'responses': responses}).encode())
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_calendars():
+    FakeCalendars.google_calls, FakeCalendars.graph_calls = [], []
+    FakeCalendars.google_events, FakeCalendars.graph_events = {}, {}
+    FakeCalendars.graph_throttle = False
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCalendars)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def push_app(fake_calendars, monkeypatch):
+    from schedule_app.app.integrations import registry
+
+    # the real Google/Outlook modules, whatever an earlier test registered
+    monkeypatch.setattr(registry, '_providers', {})
+    monkeypatch.setattr(registry, '_builtins_loaded', False)
+    config = type('PushConfig', (), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret',
+        'GOOGLE_CALENDAR_API_URL': f'{fake_calendars}/calendar/v3',
+        'GOOGLE_BATCH_URL': f'{fake_calendars}/batch/calendar/v3',
+        'MS_GRAPH_API_URL': f'{fake_calendars}/v1.0',
+    })
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def make_linked_user(make_user):
+    def make(name, providers=()):
+        u = make_user(name)
+        for provider in providers:
+            db.session.add(ExternalAccount(user_id=u.id, provider=provider, access_token=encrypt_value(f'{provider}-token')))
+        db.session.commit()
+        return u
+
+    return make
+
+
+@pytest.fixture
+def numbered_event(make_event):
+    def make(user, n):
+        return make_event(user, datetime(2030, 1, 1, 9, 0) + timedelta(days=n), title=f'Event {n}', commit=False)
+
+    return make
+
+
+def test_edits_to_one_event_coalesce_into_one_queued_change(push_app, make_linked_user, numbered_event):
+    u = make_linked_user('queue', ['google'])
+    loner = make_linked_user('loner')
+    ev = numbered_event(u, 1)
+    numbered_event(loner, 2)
+    db.session.commit()
+    for title in ('a', 'b', 'c'):
+        ev.title = title
+        db.session.commit()
+    ev.color = '#000000'  # not a synced field
+    db.session.commit()
+
+    rows = ExternalChange.query.all()
+    assert [(r.event_id, r.operation, r.status) for r in rows] == [(ev.id, 'upsert', 'pending')]
+
+    # deleting before the push turns the pending upsert into a delete with nothing to remove
+    db.session.delete(ev)
+    db.session.commit()
+    row = ExternalChange.query.one()
+    assert (row.operation, json.loads(row.targets)) == ('delete', [])
+    assert push_changes() == 1
+    assert ExternalChange.query.count() == 0
+    assert FakeCalendars.google_calls == []
+
+
+def test_push_batches_changes_and_writes_back_mappings(push_app, make_linked_user, numbered_event):
+    u = make_linked_user('pusher', ['google', 'outlook'])
+    events = [numbered_event(u, n) for n in range(45)]
+    db.session.commit()
+    google, outlook = ExternalAccount.query.order_by(ExternalAccount.id).all()
+
+    assert push_changes(limit=100) == 45
+    # 45 inserts per account: one Google batch of 45 (limit 50), Graph batches of 20 + 20 + 5
+    assert [len(call) for call in FakeCalendars.google_calls] == [45]
+    assert sorted(len(call) for call in FakeCalendars.graph_calls) == [5, 20, 20]
+    assert FakeCalendars.google_calls[0][0][:2] == ('POST', '/calendar/v3/calendars/primary/events')
+    assert FakeCalendars.google_calls[0][0][2]['start'] == {'dateTime': '2030-01-01T09:00:00Z'}
+    assert FakeCalendars.graph_calls[0][0][2]['start'] == {'dateTime': '2030-01-01T09:00:00', 'timeZone': 'UTC'}
+    assert ExternalChange.query.count() == 0
+    mappings = ExternalEventMapping.query.all()
+    assert len(mappings) == 90 and all(m.content_hash and m.etag for m in mappings)
+    assert {m.external_account_id for m in mappings} == {google.id, outlook.id}
+    assert len(FakeCalendars.google_events) == len(FakeCalendars.graph_events) == 45
+
+    # an update and a delete travel together in one batch per account
+    edited, removed = events[0], events[1]
+    removed_ids = {m.provider_event_id for m in ExternalEventMapping.query.filter_by(event_id=removed.id)}
+    edited.title = 'Renamed'
+    db.session.delete(removed)
+    db.session.commit()
+    assert ExternalEventMapping.query.filter_by(event_id=removed.id).count() == 0
+    assert push_changes() == 2
+    assert [sorted(method for method, _, _ in call) for call in FakeCalendars.google_calls[1:]] == [['DELETE', 'PATCH']]
+    assert [sorted(method for method, _, _ in call) for call in FakeCalendars.graph_calls[3:]] == [['DELETE', 'PATCH']]
+    assert not removed_ids & (set(FakeCalendars.google_events) | set(FakeCalendars.graph_events))
+    google_copy = ExternalEventMapping.query.filter_by(event_id=edited.id, external_account_id=google.id).one()
+    assert FakeCalendars.google_events[google_copy.provider_event_id]['summary'] == 'Renamed'
+    assert google_copy.etag == '"2"'
+
+    # saving an event without changing it queues a row but pushes nothing
+    edited.title = 'Renamed again'
+    db.session.commit()
+    edited.title = 'Renamed'
+    db.session.commit()
+    assert push_changes() == 1
+    assert len(FakeCalendars.google_calls) == 2 and len(FakeCalendars.graph_calls) == 4
+
+
+def test_rate_limited_batch_is_retried_after_retry_after(push_app, make_linked_user, numbered_event):
+    u = make_linked_user('throttled', ['google', 'outlook'])
+    ev = numbered_event(u, 1)
+    db.session.commit()
+    FakeCalendars.graph_throttle = True
+
+    before = datetime.utcnow()
+    assert push_changes() == 1
+    row = ExternalChange.query.one()
+    assert (row.status, row.attempts) == ('pending', 1)
+    assert row.next_attempt_at >= before + timedelta(seconds=120)
+    assert '429' in row.last_error
+    # the Google copy was recorded, so the retry only has Outlook left to do
+    assert [m.provider for m in ExternalEventMapping.query.filter_by(event_id=ev.id)] == ['google']
+
+    FakeCalendars.graph_throttle = False
+    assert push_changes(now=row.next_attempt_at) == 1
+    assert ExternalChange.query.count() == 0
+    assert sorted(m.provider for m in ExternalEventMapping.query.filter_by(event_id=ev.id)) == ['google', 'outlook']
+    assert len(FakeCalendars.google_calls) == 1
+
+
+def test_update_of_a_copy_deleted_upstream_creates_it_again(push_app, make_linked_user, numbered_event):
+    u = make_linked_user('gone', ['google'])
+    ev = numbered_event(u, 1)
+    db.session.commit()
+    push_changes()
+    FakeCalendars.google_events.clear()
+
+    ev.title = 'Changed'
+    db.session.commit()
+    push_changes()
+    assert ExternalChange.query.count() == 0
+    # the 404'd update was followed by an insert in the same run
+    assert [[method for method, _, _ in call] for call in FakeCalendars.google_calls[1:]] == [['PATCH'], ['POST']]
+    db.session.expire_all()
+    copy = ExternalEventMapping.query.filter_by(event_id=ev.id).one()
+    assert FakeCalendars.google_events[copy.provider_event_id]['summary'] == 'Changed'
+    assert copy.etag == '"1"'
+
+
+def test_copy_created_for_an_event_deleted_in_flight_is_removed(push_app, make_linked_user, numbered_event):
+    import dataclasses
+
+    from schedule_app.app.integrations import registry
+
+    u = make_linked_user('racer', ['google'])
+    ev = numbered_event(u, 1)
+    db.session.commit()
+    google = registry.get_provider('google')
+
+    def push_then_delete(account, ops):
+        results = google.push_changes(account, ops)
+        # the user deletes the event while the batch is in flight
+        db.session.delete(db.session.get(Event, ev.id))
+        db.session.commit()
+        return results
+
+    registry.register_provider(dataclasses.replace(google, push_changes=push_then_delete))
+    assert push_changes() == 1
+    assert ExternalEventMapping.query.count() == 0
+    [row] = ExternalChange.query.all()
+    assert row.operation == 'delete' and [t['provider_event_id'] for t in json.loads(row.targets)] == list(FakeCalendars.google_events)
+
+    registry.register_provider(google)
+    assert push_changes() == 1
+    assert ExternalChange.query.count() == 0
+    assert FakeCalendars.google_events == {}
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from schedule_app.app import db
+from schedule_app.app.models import EmailOutbox
+from schedule_app.app.outbox import enqueue_email, drain_outbox
+
+
+def test_identical_messages_are_coalesced(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr('schedule_app.app.auth.routes.send_email', lambda s, r, b, html=None: calls.append(r) or True)
+    enqueue_email('subject', 'a@example.com', 'body')
+    enqueue_email('subject', 'a@example.com', 'body')
+    enqueue_email('subject', 'b@example.com', 'body')
+    db.session.commit()
+
+    assert drain_outbox() == 3
+    assert sorted(calls) == ['a@example.com', 'b@example.com']
+    assert {r.status for r in EmailOutbox.query.all()} == {'sent'}
+
+
+def test_messages_of_one_kind_coalesce_to_the_newest(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr('schedule_app.app.auth.routes.send_email', lambda s, r, b, html=None: calls.append((r, b)) or True)
+    # each resend carries a new token, so the bodies differ
+    enqueue_email('confirm', 'a@example.com', 'link token-1', kind='confirm_email')
+    enqueue_email('confirm', 'A@example.com', 'link token-2', kind='confirm_email')
+    enqueue_email('reset', 'a@example.com', 'link token-3', kind='password_reset')
+    enqueue_email('confirm', 'b@example.com', 'link token-4', kind='confirm_email')
+    db.session.commit()
+
+    assert drain_outbox() == 4
+    assert sorted(calls) == [('A@example.com', 'link token-2'), ('a@example.com', 'link token-3'), ('b@example.com', 'link token-4')]
+    assert {r.status for r in EmailOutbox.query.all()} == {'sent'}
+
+
+def test_failures_back_off_then_dead_letter(app, monkeypatch):
+    app.config['EMAIL_OUTBOX_MAX_ATTEMPTS'] = 2
+    app.config['EMAIL_OUTBOX_BACKOFF_BASE'] = 60
+    monkeypatch.setattr('schedule_app.app.auth.routes.send_email', lambda s, r, b, html=None: False)
+    row = enqueue_email('subject', 'fail@example.com', 'body')
+    db.session.commit()
+
+    now = datetime.utcnow()
+    assert drain_outbox(now=now) == 1
+    row = db.session.get(EmailOutbox, row.id)
+    assert row.status == 'pending' and row.attempts == 1
+    assert row.next_attempt_at >= now + timedelta(seconds=60)
+    # not due yet: nothing is claimed
+    assert drain_outbox(now=now + timedelta(seconds=30)) == 0
+
+    assert drain_outbox(now=now + timedelta(seconds=61)) == 1
+    row = db.session.get(EmailOutbox, row.id)
+    assert row.status == 'dead' and row.attempts == 2
+    assert drain_outbox(now=now + timedelta(days=1)) == 0
+
+
+def test_register_queues_confirmation(client, app):
+    rv = client.post('/register', data={
+        'username': 'outboxuser', 'email': 'outbox@example.com', 'password': 'secret123'
+    }, follow_redirects=True)
+    assert rv.status_code == 200
+    row = EmailOutbox.query.filter_by(recipient='outbox@example.com').one()
+    assert row.status == 'pending'
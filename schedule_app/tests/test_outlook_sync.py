@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from schedule_app.app import db
+from schedule_app.app.integrations import outlook
+from schedule_app.app.models import Event, ExternalAccount, ExternalEventMapping
+from schedule_app.app.utils import http_client
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = str(payload)
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+@pytest.fixture
+def create_account(make_user):
+    def create():
+        u = make_user('osync')
+        acc = ExternalAccount(user_id=u.id, provider='outlook', access_token=encrypt_value('tok'))
+        db.session.add(acc)
+        db.session.commit()
+        return acc
+
+    return create
+
+
+def item(event_id, subject, hour):
+    return {
+        'id': event_id,
+        'subject': subject,
+        'location': {'displayName': 'Room 1'},
+        'start': {'dateTime': f'2030-01-01T{hour:02d}:00:00.0000000', 'timeZone': 'UTC'},
+        'end': {'dateTime': f'2030-01-01T{hour + 1:02d}:00:00.0000000', 'timeZone': 'UTC'},
+    }
+
+
+def test_delta_round_applies_adds_updates_and_removals(app, monkeypatch, create_account):
+    acc = create_account()
+    calls = []
+
+    def fake_get(url, headers, params, timeout):
+        calls.append(url)
+        if url == outlook.GRAPH_URL + '/me/calendarView/delta':
+            return FakeResponse(200, {'value': [item('x', 'X', 9), item('y', 'Y', 10)], '@odata.deltaLink': 'https://graph/delta?t=1'})
+        assert url == 'https://graph/delta?t=1' and params is None
+        return FakeResponse(200, {
+            'value': [item('x', 'X moved', 11), {'id': 'y', '@removed': {'reason': 'deleted'}}, item('z', 'Z', 12)],
+            '@odata.deltaLink': 'https://graph/delta?t=2',
+        })
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    assert outlook.import_events_for_account(acc) == 2
+    assert acc.delta_link == 'https://graph/delta?t=1'
+    assert outlook.import_events_for_account(acc) == 3
+    assert acc.delta_link == 'https://graph/delta?t=2'
+    events = {e.title: e for e in Event.query.all()}
+    assert sorted(events) == ['X moved', 'Z']
+    assert events['X moved'].start_at == datetime(2030, 1, 1, 11) and events['Z'].location == 'Room 1'
+    assert ExternalEventMapping.query.count() == 2
+
+
+def test_expired_delta_link_restarts_round(app, monkeypatch, create_account):
+    acc = create_account()
+    acc.delta_link = 'https://graph/delta?t=old'
+    acc.delta_window_end = datetime.utcnow() + timedelta(days=300)
+    db.session.commit()
+    old = Event(user_id=acc.user_id, title='Removed upstream', start_at=datetime(2030, 1, 2), end_at=datetime(2030, 1, 2, 1))
+    db.session.add(old)
+    db.session.flush()
+    db.session.add(ExternalEventMapping(provider='outlook', provider_event_id='gone', external_account_id=acc.id, event_id=old.id))
+    db.session.commit()
+
+    def fake_get(url, headers, params, timeout):
+        if url == 'https://graph/delta?t=old':
+            return FakeResponse(410, {'error': {'code': 'SyncStateNotFound'}})
+        return FakeResponse(200, {'value': [item('n', 'New', 9)], '@odata.deltaLink': 'https://graph/delta?t=new'})
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    assert outlook.import_events_for_account(acc, since=datetime(2030, 1, 1)) == 2
+    assert acc.delta_link == 'https://graph/delta?t=new'
+    assert [e.title for e in Event.query.all()] == ['New']
+
+
+def test_delta_round_is_rebaselined_before_its_window_ends(app, monkeypatch, create_account):
+    acc = create_account()
+    acc.delta_link = 'https://graph/delta?t=old'
+    acc.delta_window_end = datetime.utcnow() + timedelta(days=10)
+    db.session.commit()
+    calls = []
+
+    def fake_get(url, headers, params, timeout):
+        calls.append((url, params))
+        return FakeResponse(200, {'value': [item('n', 'Next year', 9)], '@odata.deltaLink': 'https://graph/delta?t=new'})
+
+    monkeypatch.setattr(http_client, 'get', fake_get)
+    before = datetime.utcnow()
+    assert outlook.import_events_for_account(acc) == 1
+    # the old link is not followed: a full round opens a window a year ahead
+    assert [url for url, _ in calls] == [outlook.GRAPH_URL + '/me/calendarView/delta']
+    end = datetime.fromisoformat(calls[0][1]['endDateTime'].rstrip('Z'))
+    assert end >= before + timedelta(days=outlook.SYNC_LOOKAHEAD_DAYS)
+    assert acc.delta_link == 'https://graph/delta?t=new' and acc.delta_window_end == end
+
+    # with the new window far away, the next sync follows the delta link again
+    calls.clear()
+    outlook.import_events_for_account(acc)
+    assert [url for url, _ in calls] == ['https://graph/delta?t=new']
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from schedule_app.app import db
+from schedule_app.app.models import Lease
+from schedule_app.app.utils.pg_lock import LeaseLock, LeaseLost, current_lease, lease_lock, single_instance
+
+
+def test_lease_lock_excludes_second_holder(app):
+    with lease_lock('cleanup', ttl=30) as first:
+        assert first and first.token == 1
+        assert current_lease() is first
+        with lease_lock('cleanup', ttl=30) as second:
+            assert not second and second.token is None
+    assert current_lease() is None
+    # released on exit: the next run gets the lease with a new fencing token
+    with lease_lock('cleanup', ttl=30) as again:
+        assert again.token == 2
+
+
+def test_fencing_token_rejects_stale_holder(app):
+    now = datetime.utcnow()
+    with lease_lock('purge', ttl=0.2, heartbeat=60) as stale:
+        assert stale
+        # the holder stalls past its TTL and another worker takes over
+        other = LeaseLock('job:purge', ttl=30, holder='other')
+        assert other.acquire(now + timedelta(seconds=5)) is True
+        assert other.token == stale.token + 1
+        with pytest.raises(LeaseLost):
+            stale.assert_held()
+    row = db.session.get(Lease, 'job:purge')
+    # the stale holder's release must not touch the new holder's lease
+    assert row.holder == 'other' and row.expires_at > now
+
+
+def test_heartbeat_keeps_lease_alive(app):
+    with lease_lock('long', ttl=0.3, heartbeat=0.05) as lease:
+        time.sleep(0.6)
+        assert not lease.lost.is_set()
+        lease.assert_held()
+        assert LeaseLock('job:long', ttl=30, holder='other').acquire() is False
+
+
+def test_single_instance_skips_while_leased(app):
+    app.config['JOB_LOCK_BACKEND'] = 'lease'
+    calls = []
+
+    @single_instance('report')
+    def report():
+        calls.append(1)
+        return 'done'
+
+    with lease_lock('report', ttl=30):
+        assert report() is None
+    assert report() == 'done'
+    assert calls == [1]
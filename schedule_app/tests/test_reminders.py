@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+
+from schedule_app.app import db
+from schedule_app.app.models import EventParticipant, Notification
+from schedule_app.app.reminders import generate_reminders, replace_event_reminders, extend_reminder_horizon
+
+
+def test_single_event_uses_event_then_user_offsets(app, make_user, make_event):
+    user = make_user('reminder', default_reminder_offsets='5')
+    start = datetime(2030, 1, 1, 9, 0)
+    ev = make_event(user, start, commit=False, reminder_offsets='10,60')
+    other = make_event(user, start + timedelta(days=1), commit=False)
+    assert generate_reminders(ev) == 2
+    assert generate_reminders(other) == 1
+    db.session.commit()
+    assert sorted(n.scheduled_at for n in Notification.query.filter_by(event_id=ev.id)) == [
+        start - timedelta(minutes=60), start - timedelta(minutes=10)]
+    assert [n.scheduled_at for n in Notification.query.filter_by(event_id=other.id)] == [
+        start + timedelta(days=1) - timedelta(minutes=5)]
+
+
+def test_replace_after_time_change(app, make_user, make_event):
+    user = make_user('reminder')
+    ev = make_event(user, datetime(2030, 1, 1, 9, 0), commit=False, reminder_offsets='10')
+    generate_reminders(ev)
+    db.session.commit()
+    ev.start_at = datetime(2030, 1, 2, 9, 0)
+    replace_event_reminders(ev)
+    db.session.commit()
+    rows = Notification.query.filter_by(event_id=ev.id).all()
+    assert [n.scheduled_at for n in rows] == [datetime(2030, 1, 2, 8, 50)]
+
+
+def test_recurring_series_is_bounded_by_horizon(app, make_user, make_event):
+    app.config['REMINDER_HORIZON_DAYS'] = 14
+    user = make_user('reminder')
+    now = datetime(2030, 1, 1, 0, 0)
+    ev = make_event(user, datetime(2030, 1, 1, 9, 0), commit=False, rrule='FREQ=DAILY', timezone='UTC', reminder_offsets='10')
+    assert generate_reminders(ev, now=now) == 14
+    db.session.commit()
+    assert ev.reminders_generated_until == now + timedelta(days=14)
+
+    # a day later the job adds exactly the newly uncovered occurrence
+    assert extend_reminder_horizon(now=now + timedelta(days=1)) == 1
+    assert Notification.query.filter_by(event_id=ev.id).count() == 15
+    assert extend_reminder_horizon(now=now + timedelta(days=1)) == 0
+
+
+def _login(client, user):
+    client.post('/login', data={'username': user.username, 'password': 'pw123'}, follow_redirects=True)
+    return user
+
+
+def test_api_created_event_gets_reminders(app, client, make_user):
+    user = _login(client, make_user('apiuser'))
+    resp = client.post('/api/v1/events', json={
+        'title': 'Review', 'start_at': '2030-01-01T09:00:00+09:00', 'end_at': '2030-01-01T10:00:00+09:00', 'color': '#123456',
+    })
+    assert resp.status_code == 201
+    rows = Notification.query.filter_by(event_id=resp.get_json()['id']).all()
+    # stored as naive UTC, default offset 10 minutes
+    assert [(n.user_id, n.scheduled_at) for n in rows] == [(user.id, datetime(2030, 1, 1, 0, 0) - timedelta(minutes=10))]
+
+
+def test_participant_gets_reminders_when_accepting_later(app, client, make_user, make_event):
+    owner = make_user('reminder')
+    start = datetime(2030, 1, 1, 9, 0)
+    ev = make_event(owner, start, commit=False, reminder_offsets='10,60')
+    generate_reminders(ev)
+    db.session.commit()
+    guest = _login(client, make_user('guest'))
+    p = EventParticipant(event_id=ev.id, email='guest@example.com', status='pending')
+    db.session.add(p)
+    db.session.commit()
+
+    url = f'/events/{ev.id}/participants/{p.id}/respond'
+    assert client.post(url, data={'action': 'accept'}).get_json()['status'] == 'accepted'
+    assert sorted(n.scheduled_at for n in Notification.query.filter_by(event_id=ev.id, user_id=guest.id)) == [
+        start - timedelta(minutes=60), start - timedelta(minutes=10)]
+    # accepting again does not duplicate; declining drops the pending rows
+    client.post(url, data={'action': 'accept'})
+    assert Notification.query.filter_by(event_id=ev.id, user_id=guest.id).count() == 2
+    client.post(url, data={'action': 'decline'})
+    assert Notification.query.filter_by(event_id=ev.id, user_id=guest.id).count() == 0
+    assert Notification.query.filter_by(event_id=ev.id, user_id=owner.id).count() == 2
+
+
+def test_accepted_invite_link_creates_reminders_for_series(app, client, make_user, make_event):
+    from itsdangerous import URLSafeTimedSerializer
+
+    owner = make_user('reminder')
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(hours=1)
+    ev = make_event(owner, start, commit=False, rrule='FREQ=DAILY', reminder_offsets='10')
+    generate_reminders(ev)
+    db.session.commit()
+    owner_rows = Notification.query.filter_by(event_id=ev.id, user_id=owner.id).count()
+    guest = _login(client, make_user('guest2'))
+    p = EventParticipant(event_id=ev.id, email='guest2@example.com', status='pending')
+    db.session.add(p)
+    db.session.commit()
+
+    serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+    token = serializer.dumps({'participant_id': p.id, 'event_id': ev.id}, salt=app.config.get('SECURITY_PASSWORD_SALT'))
+    client.get(f'/events/invite/accept/{token}')
+    assert db.session.get(EventParticipant, p.id).status == 'accepted'
+    assert owner_rows > 1
+    assert Notification.query.filter_by(event_id=ev.id, user_id=guest.id).count() == owner_rows
+
+
+def test_participant_default_offsets_drive_their_rows(app, client, make_user, make_event):
+    owner = make_user('reminder', default_reminder_offsets='60')
+    start = datetime(2030, 1, 1, 9, 0)
+    ev = make_event(owner, start, commit=False)
+    generate_reminders(ev)
+    db.session.commit()
+    guest = _login(client, make_user('guest3'))
+    resp = client.put('/api/v1/me/reminder-offsets', json={'offsets': [30, 5, 30]})
+    assert resp.get_json() == {'offsets': [5, 30]}
+    assert client.get('/api/v1/me/reminder-offsets').get_json() == {'offsets': [5, 30]}
+    assert client.put('/api/v1/me/reminder-offsets', json={'offsets': 'soon'}).status_code == 400
+    p = EventParticipant(event_id=ev.id, email='guest3@example.com', status='pending')
+    db.session.add(p)
+    db.session.commit()
+
+    client.post(f'/events/{ev.id}/participants/{p.id}/respond', data={'action': 'accept'})
+
+    def times(user):
+        return sorted(n.scheduled_at for n in Notification.query.filter_by(event_id=ev.id, user_id=user.id))
+    assert times(owner) == [start - timedelta(minutes=60)]
+    assert times(guest) == [start - timedelta(minutes=30), start - timedelta(minutes=5)]
+    # the event's own offsets still win for everyone
+    ev.reminder_offsets = '15'
+    replace_event_reminders(ev)
+    db.session.commit()
+    assert times(owner) == times(guest) == [start - timedelta(minutes=15)]
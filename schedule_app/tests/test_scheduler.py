@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+
+from schedule_app.app import db
+from schedule_app.app import jobs
+from schedule_app.app.models import Notification
+from schedule_app.app.scheduler import ReminderDispatcher, TimingWheel, _epoch
+from schedule_app.app.reminders import generate_reminders
+
+
+def test_timing_wheel_fires_at_exact_tick():
+    wheel = TimingWheel(tick=1.0, wheel_sizes=(10, 10, 10), start=1000)
+    wheel.add('a', 1003)
+    wheel.add('b', 1003.5)  # rounded up: never fires early
+    wheel.add('c', 1000 + 57)  # level 1, cascades down
+    wheel.add('d', 1000 + 734)  # level 2
+    assert wheel.advance(1002) == []
+    assert wheel.advance(1003) == ['a']
+    assert wheel.advance(1003.9) == []
+    assert wheel.advance(1004) == ['b']
+    assert wheel.advance(1056) == []
+    assert wheel.advance(1057) == ['c']
+    assert wheel.advance(1733) == []
+    assert wheel.advance(1734) == ['d']
+    assert len(wheel) == 0
+
+
+def test_timing_wheel_overflow_remove_and_overdue():
+    wheel = TimingWheel(tick=1.0, wheel_sizes=(4, 4), start=0)
+    wheel.add('far', 40)  # beyond the 16-tick span
+    wheel.add('gone', 5)
+    wheel.add('late', -3)
+    assert wheel.remove('gone') is True
+    assert wheel.remove('gone') is False
+    assert wheel.advance(0) == ['late']
+    wheel.add('moved', 6)
+    wheel.add('moved', 9)
+    assert wheel.advance(8) == []
+    assert wheel.advance(9) == ['moved']
+    assert wheel.advance(39) == []
+    assert wheel.advance(45) == ['far']
+
+
+def test_dispatcher_sends_when_reminder_comes_due(app, monkeypatch, make_user, make_event):
+    sent = []
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: sent.append(recipient) or True)
+    now = datetime.utcnow().replace(microsecond=0)
+    user = make_user('wheel')
+    dispatcher = ReminderDispatcher(app, TimingWheel(tick=1.0, start=_epoch(now)))
+    dispatcher.refill(now)
+    app.config['DEFAULT_REMINDER_OFFSETS'] = '5'
+    # created after the refill: reaches the wheel through the change signal
+    ev = make_event(user, now + timedelta(minutes=5, seconds=3))
+    from schedule_app.app import reminders
+    reminders.subscribe_reminder_changes(dispatcher.notify_changed)
+    try:
+        generate_reminders(ev, now=now)
+        db.session.commit()
+    finally:
+        reminders.unsubscribe_reminder_changes(dispatcher.notify_changed)
+    [nid] = [n.id for n in Notification.query.filter_by(event_id=ev.id)]
+
+    assert dispatcher.tick(now + timedelta(seconds=2)) == 0
+    assert nid in dispatcher.wheel
+    assert dispatcher.tick(now + timedelta(seconds=3)) == 1
+    assert sent == [user.email]
+    assert db.session.get(Notification, nid).status == 'sent'
+
+
+def test_job_dispatch_reuses_one_app(app, monkeypatch):
+    from schedule_app.app import scheduler
+
+    created = []
+
+    def fake_create_app():
+        created.append(1)
+        return app
+
+    monkeypatch.setattr(scheduler, 'create_app', fake_create_app)
+    monkeypatch.setattr(scheduler, '_app', None)
+    for _ in range(3):
+        assert scheduler.run_job_in_app_context('os', 'getpid') > 0
+    assert len(created) == 1
+    assert scheduler.get_app() is app
+    monkeypatch.setattr(scheduler, '_app', None)
+
+
+def test_register_jobs_passes_triggers_and_options(app):
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from schedule_app.app.scheduler import job_trigger_kwargs, register_jobs
+
+    assert job_trigger_kwargs({'schedule': 'interval'}) == {'minutes': 15}
+    assert job_trigger_kwargs({'schedule': 'date', 'run_date': '2030-01-01', 'hour': 3}) == {'run_date': '2030-01-01'}
+    assert job_trigger_kwargs({'schedule': 'calendar'}) is None
+
+    sched = BackgroundScheduler()
+    register_jobs(sched, app)
+    cleanup = sched.get_job('cleanup_old_events')
+    assert isinstance(cleanup.trigger, CronTrigger)
+    assert cleanup.trigger.jitter == 900
+    assert cleanup.coalesce is True and cleanup.misfire_grace_time == 3600
+    assert str(cleanup.trigger.fields[5]) == '3'  # hour
+    assert sched.get_job('drain_email_outbox') is not None
+
+
+def test_leader_election_single_leader_and_takeover(app):
+    from schedule_app.app.scheduler import LeaderElector
+
+    now = datetime(2030, 1, 1, 12, 0, 0)
+    a = LeaderElector('scheduler-leader', ttl=15, holder='a')
+    b = LeaderElector('scheduler-leader', ttl=15, holder='b')
+    assert a.try_acquire(now) is True and a.token == 1
+    assert b.try_acquire(now + timedelta(seconds=5)) is False
+    assert a.try_acquire(now + timedelta(seconds=10)) is True  # heartbeat renews
+    assert b.try_acquire(now + timedelta(seconds=20)) is False
+
+    # leader stops heartbeating: the standby takes over once the TTL has passed
+    assert b.try_acquire(now + timedelta(seconds=26)) is True and b.token == 2
+    assert a.renew(now + timedelta(seconds=27)) is False and not a.is_leader
+
+    b.release()
+    assert a.try_acquire(datetime.utcnow()) is True and a.token == 3
+
+
+def test_dispatcher_pages_through_an_overdue_backlog(app, monkeypatch, make_user, make_event):
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: True)
+    app.config['REMINDER_WHEEL_OVERDUE_BATCH'] = 2
+    now = datetime.utcnow().replace(microsecond=0)
+    user = make_user('wheel')
+    ev = make_event(user, now + timedelta(hours=1))
+    # five reminders missed during an outage, one still ahead
+    for minutes in (-50, -40, -30, -20, -10, 3):
+        db.session.add(Notification(event_id=ev.id, user_id=user.id, scheduled_at=now + timedelta(minutes=minutes)))
+    db.session.commit()
+    dispatcher = ReminderDispatcher(app, TimingWheel(tick=1.0, start=_epoch(now)))
+
+    assert dispatcher.refill(now) == 3  # the two oldest overdue rows and the upcoming one
+    assert len(dispatcher.wheel) == 3
+    assert dispatcher.tick(now) == 2
+    assert dispatcher.tick(now + timedelta(seconds=1)) == 2
+    assert dispatcher.tick(now + timedelta(seconds=2)) == 1
+    assert dispatcher.tick(now + timedelta(seconds=3)) == 0
+    pending = Notification.query.filter_by(status='pending').all()
+    assert [n.scheduled_at for n in pending] == [now + timedelta(minutes=3)]
+    assert pending[0].id in dispatcher.wheel
+
+
+def test_dispatcher_retries_claims_stranded_by_a_crashed_worker(app, monkeypatch, make_user, make_event):
+    sent = []
+    monkeypatch.setattr(jobs, 'send_email', lambda subject, recipient, body, html=None: sent.append(recipient) or True)
+    now = datetime.utcnow().replace(microsecond=0)
+    user = make_user('wheel')
+    ev = make_event(user, now + timedelta(hours=1))
+    db.session.add(Notification(event_id=ev.id, user_id=user.id, scheduled_at=now - timedelta(minutes=5)))
+    db.session.commit()
+    [claimed] = jobs.claim_due_notifications(worker_id='crashed', now=now - timedelta(minutes=5))
+    dispatcher = ReminderDispatcher(app, TimingWheel(tick=1.0, start=_epoch(now)))
+
+    # still leased: not ours to send
+    assert dispatcher.refill(now - timedelta(minutes=4)) == 0
+    lease = app.config.get('NOTIFICATION_LEASE_SECONDS', 300)
+    later = now + timedelta(seconds=lease)
+    dispatcher = ReminderDispatcher(app, TimingWheel(tick=1.0, start=_epoch(later)))
+    assert dispatcher.refill(later) == 1
+    assert dispatcher.tick(later) == 1
+    assert sent == [user.email]
+    assert db.session.get(Notification, claimed.id).status == 'sent'
+
+
+def test_timing_wheel_ready_keys_keep_order_and_can_be_removed():
+    wheel = TimingWheel(tick=1.0, wheel_sizes=(4, 4), start=10)
+    for key in range(5):
+        wheel.add(key, 10 - key)
+    assert 3 in wheel and len(wheel) == 5
+    assert wheel.remove(3) is True
+    wheel.add(1, 9)  # re-adding moves it to the back
+    assert wheel.advance(10) == [0, 2, 4, 1]
+    assert len(wheel) == 0
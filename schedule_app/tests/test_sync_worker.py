@@ -0,0 +1,179 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from schedule_app.app import create_app, db
+from schedule_app.app.integrations.worker import SyncWorker
+from schedule_app.app.models import Event, ExternalAccount, IntegrationLog
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+class FakeGoogle(BaseHTTPRequestHandler):
+    """Just enough of the Calendar events.list API: one event per account token."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    rate_limited = set()
+    requests = []
+
+    def do_GET(self):
+        cls = type(self)
+        token = self.headers['Authorization'].split()[-1]
+        with cls.lock:
+            cls.requests.append(token)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(0.05)
+            if token == 'tok-1' and token not in cls.rate_limited:
+                cls.rate_limited.add(token)
+                self._send(429, {'error': {'code': 429}}, {'Retry-After': '7'})
+                return
+            query = parse_qs(urlparse(self.path).query)
+            assert urlparse(self.path).path == '/calendar/v3/calendars/primary/events'
+            assert 'timeMin' in query
+            n = token.split('-')[1]
+            self._send(200, {
+                'items': [{'id': f'ev-{n}', 'etag': '"1"', 'summary': f'Event {n}',
+                           'start': {'dateTime': '2030-01-01T09:00:00Z'}, 'end': {'dateTime': '2030-01-01T10:00:00Z'}}],
+                'nextSyncToken': f'sync-{n}',
+            })
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_google():
+    FakeGoogle.in_flight = FakeGoogle.max_in_flight = 0
+    FakeGoogle.rate_limited, FakeGoogle.requests = set(), []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogle)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/calendar/v3'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def file_app(tmp_path, fake_google):
+    # worker threads each use their own connection, so use a file database
+    config = type('SyncConfig', (), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'sync.db'}",
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret',
+        'GOOGLE_CALENDAR_API_URL': fake_google,
+        'SYNC_WORKER_CONCURRENCY': 2,
+    })
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_worker_syncs_accounts_concurrently_and_honours_retry_after(file_app, make_user):
+    u = make_user('worker')
+    for n in range(1, 6):
+        db.session.add(ExternalAccount(user_id=u.id, provider='google', access_token=encrypt_value(f'tok-{n}')))
+    db.session.add(ExternalAccount(user_id=u.id, provider='caldav'))
+    db.session.commit()
+
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    outcomes = asyncio.run(SyncWorker(file_app, sleep=fake_sleep).run())
+
+    by_account = {o.account_id: o for o in outcomes}
+    assert by_account[6].status == 'skipped'  # no importer for the provider
+    assert [by_account[i].status for i in range(1, 6)] == ['ok'] * 5
+    assert by_account[1].attempts == 2 and by_account[2].attempts == 1
+    # the 429's Retry-After held back the provider before the retry
+    assert slept and 6 < max(slept) <= 7
+    assert FakeGoogle.max_in_flight <= 2
+    assert FakeGoogle.requests.count('tok-1') == 2
+
+    db.session.expire_all()
+    assert Event.query.count() == 5
+    assert sorted(a.sync_token for a in ExternalAccount.query.filter_by(provider='google')) == [f'sync-{n}' for n in range(1, 6)]
+    assert IntegrationLog.query.filter_by(level='info').count() == 5
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    from datetime import datetime, timezone
+
+    from schedule_app.app.integrations.paging import parse_retry_after
+
+    now = datetime(2030, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('Tue, 01 Jan 2030 12:00:30 GMT', now=now) == 30
+    assert parse_retry_after('Tue, 01 Jan 2030 11:00:00 GMT', now=now) == 0
+    assert parse_retry_after('soon') is None and parse_retry_after(None) is None
+
+
+def test_syncs_queued_on_the_provider_limit_wait_out_the_cooldown(file_app, make_user):
+    u = make_user('queued')
+    for n in range(1, 4):
+        db.session.add(ExternalAccount(user_id=u.id, provider='google', access_token=encrypt_value(f'tok-{n}')))
+    db.session.commit()
+
+    # requests already made when each sleep started
+    slept_after = []
+
+    async def fake_sleep(seconds):
+        slept_after.append(len(FakeGoogle.requests))
+
+    outcomes = asyncio.run(SyncWorker(file_app, concurrency=1, sleep=fake_sleep).run())
+    assert [o.status for o in outcomes] == ['ok'] * 3
+    # tok-1 was rate limited first; every later request waited for its Retry-After
+    assert FakeGoogle.requests[0] == 'tok-1'
+    assert sorted(slept_after) == [1, 2, 3]
+
+
+def test_manual_sync_is_queued_for_the_worker(file_app, make_user):
+    from schedule_app.app import jobs
+
+    u = make_user('manual')
+    acc = ExternalAccount(user_id=u.id, provider='google', access_token=encrypt_value('tok-2'))
+    db.session.add(acc)
+    db.session.commit()
+    account_id = acc.id
+    client = file_app.test_client()
+    client.post('/login', data={'username': 'manual', 'password': 'pw123'}, follow_redirects=True)
+
+    resp = client.post(f'/integrations/accounts/{account_id}/sync')
+    assert resp.status_code == 202 and resp.get_json()['queued'] is True
+    # nothing was fetched in the request
+    assert FakeGoogle.requests == []
+    db.session.expire_all()
+    assert db.session.get(ExternalAccount, account_id).sync_requested_at is not None
+
+    assert jobs.sync_requested_accounts() == 1
+    assert FakeGoogle.requests == ['tok-2']
+    db.session.expire_all()
+    assert db.session.get(ExternalAccount, account_id).sync_requested_at is None
+    assert jobs.sync_requested_accounts() == 0
+    assert FakeGoogle.requests == ['tok-2']
@@ -0,0 +1,63 @@
+import threading
+
+from schedule_app.app.tasks.__main__ import _runner
+
+
+class RecordingEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return self.is_set()
+
+
+def test_loop_shortens_sleep_on_backlog_and_stops(app):
+    stop = RecordingEvent()
+    results = iter([50, 50, 50, 0, 7])
+
+    def fake_job():
+        value = next(results)
+        if value == 7:
+            stop.set()
+        return value
+
+    _runner._run_loop(app, [('drain_email_outbox', fake_job)], interval=8, min_interval=1, stop=stop)
+    assert stop.waits == [4, 2, 1, 8, 4]
+
+
+def test_resolve_jobs_by_name_and_id(app):
+    jobs = _runner._resolve_jobs(['run_due_jobs', 'cleanup_old_events', 'rollup_job_runs'])
+    assert [name for name, _ in jobs] == ['run_due_jobs', 'cleanup_old_events', 'rollup_job_runs']
+    assert _runner.build_parser().parse_args(['run', '--loop', '--interval', '5']).interval == 5
+
+
+def test_failing_job_is_not_rerun_without_the_lock(app):
+    app.config['JOB_LOCK_BACKEND'] = 'lease'
+    from schedule_app.app.utils.pg_lock import LeaseLost, current_lease
+
+    calls = []
+
+    def job():
+        calls.append(bool(current_lease()))
+        raise LeaseLost('taken over')
+
+    assert _runner._run_tracked('cleanup_old_events', job) == 0
+    assert calls == [True]
+
+
+def test_job_runs_unlocked_only_when_the_lock_cannot_be_taken(app, monkeypatch):
+    from contextlib import contextmanager
+
+    from schedule_app.app.utils import pg_lock
+
+    @contextmanager
+    def broken_lock(job_id):
+        raise RuntimeError('advisory locks need Postgres')
+        yield
+
+    monkeypatch.setattr(pg_lock, 'job_lock', broken_lock)
+    calls = []
+    assert _runner._run_tracked('cleanup_old_events', lambda: calls.append(1) or 3) == 3
+    assert calls == [1]
@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from schedule_app.app import create_app, db
+from schedule_app.app.integrations import registry, tokens
+from schedule_app.app.models import ExternalAccount
+from schedule_app.app.utils.crypto import encrypt_value
+
+
+@pytest.fixture
+def create_account(make_user):
+    def create(expires_at=None):
+        u = make_user('tokens')
+        acc = ExternalAccount(user_id=u.id, provider='google', access_token=encrypt_value('old'),
+                              refresh_token=encrypt_value('refresh'), expires_at=expires_at)
+        db.session.add(acc)
+        db.session.commit()
+        return acc
+
+    return create
+
+
+def test_access_token_is_decrypted_once_per_ciphertext(app, monkeypatch, create_account):
+    calls = []
+    real = tokens.decrypt_value
+    monkeypatch.setattr(tokens, 'decrypt_value', lambda value: calls.append(value) or real(value))
+    acc = create_account()
+    tokens.forget(acc.id)
+    assert tokens.access_token(acc) == 'old'
+    assert tokens.access_token(acc) == 'old'
+    assert len(calls) == 1
+    acc.access_token = encrypt_value('new')  # a refresh stores a new ciphertext
+    assert tokens.access_token(acc) == 'new'
+    assert len(calls) == 2
+    app.config['TOKEN_CACHE_SECONDS'] = 0
+    tokens.forget(acc.id)
+    tokens.access_token(acc)
+    tokens.access_token(acc)
+    assert len(calls) == 4
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # concurrent threads need their own connections, so use a file database
+    config = type('TokenConfig', (), {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'tokens.db'}",
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret',
+    })
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_concurrent_refreshes_are_single_flight(file_app, monkeypatch, create_account):
+    refreshes = []
+
+    def slow_refresh(account):
+        refreshes.append(account.id)
+        time.sleep(0.1)
+        account.access_token = encrypt_value('fresh')
+        account.expires_at = datetime.utcnow() + timedelta(hours=1)
+        db.session.commit()
+        return True
+
+    monkeypatch.setattr(registry, '_providers', {})
+    monkeypatch.setattr(registry, '_builtins_loaded', registry._builtins_loaded)
+    registry.register_provider(registry.Provider(name='google', refresh_access_token=slow_refresh))
+    acc = create_account(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    account_id = acc.id
+    results = []
+
+    def sync():
+        with file_app.app_context():
+            account = db.session.get(ExternalAccount, account_id)
+            results.append((tokens.ensure_fresh(account), tokens.access_token(account)))
+            db.session.remove()
+
+    threads = [threading.Thread(target=sync) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert refreshes == [account_id]
+    assert results == [(True, 'fresh')] * 4
+    # still valid: no refresh, no lock
+    assert tokens.ensure_fresh(db.session.get(ExternalAccount, account_id)) is True
+    assert len(refreshes) == 1
+
+
+def test_refresh_job_waits_for_a_running_ensure_fresh(file_app, monkeypatch, create_account):
+    from schedule_app.app import jobs
+
+    refreshes = []
+    started = threading.Event()
+
+    def slow_refresh(account):
+        refreshes.append(account.id)
+        started.set()
+        time.sleep(0.2)
+        account.access_token = encrypt_value('fresh')
+        account.expires_at = datetime.utcnow() + timedelta(hours=1)
+        db.session.commit()
+        return True
+
+    monkeypatch.setattr(registry, '_providers', {})
+    monkeypatch.setattr(registry, '_builtins_loaded', registry._builtins_loaded)
+    registry.register_provider(registry.Provider(name='google', refresh_access_token=slow_refresh))
+    acc = create_account(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    account_id = acc.id
+
+    def sync():
+        with file_app.app_context():
+            tokens.ensure_fresh(db.session.get(ExternalAccount, account_id))
+            db.session.remove()
+
+    thread = threading.Thread(target=sync)
+    thread.start()
+    started.wait(5)
+    assert jobs.refresh_external_accounts(0, 1) == 0
+    thread.join()
+    assert refreshes == [account_id]
+    # nothing holds the lock any more, so its entry is gone
+    assert account_id not in tokens._account_locks
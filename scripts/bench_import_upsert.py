@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Developer helper: measure calendar import throughput.
+
+Usage:
+  python scripts/bench_import_upsert.py --events 5000 --chunk 200
+
+Imports the same synthetic events twice into a fresh database: once the way
+the importers used to (a mapping query plus separate commits for the event and
+its mapping, per item), once through `integrations.pipeline.upsert_chunk`
+(one IN query, bulk INSERT/UPDATE, one commit per chunk). A second pipeline
+pass re-imports every event as an update. DATABASE_URL defaults to a
+temporary SQLite file so commits cost what they cost on disk.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def _records(count: int, prefix: str, title: str = "Imported"):
+    from schedule_app.app.integrations.pipeline import ImportedEvent
+
+    base = datetime(2030, 1, 1)
+    for i in range(count):
+        start = base + timedelta(minutes=30 * i)
+        yield ImportedEvent(
+            f"{prefix}{i}",
+            dict(title=f"{title} {i}", description=None, location=None, start_at=start, end_at=start + timedelta(minutes=30)),
+        )
+
+
+def _per_item(db, account, records) -> None:
+    from schedule_app.app.models import Event, ExternalEventMapping
+
+    for rec in records:
+        mapping = ExternalEventMapping.query.filter_by(provider="google", provider_event_id=rec.provider_event_id, external_account_id=account.id).first()
+        if not mapping:
+            ev = Event(user_id=account.user_id, **rec.fields)
+            db.session.add(ev)
+            db.session.commit()
+            db.session.add(ExternalEventMapping(provider="google", provider_event_id=rec.provider_event_id, external_account_id=account.id, event_id=ev.id, last_synced_at=datetime.utcnow()))
+            db.session.commit()
+
+
+def _report(label: str, count: int, seconds: float) -> None:
+    print(f"{label:<26} {count:>7} events  {seconds:8.3f} s  {count / seconds:10.1f} events/s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000, help="events per variant")
+    parser.add_argument("--chunk", type=int, default=200, help="pipeline chunk size")
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-import-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    try:
+        from schedule_app.app import create_app, db
+        from schedule_app.app.integrations.paging import chunked
+        from schedule_app.app.integrations.pipeline import upsert_chunk
+        from schedule_app.app.models import ExternalAccount, User
+    except Exception as e:
+        print("Error importing application factory:", e)
+        print("Run this script from repo root where package `schedule_app` is importable.")
+        return 1
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User()
+        user.username = "bench"
+        user.email = "bench@example.com"
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.commit()
+        account = ExternalAccount(user_id=user.id, provider="google")
+        db.session.add(account)
+        db.session.commit()
+
+        started = time.perf_counter()
+        _per_item(db, account, _records(args.events, "old-"))
+        _report("per item (old)", args.events, time.perf_counter() - started)
+
+        for label, title in (("pipeline insert", "Imported"), ("pipeline update", "Changed")):
+            started = time.perf_counter()
+            for chunk in chunked(_records(args.events, "new-", title), args.chunk):
+                upsert_chunk(account, "google", chunk)
+            _report(label, args.events, time.perf_counter() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
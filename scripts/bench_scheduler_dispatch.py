@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Developer helper: measure the per-job overhead of the scheduler dispatcher.
+
+Usage:
+  python scripts/bench_scheduler_dispatch.py --runs 200
+
+Compares the old behaviour (a fresh `create_app()` for every job execution)
+with `scheduler.run_job_in_app_context`, which reuses one app per process.
+The dispatched job is a no-op, so the numbers are pure dispatch overhead.
+DATABASE_URL defaults to an in-memory SQLite database.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+
+def _timed(fn, runs: int) -> list[float]:
+    out = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - started) * 1000)
+    return out
+
+
+def _report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} mean={statistics.mean(samples):8.3f} ms  p50={statistics.median(samples):8.3f} ms  p95={p95:8.3f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=100, help="job executions per variant")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    try:
+        from schedule_app.app import create_app
+        from schedule_app.app import scheduler
+    except Exception as e:
+        print("Error importing application factory:", e)
+        print("Run this script from repo root where package `schedule_app` is importable.")
+        return 1
+
+    def per_run_app():
+        app = create_app()
+        with app.app_context():
+            os.getpid()
+
+    def cached_app():
+        scheduler.run_job_in_app_context("os", "getpid")
+
+    scheduler.get_app()  # first creation is paid once per process, not per job
+    _report("create_app() per job", _timed(per_run_app, args.runs))
+    _report("cached app (get_app)", _timed(cached_app, args.runs))
+    scheduler.shutdown_app()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())